@@ -0,0 +1,137 @@
+"""
+Columnar analysis of the record history with NumPy.
+
+Requires numpy, which the rest of the calorie tracker does not depend on.
+"""
+
+import datetime
+import json
+import logging
+
+import numpy as np
+
+import db
+
+
+class RecordHistory():
+    """
+    The record entries of the ORM's user in a date range loaded into NumPy arrays,
+    with one element per entry in each of:
+        day_ordinals - date of the entry as given by date.toordinal()
+        food_ids     - rowid of the food in the foods table, -1 for unknown foods
+        servings     - number of servings
+        calories     - servings * total calories of the food
+
+    The analysis methods work on whole columns at a time, so they take about the
+    same time for a week as they do for years of history.
+    """
+
+    def __init__(self, orm, start, end):
+        self.orm = orm
+        self.start = db.QueryData(date=start).date
+        self.end = db.QueryData(date=end).date
+        logging.info("Loading record history between %s and %s", self.start, self.end)
+
+        with orm.read_cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT
+                    CAST(julianday(record.date) - 1721424.5 AS integer),
+                    coalesce(foods.rowid, -1),
+                    record.servings,
+                    record.servings * coalesce(foods.total_calories, 0)
+                FROM record
+                LEFT JOIN foods
+                    ON foods.user_id = record.user_id
+                    AND foods.food_name = record.food_name
+                    AND foods.portion_type = record.portion_type
+                WHERE record.user_id = ? AND record.date BETWEEN ? AND ?
+                ORDER BY record.date
+                """,
+                (orm.user_id, self.start.isoformat(), self.end.isoformat()),
+            )
+            columns = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 4)
+
+        self.day_ordinals = columns[:, 0]
+        self.food_ids = columns[:, 1]
+        self.servings = columns[:, 2]
+        self.calories = columns[:, 3]
+
+    def __len__(self):
+        return len(self.day_ordinals)
+
+    def get_days(self):
+        """
+        Returns every date from start to end as an array of day ordinals.
+        """
+        return np.arange(self.start.toordinal(), self.end.toordinal() + 1)
+
+    def daily_totals(self):
+        """
+        Returns an array with the total calories of every day from start to end,
+        aligned with get_days(). Days without any entries are 0.
+        """
+        day_count = self.end.toordinal() - self.start.toordinal() + 1
+        return np.bincount(
+            self.day_ordinals - self.start.toordinal(),
+            weights=self.calories,
+            minlength=day_count,
+        )
+
+    def rolling_mean(self, window):
+        """
+        Returns the mean daily calories over the `window` days up to and including
+        each day, aligned with get_days(). Days less than `window` days after start
+        are NaN.
+        """
+        totals = self.daily_totals()
+        cumulative_totals = np.concatenate(([0.0], np.cumsum(totals)))
+        means = np.full(len(totals), np.nan)
+        if window <= len(totals):
+            means[window - 1:] = (
+                cumulative_totals[window:] - cumulative_totals[:-window]
+            ) / window
+
+        return means
+
+    def food_contributions(self):
+        """
+        Returns a list of ((food_name, portion_type), calories, share) tuples, one
+        for each food in the history, sorted by the calories it contributed. share
+        is the fraction of all calories in the history. Unknown foods are grouped
+        under a None key.
+        """
+        food_ids, food_indices = np.unique(self.food_ids, return_inverse=True)
+        food_calories = np.bincount(food_indices, weights=self.calories)
+        total_calories = food_calories.sum()
+
+        with self.orm.read_cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT rowid, food_name, portion_type
+                FROM foods
+                WHERE rowid IN (SELECT value FROM json_each(?))
+                """,
+                (json.dumps(food_ids.tolist()),),
+            )
+            food_keys = {row[0]: row[1:] for row in cursor.fetchall()}
+
+        contributions = [
+            (
+                food_keys.get(food_id),
+                int(calories),
+                calories / total_calories if total_calories else 0.0,
+            )
+            for food_id, calories in zip(food_ids.tolist(), food_calories)
+        ]
+        contributions.sort(key=lambda contribution: contribution[1], reverse=True)
+
+        return contributions
+
+
+def load_history(orm, start, end=None):
+    """
+    Loads the record history from start to end, both inclusive, into a
+    RecordHistory. end defaults to today.
+    """
+    return RecordHistory(orm, start, end or datetime.date.today())
@@ -0,0 +1,161 @@
+"""
+asyncio front-end to the database.
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+
+class AsyncCalorieCounterORM():
+    """
+    Offers the operations of CalorieCounterORM as coroutines, so that they never
+    block the event loop on disk I/O.
+
+    Reads run on a small pool of reader threads, each using its own pooled
+    connection. Writes are handed to a BatchWriter, whose single writer thread
+    groups writes that are submitted concurrently into shared transactions:
+
+        orm = await AsyncCalorieCounterORM.open(DB_PATH)
+        await asyncio.gather(*(
+            orm.add_row_to_table("record", entry) for entry in entries
+        ))
+        await orm.close()
+    """
+
+    def __init__(self, orm, reader_threads=4):
+        self.orm = orm
+        self.writer = db.BatchWriter(orm)
+        self._readers = ThreadPoolExecutor(
+            max_workers=reader_threads, thread_name_prefix="AsyncReader"
+        )
+
+    @classmethod
+    async def open(cls, DB_PATH, reader_threads=4, **orm_kwargs):
+        """
+        Opens the database without blocking the event loop. orm_kwargs are passed on
+        to CalorieCounterORM, with one reader connection per reader thread unless
+        they give pool_size.
+        """
+        orm_kwargs.setdefault("pool_size", reader_threads)
+        orm = await asyncio.to_thread(db.CalorieCounterORM, DB_PATH, **orm_kwargs)
+
+        return cls(orm, reader_threads=reader_threads)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Waits for all queued writes to be committed and closes the database.
+        """
+        logging.info("Closing async ORM")
+        await asyncio.to_thread(self._close)
+
+    def _close(self):
+        """
+        Blocking part of close(), run on a thread of its own.
+        """
+        self.writer.close()
+        self._readers.shutdown()
+        self.orm.close()
+
+    async def _read(self, function, *args, **kwargs):
+        """
+        Runs function on one of the reader threads.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._readers, functools.partial(function, *args, **kwargs)
+        )
+
+    async def _write(self, function, *args, **kwargs):
+        """
+        Runs function on the writer thread and waits until it has been committed.
+        """
+        return await asyncio.wrap_future(self.writer.submit(function, *args, **kwargs))
+
+    async def get_rows_from_table(self, table_name, match_data=None, match_mode="exact"):
+        """
+        See CalorieCounterORM.get_rows_from_table().
+        """
+        return await self._read(
+            self.orm.get_rows_from_table, table_name, match_data, match_mode
+        )
+
+    async def get_records_between(self, start, end):
+        """
+        See CalorieCounterORM.get_records_between().
+        """
+        return await self._read(self.orm.get_records_between, start, end)
+
+    async def get_food(self, food_name, portion_type=""):
+        """
+        See CalorieCounterORM.get_food().
+        """
+        return await self._read(self.orm.get_food, food_name, portion_type)
+
+    async def get_food_calories(self, food_name, portion_type=""):
+        """
+        See CalorieCounterORM.get_food_calories().
+        """
+        return await self._read(self.orm.get_food_calories, food_name, portion_type)
+
+    async def daily_totals(self, start, end):
+        """
+        Returns the (date, calories) tuples of CalorieCounterORM.daily_totals() as a
+        list.
+        """
+        return await self._read(
+            lambda: list(self.orm.daily_totals(start, end))
+        )
+
+    async def add_row_to_table(self, table_name, new_data):
+        """
+        See CalorieCounterORM.add_row_to_table().
+        """
+        return await self._write(self.orm.add_row_to_table, table_name, new_data)
+
+    async def add_rows_to_table(self, table_name, new_rows):
+        """
+        See CalorieCounterORM.add_rows_to_table().
+        """
+        return await self._write(
+            self.orm.add_rows_to_table, table_name, list(new_rows)
+        )
+
+    async def update_row_in_table(
+        self, table_name, update_data, match_data, match_mode="exact"
+    ):
+        """
+        See CalorieCounterORM.update_row_in_table().
+        """
+        return await self._write(
+            self.orm.update_row_in_table,
+            table_name,
+            update_data,
+            match_data,
+            match_mode,
+        )
+
+    async def delete_rows_in_table(self, table_name, match_data, match_mode="exact"):
+        """
+        See CalorieCounterORM.delete_rows_in_table().
+        """
+        return await self._write(
+            self.orm.delete_rows_in_table, table_name, match_data, match_mode
+        )
+
+    async def set_food_ingredients(self, food_name, portion_type, ingredients):
+        """
+        See CalorieCounterORM.set_food_ingredients().
+        """
+        return await self._write(
+            self.orm.set_food_ingredients, food_name, portion_type, ingredients
+        )
@@ -0,0 +1,4 @@
+"""
+Benchmarks of the calorie tracker, run from the repository root with e.g.
+    python -m benchmarks.bench_group_commit
+"""
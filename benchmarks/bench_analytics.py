@@ -0,0 +1,80 @@
+"""
+Measures the columnar analysis of analytics.py on a generated record history: loading
+it into arrays, the rolling 7 and 30 day means and the food contributions. Ten years
+of daily entries should take well under a second in total.
+
+Requires numpy, like analytics.py.
+"""
+
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+import analytics
+import db
+from benchmarks import generators
+
+
+def time_analysis(orm, start, end):
+    """
+    Loads the history from start to end and analyses it, and returns a dictionary of
+    step names to durations in milliseconds along with the number of entries.
+    """
+    durations = {}
+    start_time = time.perf_counter()
+    history = analytics.load_history(orm, start, end)
+    durations["load_history"] = time.perf_counter() - start_time
+    for name, function in [
+        ("rolling_mean(7)", lambda: history.rolling_mean(7)),
+        ("rolling_mean(30)", lambda: history.rolling_mean(30)),
+        ("food_contributions", history.food_contributions),
+    ]:
+        step_start_time = time.perf_counter()
+        function()
+        durations[name] = time.perf_counter() - step_start_time
+    durations["total"] = time.perf_counter() - start_time
+
+    return {name: duration * 1000 for name, duration in durations.items()}, len(history)
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--entries-per-day", type=int, default=3)
+    parser.add_argument("--foods", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    days = args.years * 365
+    start = generators.HISTORY_END - datetime.timedelta(days=days - 1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with db.CalorieCounterORM(os.path.join(tmp_dir, "bench.db")) as orm:
+            foods = generators.generate_foods(args.foods, args.seed)
+            orm.add_rows_to_table("foods", foods)
+            orm.add_rows_to_table("record", generators.generate_record(
+                args.entries_per_day * days, foods, args.years, args.seed
+            ))
+
+            runs = []
+            for _ in range(args.runs):
+                durations, entries = time_analysis(orm, start, generators.HISTORY_END)
+                runs.append(durations)
+
+    print(f"{entries} record entries over {args.years} years")
+    for name in runs[0]:
+        times = [durations[name] for durations in runs]
+        print(
+            f"{name:19} {statistics.median(times):8.3f} ms median "
+            f"{max(times):8.3f} ms worst"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Measures lookups in the food search index on a generated catalog of foods.
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import search
+
+BASE_FOODS = [
+    "apple", "avocado", "bacon", "bagel", "banana", "bean", "beef", "blueberry",
+    "bread", "broccoli", "brownie", "burrito", "butter", "cabbage", "cake", "carrot",
+    "cashew", "cauliflower", "cereal", "cheese", "cherry", "chicken", "chickpea",
+    "chocolate", "cookie", "corn", "couscous", "cracker", "croissant", "cucumber",
+    "curry", "donut", "dumpling", "egg", "falafel", "granola", "grape", "hummus",
+    "kale", "lasagna", "lentil", "mango", "muffin", "mushroom", "noodle", "oatmeal",
+    "omelette", "onion", "orange", "pancake", "pasta", "peach", "peanut", "pear",
+    "pepper", "pizza", "pork", "potato", "pretzel", "pumpkin", "quinoa", "ramen",
+    "rice", "salad", "salmon", "sandwich", "sausage", "shrimp", "smoothie", "soup",
+    "spinach", "steak", "strawberry", "sushi", "taco", "tofu", "tomato", "tortilla",
+    "tuna", "turkey", "waffle", "walnut", "yogurt", "zucchini",
+]
+ADJECTIVES = [
+    "baked", "boiled", "creamy", "crispy", "fresh", "fried", "frozen", "grilled",
+    "homemade", "light", "organic", "raw", "roasted", "salted", "smoked", "spicy",
+    "steamed", "sweet", "toasted", "whole",
+]
+SIDES = [
+    "", " with cheese", " with garlic", " with honey", " with rice", " with sauce",
+    " with butter", " with herbs", " with onions", " with mushrooms", " and beans",
+    " and salad",
+]
+PORTION_TYPES = ["", "slice", "cup", "bowl", "piece", "serving", "100g", "pack"]
+
+
+def generate_catalog(size, seed, recorded_share=0.01):
+    """
+    Returns size distinct (food_name, portion_type, frequency) tuples, with names
+    like "grilled chicken with rice". Like in a large imported catalog only
+    recorded_share of the foods have been recorded, with frequencies following a
+    long tail.
+    """
+    rng = random.Random(seed)
+    keys = [
+        (f"{adjective} {base_food}{side}", portion_type)
+        for adjective in ADJECTIVES
+        for base_food in BASE_FOODS
+        for side in SIDES
+        for portion_type in PORTION_TYPES
+    ]
+    if size > len(keys):
+        raise ValueError(f"At most {len(keys)} foods can be generated")
+
+    return [
+        key + (int(rng.paretovariate(1.2)) if rng.random() < recorded_share else 0,)
+        for key in rng.sample(keys, size)
+    ]
+
+
+def time_lookups(function, queries):
+    """
+    Returns the median and worst time of function(query) over all queries in
+    milliseconds.
+    """
+    times = []
+    for query in queries:
+        start_time = time.perf_counter()
+        function(query)
+        times.append((time.perf_counter() - start_time) * 1000)
+
+    return statistics.median(times), max(times)
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--foods", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = generate_catalog(args.foods, args.seed)
+    start_time = time.perf_counter()
+    index = search.FoodSearchIndex(catalog)
+    print(f"build {len(index)} foods:  {time.perf_counter() - start_time:8.3f} s")
+
+    rng = random.Random(args.seed)
+    names = [food_name for food_name, _, _ in rng.sample(catalog, 200)]
+    prefixes = [name[:rng.randrange(1, 12)] for name in names]
+    typos = []
+    for name in names:
+        word = name.split()[1]  # the base food
+        position = rng.randrange(len(word))
+        typos.append(word[:position] + word[position + 1:])
+
+    start_time = time.perf_counter()
+    for food_name, portion_type, _ in catalog[:1000]:
+        index.remove(food_name, portion_type)
+    for food_name, portion_type, frequency in catalog[:1000]:
+        index.add(food_name, portion_type, frequency)
+    # 1000 foods, so the total in seconds is the time per food in milliseconds
+    print(f"remove + add:       {time.perf_counter() - start_time:8.3f} ms per food")
+
+    for name, function, queries in [
+        ("complete", index.complete, prefixes),
+        ("fuzzy search", index.search, typos),
+        ("fuzzy search, name", index.search, names),
+    ]:
+        median, worst = time_lookups(function, queries)
+        print(f"{name:19} {median:8.3f} ms median {worst:8.3f} ms worst")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares the write throughput of committing every write on its own with the group
+commit mode of the ORM, with synchronous=normal and with synchronous=full.
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import db
+
+
+def add_entries(orm, count):
+    """
+    Adds count record entries one write at a time and returns the writes per second.
+    """
+    start = datetime.date(2020, 1, 1)
+    start_time = time.perf_counter()
+    for i in range(count):
+        orm.add_row_to_table(
+            "record",
+            db.QueryData(
+                date=start + datetime.timedelta(days=i % 365), food_name=f"food {i}"
+            ),
+        )
+    orm.flush()
+
+    return count / (time.perf_counter() - start_time)
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--group-size", type=int, default=db.MAX_BATCH_SIZE)
+    parser.add_argument("--interval", type=float, default=db.GROUP_COMMIT_INTERVAL)
+    args = parser.parse_args()
+
+    # in wal mode synchronous=normal only syncs at checkpoints, while full syncs on
+    # every commit, which is the cost group commit saves
+    for synchronous in ("normal", "full"):
+        pragmas = {**db.DEFAULT_PRAGMAS, "synchronous": synchronous}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with db.CalorieCounterORM(
+                os.path.join(tmp_dir, "single.db"), pragmas=pragmas
+            ) as orm:
+                single = add_entries(orm, args.writes)
+            with db.CalorieCounterORM(
+                os.path.join(tmp_dir, "group.db"),
+                pragmas=pragmas,
+                group_commit=True,
+                group_commit_size=args.group_size,
+                group_commit_interval=args.interval,
+            ) as orm:
+                group = add_entries(orm, args.writes)
+
+        print(f"synchronous={synchronous}")
+        print(f"  commit per write: {single:10.0f} writes/s")
+        print(f"  group commit:     {group:10.0f} writes/s ({group / single:.1f}x)")
+
+if __name__ == "__main__":
+    main()
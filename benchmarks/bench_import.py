@@ -0,0 +1,102 @@
+"""
+Measures importing a generated food catalog and record history from CSV and
+exporting them again, with the peak memory use of the process.
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import random
+import resource
+import tempfile
+import time
+
+import db
+import transfer
+
+
+def write_catalog(path, size, seed):
+    """
+    Writes a CSV catalog of size foods to path.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(transfer.COLUMNS["foods"])
+        for i in range(size):
+            writer.writerow((f"food {i}", rng.choice(["", "cup", "slice"]),
+                             rng.randrange(1000)))
+
+
+def write_record(path, size, foods, seed):
+    """
+    Writes a CSV record history of size entries of the first foods foods to path.
+    """
+    rng = random.Random(seed)
+    start = datetime.date(2000, 1, 1)
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(transfer.COLUMNS["record"])
+        for i in range(size):
+            writer.writerow((
+                (start + datetime.timedelta(days=i // 5)).isoformat(),
+                f"food {rng.randrange(foods)}",
+                "",
+                rng.randrange(1, 4),
+            ))
+
+
+def get_peak_memory():
+    """
+    Returns the peak resident memory of the process in MiB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--foods", type=int, default=1000000)
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=transfer.IMPORT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        foods_path = os.path.join(tmp_dir, "foods.csv")
+        record_path = os.path.join(tmp_dir, "record.csv")
+        write_catalog(foods_path, args.foods, args.seed)
+        write_record(record_path, args.entries, args.foods, args.seed)
+        print(f"peak memory before:  {get_peak_memory():8.1f} MiB")
+
+        with db.CalorieCounterORM(os.path.join(tmp_dir, "bench.db")) as orm:
+            for table_name, path in (("foods", foods_path), ("record", record_path)):
+                start_time = time.perf_counter()
+                with open(path, encoding="utf-8", newline="") as file:
+                    imported, _ = transfer.import_rows(
+                        orm, table_name, file, "csv", args.chunk_size
+                    )
+                duration = time.perf_counter() - start_time
+                print(
+                    f"import {table_name:7} {imported:9} rows {duration:7.1f} s "
+                    f"{imported / duration:9.0f} rows/s"
+                )
+
+            for table_name in ("foods", "record"):
+                start_time = time.perf_counter()
+                with open(os.devnull, "w", encoding="utf-8") as file:
+                    exported = transfer.export_rows(orm, table_name, file, "csv")
+                duration = time.perf_counter() - start_time
+                print(
+                    f"export {table_name:7} {exported:9} rows {duration:7.1f} s "
+                    f"{exported / duration:9.0f} rows/s"
+                )
+
+        print(f"peak memory after:   {get_peak_memory():8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
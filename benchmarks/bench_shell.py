@@ -0,0 +1,77 @@
+"""
+Measures how long logging a meal takes in the shell: a session of 20 commands, one
+new food and 19 record entries, followed by commit. Entering 20 items should feel
+instant, i.e. take well under half a second in total.
+"""
+
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+from contextlib import redirect_stderr, redirect_stdout
+
+import db
+import shell
+from main import add_entry, add_food
+
+COMMANDS = [
+    "food broccoli 30 --type head",
+    *(f"entry bread --type slice --date 0{day}052020" for day in range(1, 10)),
+    *(f"entry broccoli --type head --date 1{day}052020" for day in range(10)),
+]
+
+
+def time_session(db_path):
+    """
+    Runs COMMANDS and commit in a new shell and returns the durations of entering
+    the commands and of the commit in milliseconds.
+    """
+    with db.CalorieCounterORM(
+        db_path, group_commit=True, group_commit_interval=shell.COMMIT_INTERVAL
+    ) as orm:
+        orm.add_row_to_table(
+            "foods", db.QueryData(food_name="bread", portion_type="slice", calories=80)
+        )
+        orm.flush()
+        output = io.StringIO()
+        tracker_shell = shell.TrackerShell(
+            orm,
+            {"food": add_food, "entry": add_entry},
+            stdin=io.StringIO(),
+            stdout=output,
+        )
+        with redirect_stdout(output), redirect_stderr(io.StringIO()):
+            start_time = time.perf_counter()
+            for line in COMMANDS:
+                tracker_shell.onecmd(line)
+            commands_time = time.perf_counter()
+            tracker_shell.onecmd("commit")
+            commit_time = time.perf_counter()
+
+    return (commands_time - start_time) * 1000, (commit_time - commands_time) * 1000
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    args = parser.parse_args()
+
+    durations = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for session in range(args.sessions):
+            durations.append(time_session(os.path.join(tmp_dir, f"{session}.db")))
+
+    for name, times in zip(["20 commands", "commit"], zip(*durations)):
+        print(
+            f"{name:12} {statistics.median(times):8.3f} ms median "
+            f"{max(times):8.3f} ms worst"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures the wall time of short command line runs, which are made from shell hooks
+many times a day, and checks them against a time budget. The budgets are on top of
+the start up time of a bare interpreter, so that they hold on slower machines too.
+
+Exits with status 1 if any command is over its budget.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "main.py")
+
+# name, command line arguments of main.py and budget in milliseconds
+COMMANDS = [
+    ("--help", ["--help"], 40),
+    ("entry", ["entry", "broccoli", "--type", "head"], 80),
+]
+
+
+def time_command(args, runs, cwd):
+    """
+    Returns the median wall time of running a python process with args in
+    milliseconds.
+    """
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args], cwd=cwd, check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        times.append((time.perf_counter() - start_time) * 1000)
+
+    return statistics.median(times)
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    # cfg.DB_PATH is relative, so the entries go to a database in the temporary
+    # directory
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        baseline = time_command(["-c", "pass"], args.runs, tmp_dir)
+        print(f"{'interpreter':12} {baseline:7.1f} ms")
+
+        over_budget = False
+        for name, command_args, budget in COMMANDS:
+            # the first run creates the database, which is not measured
+            time_command([MAIN_PATH, *command_args], 1, tmp_dir)
+            overhead = time_command([MAIN_PATH, *command_args], args.runs, tmp_dir)
+            overhead -= baseline
+            status = "ok" if overhead <= budget else "OVER BUDGET"
+            print(f"{name:12} {overhead:+7.1f} ms (budget {budget} ms) {status}")
+            over_budget = over_budget or overhead > budget
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Measures how the queries of a single user scale with the number of users sharing a
+database. Users are added one by one, each with their own foods catalog and five
+years of record history, and the operations of a few random users are timed
+whenever the number of users reaches a checkpoint:
+
+    python -m benchmarks.bench_users --users 1000 --checkpoints 1 10 100 1000
+
+As every key and index starts with user_id the medians should stay about the same
+at every checkpoint.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import db
+from benchmarks import generators
+
+# users whose operations are timed at every checkpoint
+SAMPLE_USERS = 10
+
+# timed calls of every operation at every checkpoint, spread over the sample users
+SAMPLES = 200
+
+
+def add_user(db_path, user_id, foods_count, entries_per_day, seed):
+    """
+    Adds a user with a catalog of foods_count foods and entries_per_day record
+    entries on every day of five years, and returns the foods.
+    """
+    foods = generators.generate_foods(foods_count, seed)
+    with db.CalorieCounterORM(db_path, pool_size=1, user_id=user_id) as orm:
+        orm.add_rows_to_table("foods", foods)
+        orm.add_rows_to_table("record", generators.generate_record(
+            entries_per_day * 5 * 365, foods, seed=seed
+        ))
+
+    return foods
+
+
+def time_operations(db_path, user_foods, rng):
+    """
+    Times the operations of SAMPLE_USERS random users and returns a dictionary of
+    operation names to the median duration in milliseconds.
+    """
+    user_ids = rng.sample(sorted(user_foods), min(SAMPLE_USERS, len(user_foods)))
+    orms = [db.CalorieCounterORM(db_path, user_id=user_id) for user_id in user_ids]
+    days = 5 * 365
+    history_start = generators.HISTORY_END - datetime.timedelta(days=days - 1)
+
+    def random_day(last_day=days):
+        return history_start + datetime.timedelta(days=rng.randrange(last_day))
+
+    def daily_totals_year(orm, _foods):
+        start = random_day(days - 365)
+        return list(orm.daily_totals(start, start + datetime.timedelta(364)))
+
+    operations = {
+        "get_rows_by_date": lambda orm, foods: orm.get_rows_from_table(
+            "record", db.QueryData(date=random_day())
+        ),
+        "get_rows_by_food": lambda orm, foods: orm.get_rows_from_table(
+            "record", db.QueryData(food_name=rng.choice(foods).food_name)
+        ),
+        "get_food": lambda orm, foods: orm.get_rows_from_table(
+            "foods", db.QueryData(food_name=rng.choice(foods).food_name)
+        ),
+        "daily_totals_year": daily_totals_year,
+        "add_row_to_table": lambda orm, foods: orm.add_row_to_table(
+            "record", db.QueryData(
+                date=generators.HISTORY_END + datetime.timedelta(days=1),
+                food_name=rng.choice(foods).food_name,
+            )
+        ),
+    }
+
+    medians = {}
+    try:
+        for name, operation in operations.items():
+            durations = []
+            for i in range(SAMPLES):
+                orm = orms[i % len(orms)]
+                foods = user_foods[orm.user_id]
+                start_time = time.perf_counter()
+                operation(orm, foods)
+                durations.append((time.perf_counter() - start_time) * 1000)
+            medians[name] = statistics.median(durations)
+    finally:
+        for orm in orms:
+            orm.close()
+
+    return medians
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--checkpoints", type=int, nargs="+", default=[1, 10, 100, 1000]
+    )
+    parser.add_argument("--foods", type=int, default=200, help="foods per user")
+    parser.add_argument("--entries-per-day", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    user_foods = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        rows = 0
+        fill_duration = 0.0
+        header_printed = False
+        for user in range(args.users):
+            user_id = f"user {user}"
+            start_time = time.perf_counter()
+            user_foods[user_id] = add_user(
+                db_path, user_id, args.foods, args.entries_per_day, args.seed + user
+            )
+            fill_duration += time.perf_counter() - start_time
+            rows += args.entries_per_day * 5 * 365
+
+            if len(user_foods) not in args.checkpoints:
+                continue
+
+            medians = time_operations(db_path, user_foods, rng)
+            if not header_printed:
+                print(f"{'users':>6} {'record rows':>12} {'fill s':>8}  " + " ".join(
+                    f"{name:>18}" for name in medians
+                ))
+                header_printed = True
+            print(
+                f"{len(user_foods):6} {rows:12} {fill_duration:8.1f}  "
+                + " ".join(f"{median:15.3f} ms" for median in medians.values()),
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
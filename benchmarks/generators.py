@@ -0,0 +1,103 @@
+"""
+Seeded generators of synthetic foods catalogs and record histories for the
+benchmarks. The same seed always generates the same data.
+"""
+
+import datetime
+import itertools
+import random
+
+import db
+
+BASE_FOODS = (
+    "apple", "banana", "bread", "broccoli", "butter", "carrot", "cheese", "chicken",
+    "chocolate", "coffee", "cookie", "egg", "fish", "granola", "ham", "honey",
+    "hummus", "juice", "lentils", "milk", "muffin", "noodles", "oatmeal", "orange",
+    "pasta", "peanuts", "pizza", "porridge", "potato", "rice", "salad", "salmon",
+    "sandwich", "sausage", "soup", "spinach", "steak", "tea", "tofu", "tomato",
+    "tortilla", "yogurt",
+)
+MODIFIERS = (
+    "baked", "boiled", "fresh", "fried", "frozen", "grilled", "homemade", "light",
+    "low fat", "organic", "plain", "raw", "roasted", "smoked", "spicy", "steamed",
+    "sweet", "whole grain",
+)
+PORTION_TYPES = ("", "", "", "bowl", "cup", "glass", "piece", "plate", "slice")
+
+# last day of generated record histories, fixed so that the data does not depend on
+# the day it is generated
+HISTORY_END = datetime.date(2020, 12, 31)
+
+
+def generate_foods(count, seed=0):
+    """
+    Returns a list of count QueryData instances of distinct foods with made up names
+    like "grilled salmon", numbered once the combinations run out.
+    """
+    rng = random.Random(seed)
+    foods = []
+    keys = set()
+    for i in range(count):
+        food_name = f"{rng.choice(MODIFIERS)} {rng.choice(BASE_FOODS)}"
+        portion_type = rng.choice(PORTION_TYPES)
+        if (food_name, portion_type) in keys:
+            food_name = f"{food_name} {i}"
+        keys.add((food_name, portion_type))
+        foods.append(db.QueryData(
+            food_name=food_name,
+            portion_type=portion_type,
+            calories=rng.randrange(5, 900),
+        ))
+
+    return foods
+
+
+def generate_record(count, foods, years=5, seed=0):
+    """
+    Yields count QueryData record entries of the given foods, spread evenly over the
+    days of the given number of years up to HISTORY_END, oldest first.
+
+    Like real histories a few foods are eaten far more often than the rest: foods are
+    picked with a probability inversely proportional to their position in foods. A
+    food is recorded at most once a day, as repeats would only add to its servings.
+    """
+    rng = random.Random(seed)
+    days = years * 365
+    start = HISTORY_END - datetime.timedelta(days=days - 1)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(foods))))
+    positions = range(len(foods))
+
+    for day in range(days):
+        date = start + datetime.timedelta(days=day)
+        entry_count = min(count * (day + 1) // days - count * day // days, len(foods))
+        chosen = set()
+        while len(chosen) < entry_count:
+            chosen.update(rng.choices(
+                positions, cum_weights=cum_weights, k=entry_count - len(chosen)
+            ))
+
+        for position in sorted(chosen):
+            yield db.QueryData(
+                date=date,
+                food_name=foods[position].food_name,
+                portion_type=foods[position].portion_type,
+                servings=rng.choice((1, 1, 1, 2, 2, 3)),
+            )
+
+
+def generate_date_strings(count, seed=0):
+    """
+    Returns a list of count date strings in the forms accepted by QueryData, mostly
+    with years and some without.
+    """
+    rng = random.Random(seed)
+    date_strings = []
+    for _ in range(count):
+        date = HISTORY_END - datetime.timedelta(days=rng.randrange(5 * 365))
+        date_format = rng.choice(("%d-%m-%Y", "%d%m%Y", "%Y-%m-%d", "%d-%m"))
+        if (date.month, date.day) == (2, 29):
+            # without a year it could be read as a day of a year that is not leap
+            date_format = "%d-%m-%Y"
+        date_strings.append(date.strftime(date_format))
+
+    return date_strings
@@ -0,0 +1,252 @@
+"""
+Times the hot paths of the ORM on generated databases of several sizes, writes the
+results as JSON and compares them with a stored baseline to catch regressions.
+
+    python -m benchmarks.suite --sizes 1000 100000 --output results.json
+    python -m benchmarks.suite --save-baseline
+
+Sizes are numbers of record rows, over a foods catalog a tenth of that size. The
+exit status is 1 if any operation got slower than the baseline by more than the
+tolerance.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import db
+from benchmarks import generators
+
+SIZES = (1000, 100000, 10000000)
+
+# timed calls of every operation for every size
+SAMPLES = 200
+
+# date strings converted by every timed call of parse_dates
+PARSE_BATCH_SIZE = 1000
+
+# rows written per transaction while the database is filled
+FILL_CHUNK_SIZE = 50000
+
+# fraction by which an operation may be slower than its baseline
+TOLERANCE = 0.5
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def fill_database(orm, size, seed):
+    """
+    Adds a catalog of size / 10 foods and size record entries over five years, and
+    returns the foods.
+    """
+    foods = generators.generate_foods(max(size // 10, 100), seed)
+    for start in range(0, len(foods), FILL_CHUNK_SIZE):
+        orm.add_rows_to_table("foods", foods[start:start + FILL_CHUNK_SIZE])
+
+    chunk = []
+    for entry in generators.generate_record(size, foods, seed=seed):
+        chunk.append(entry)
+        if len(chunk) == FILL_CHUNK_SIZE:
+            orm.add_rows_to_table("record", chunk)
+            chunk = []
+    orm.add_rows_to_table("record", chunk)
+
+    return foods
+
+
+def time_calls(function, arguments):
+    """
+    Calls function with each tuple of arguments and returns the duration of every
+    call in milliseconds.
+    """
+    durations = []
+    for call_arguments in arguments:
+        start_time = time.perf_counter()
+        function(*call_arguments)
+        durations.append((time.perf_counter() - start_time) * 1000)
+
+    return durations
+
+
+def run_operations(orm, foods, seed):
+    """
+    Times every operation SAMPLES times on a filled database and returns a
+    dictionary of operation names to lists of durations in milliseconds.
+    """
+    rng = random.Random(seed)
+    days = 5 * 365
+    history_start = generators.HISTORY_END - datetime.timedelta(days=days - 1)
+
+    def random_day(last_day=days):
+        return history_start + datetime.timedelta(days=rng.randrange(last_day))
+
+    durations = {}
+    # new entries after the generated history, each committed on its own
+    durations["add_row_to_table"] = time_calls(orm.add_row_to_table, [
+        ("record", db.QueryData(
+            date=generators.HISTORY_END + datetime.timedelta(days=1 + i % 30),
+            food_name=food.food_name,
+            portion_type=food.portion_type,
+        ))
+        for i, food in enumerate(rng.choices(foods, k=SAMPLES))
+    ])
+    durations["get_rows_by_date"] = time_calls(orm.get_rows_from_table, [
+        ("record", db.QueryData(date=random_day())) for _ in range(SAMPLES)
+    ])
+    durations["get_rows_by_food"] = time_calls(orm.get_rows_from_table, [
+        ("record", db.QueryData(food_name=food.food_name))
+        for food in rng.choices(foods, k=SAMPLES)
+    ])
+    durations["update_food"] = time_calls(orm.update_row_in_table, [
+        (
+            "foods",
+            db.QueryData(calories=rng.randrange(5, 900)),
+            db.QueryData(food_name=food.food_name, portion_type=food.portion_type),
+        )
+        for food in rng.choices(foods, k=SAMPLES)
+    ])
+    durations["update_entry"] = time_calls(orm.update_row_in_table, [
+        (
+            "record",
+            db.QueryData(servings=rng.randrange(1, 4)),
+            db.QueryData(date=random_day(), food_name=food.food_name),
+        )
+        for food in rng.choices(foods, k=SAMPLES)
+    ])
+    date_strings = generators.generate_date_strings(PARSE_BATCH_SIZE, seed)
+    durations["parse_dates"] = time_calls(
+        lambda: [db.QueryData(date=date_string) for date_string in date_strings],
+        [()] * SAMPLES,
+    )
+    durations["daily_totals_month"] = time_calls(
+        lambda start: list(orm.daily_totals(start, start + datetime.timedelta(30))),
+        [(random_day(days - 30),) for _ in range(SAMPLES)],
+    )
+    durations["daily_totals_year"] = time_calls(
+        lambda start: list(orm.daily_totals(start, start + datetime.timedelta(364))),
+        [(random_day(days - 365),) for _ in range(SAMPLES)],
+    )
+
+    return durations
+
+
+def summarize(durations):
+    """
+    Returns the median, 95th percentile and mean of a list of durations.
+    """
+    return {
+        "median_ms": statistics.median(durations),
+        "p95_ms": statistics.quantiles(durations, n=20)[-1],
+        "mean_ms": statistics.fmean(durations),
+        "samples": len(durations),
+    }
+
+
+def run_suite(sizes, seed):
+    """
+    Runs the operations at every size and returns the results as a dictionary that
+    can be dumped as JSON.
+    """
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed,
+        },
+        "sizes": {},
+    }
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with db.CalorieCounterORM(os.path.join(tmp_dir, "bench.db")) as orm:
+                start_time = time.perf_counter()
+                foods = fill_database(orm, size, seed)
+                fill_duration = time.perf_counter() - start_time
+                print(f"filled {size} rows in {fill_duration:.1f} s", file=sys.stderr)
+
+                results["sizes"][str(size)] = {
+                    name: summarize(durations)
+                    for name, durations in run_operations(orm, foods, seed).items()
+                }
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the median of every operation next to its baseline and returns a list of
+    (size, operation) tuples that are slower than the baseline by more than
+    tolerance.
+    """
+    regressions = []
+    print(f"{'size':>9} {'operation':20} {'median ms':>10} {'baseline':>10} {'ratio':>6}")
+    for size, operations in results["sizes"].items():
+        for name, summary in operations.items():
+            baseline_summary = baseline.get("sizes", {}).get(size, {}).get(name)
+            if baseline_summary is None:
+                print(f"{size:>9} {name:20} {summary['median_ms']:10.3f}")
+                continue
+
+            ratio = summary["median_ms"] / baseline_summary["median_ms"]
+            flag = ""
+            if ratio > 1 + tolerance:
+                regressions.append((size, name))
+                flag = "  REGRESSION"
+            print(
+                f"{size:>9} {name:20} {summary['median_ms']:10.3f} "
+                f"{baseline_summary['median_ms']:10.3f} {ratio:6.2f}{flag}"
+            )
+
+    return regressions
+
+
+def main():
+    """
+    Runs the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument(
+        "--save-baseline", action="store_true",
+        help="store the results as the new baseline instead of comparing them",
+    )
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+        compare(results, {}, args.tolerance)
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} operations regressed", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
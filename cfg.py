@@ -1,3 +1,16 @@
 # pylint: disable=missing-module-docstring
 
 DB_PATH = "test_database.db"
+
+# profile whose foods and record are used unless --user is given, every user of a
+# database has their own
+USER_ID = "default"
+
+# sqlite settings applied to every database connection, None for the ones of
+# db.DEFAULT_PRAGMAS. To change some of them, import db and extend those, e.g.
+# {**db.DEFAULT_PRAGMAS, "synchronous": "full"}
+DB_PRAGMAS = None
+
+# file the timings, statement and row counts of every run are added up in, shown by
+# the stats command. None disables collecting them.
+METRICS_PATH = None
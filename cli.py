@@ -5,16 +5,86 @@ Functions and logic concerning the command line interface.
 import argparse
 
 
+class IngredientAction(argparse.Action):
+    """
+    Appends the FOOD TYPE SERVINGS values of an --ingredient option as a
+    (food_name, portion_type, servings) tuple, with servings a positive integer.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        food_name, portion_type, servings = values
+        try:
+            servings = int(servings)
+        except ValueError:
+            servings = 0
+        if servings < 1:
+            parser.error(
+                f"argument {option_string}: servings of {food_name} must be a "
+                f"positive whole number, not {values[2]!r}"
+            )
+
+        # a new list, as the default one is shared by every parse of the shell
+        ingredients = list(getattr(namespace, self.dest) or [])
+        ingredients.append((food_name, portion_type, servings))
+        setattr(namespace, self.dest, ingredients)
+
+
 # define parsers
 parser = argparse.ArgumentParser(
     description="A program to keep track of calories consumed each day."
 )
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Profile the command and show the slowest functions and SQL statements.",
+)
+parser.add_argument(
+    "--profile-output",
+    default="profile.pstats",
+    help="File the profile is written to, default=profile.pstats.",
+    metavar="",
+    type=str,
+)
+parser.add_argument(
+    "--user",
+    help="Profile whose foods and record to use, default=cfg.USER_ID.",
+    metavar="",
+    type=str,
+)
 subparsers = parser.add_subparsers(help="command", dest="subparser_name")
 
 food_parser = subparsers.add_parser("food", help="Add food item to database.")
 
 entry_parser = subparsers.add_parser("entry", help="Add food entry to the record.")
 
+summary_parser = subparsers.add_parser(
+    "summary", help="Show total calories consumed per day."
+)
+
+rebuild_summaries_parser = subparsers.add_parser(
+    "rebuild-summaries", help="Recompute all daily totals from the record."
+)
+
+serve_parser = subparsers.add_parser(
+    "serve", help="Serve the tracker over HTTP/JSON until interrupted."
+)
+
+shell_parser = subparsers.add_parser(
+    "shell", help="Enter food, entry and summary commands interactively."
+)
+
+import_parser = subparsers.add_parser(
+    "import", help="Add foods or record entries from a CSV or JSON Lines file."
+)
+
+export_parser = subparsers.add_parser(
+    "export", help="Write foods or record entries to a CSV or JSON Lines file."
+)
+
+stats_parser = subparsers.add_parser(
+    "stats", help="Show timings and counts of database operations."
+)
+
 
 # def arguments of food subparser
 food_parser.add_argument(
@@ -32,6 +102,15 @@ food_parser.add_argument(
     type=str,
 )
 
+food_parser.add_argument(
+    "--ingredient",
+    action=IngredientAction,
+    default=[],
+    help="Food the new food is made of, can be given multiple times.",
+    metavar=("FOOD", "TYPE", "SERVINGS"),
+    nargs=3,
+)
+
 
 # define arguments of entry subparser
 entry_parser.add_argument(
@@ -59,6 +138,70 @@ entry_parser.add_argument(
 )
 
 
+# define arguments of summary subparser
+summary_parser.add_argument(
+    "--start",
+    default="today",
+    help="First day of the summary, default=today.",
+    metavar="               {today,yesterday,tomorrow,DDMM(YYYY)}",
+    type=str,
+)
+
+summary_parser.add_argument(
+    "--end",
+    default="today",
+    help="Last day of the summary, default=today.",
+    metavar="               {today,yesterday,tomorrow,DDMM(YYYY)}",
+    type=str,
+)
+
+
+# define arguments of serve subparser
+serve_parser.add_argument(
+    "--host", default="127.0.0.1", help="Address to listen on, default=127.0.0.1.",
+    metavar="", type=str,
+)
+
+serve_parser.add_argument(
+    "--port", default=8080, help="Port to listen on, default=8080.", metavar="",
+    type=int,
+)
+
+
+# define arguments of import and export subparsers
+for transfer_parser in (import_parser, export_parser):
+    transfer_parser.add_argument(
+        "table", choices=("foods", "record"), help="Table to transfer.", type=str
+    )
+
+    transfer_parser.add_argument(
+        "path", help="File to transfer, - for standard input or output.", type=str
+    )
+
+    transfer_parser.add_argument(
+        "--format",
+        choices=("csv", "jsonl"),
+        default=None,
+        help="Format of the file, default=from the file extension.",
+        type=str,
+    )
+
+import_parser.add_argument(
+    "--chunk-size", default=10000, help="Rows written per transaction, default=10000.",
+    metavar="", type=int,
+)
+
+
+# define arguments of stats subparser
+stats_parser.add_argument(
+    "--json", action="store_true", help="Print the numbers as JSON."
+)
+
+stats_parser.add_argument(
+    "--reset", action="store_true", help="Clear the collected numbers."
+)
+
+
 # debug
 if __name__ == "__main__":
     args = parser.parse_args()
@@ -0,0 +1,88 @@
+"""
+Conversion of the date strings accepted by the script to date objects.
+
+Dates can be given as "today", "tomorrow" or "yesterday", as "DD-MM-YYYY" or
+"DDMMYYYY", where the year is optional and defaults to the current one, or in the
+ISO 8601 form "YYYY-MM-DD" they are stored in.
+"""
+
+import datetime
+import functools
+import re
+
+# distinct date strings whose conversion is remembered
+PARSE_CACHE_SIZE = 4096
+
+ISO_DATE_REGEX = re.compile(r"^[\d]{4}-[\d]{2}-[\d]{2}$")
+DAY_MONTH_YEAR_REGEX = re.compile(r"^([\d]{1,2})-?([\d]{1,2})-?([\d]{4})?$")
+
+# days from today of the dates named by a word
+RELATIVE_DAYS = {"today": 0, "tomorrow": 1, "yesterday": -1}
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_date_string(date_string):
+    """
+    Returns the date of a date string that is not relative to today, or a
+    (month, day) tuple if it has no year. Results don't depend on the current date,
+    so they are memoized.
+    """
+    if ISO_DATE_REGEX.match(date_string):
+        return datetime.date.fromisoformat(date_string)
+
+    match = DAY_MONTH_YEAR_REGEX.match(date_string)
+    if not match:
+        raise ValueError(f"Invalid date string {date_string}")
+
+    day = int(match.group(1))
+    month = int(match.group(2))
+    if match.group(3) is None:
+        return month, day
+
+    return datetime.date(int(match.group(3)), month, day)
+
+
+def parse_date(date_string, today=None):
+    """
+    Converts a date string to a date object. today is the date relative dates and
+    dates without a year are based on, by default the current date, which is only
+    looked up when it is needed. Raises ValueError if the string is not a valid
+    date.
+    """
+    offset = RELATIVE_DAYS.get(date_string.lower())
+    if offset is not None:
+        today = today or datetime.date.today()
+        return today + datetime.timedelta(days=offset)
+
+    date = _parse_date_string(date_string)
+    if isinstance(date, tuple):
+        today = today or datetime.date.today()
+        return datetime.date(today.year, *date)
+
+    return date
+
+
+def parse_dates(date_strings, invalid=None):
+    """
+    Batch version of parse_date() converting a whole column of date strings at
+    once, e.g. for imports. Returns a list with the date of every string. Every
+    distinct string is converted only once and the current date is looked up
+    only once. Strings which are not valid dates, and values which are not strings
+    at all, are converted to invalid.
+    """
+    today = datetime.date.today()
+    converted = {}
+    dates = []
+    for date_string in date_strings:
+        if not isinstance(date_string, str):
+            dates.append(invalid)
+            continue
+
+        if date_string not in converted:
+            try:
+                converted[date_string] = parse_date(date_string, today)
+            except ValueError:
+                converted[date_string] = invalid
+        dates.append(converted[date_string])
+
+    return dates
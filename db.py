@@ -2,16 +2,25 @@
 Classes to handle everything related to the database.
 """
 
+import atexit
 import datetime
+import functools
 import re
 import sqlite3
 import logging
-from os import path
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import dates
 
 
 class QueryData():
 
-    valid_date_regex = r"^([\d]{1,2})-?([\d]{1,2})-?([\d]{4})?$"
+    match_modes = ("exact", "prefix", "substring")
+    like_special_characters = re.compile(r"([\\%_])")
 
     def __init__(
         self, date=None, food_name=None, portion_type=None, servings=None, calories=None
@@ -30,7 +39,7 @@ class QueryData():
             "calories": self.calories,
         }
 
-        logging.info("Created new QueryData instance: %s", self)
+        logging.debug("Created new QueryData instance: %s", self)
 
     def __repr__(self):
         output = []
@@ -44,19 +53,11 @@ class QueryData():
         Converts a string of the form "DD-MM-YYYY" or 'DDMMYYYY' (adding the year
         is optional) to a valid date object. Converting back can simply be done with
         the date.strftime() method.
-        """
-        match = re.match(QueryData.valid_date_regex, date_string)
-        if match:
-            day = int(match.group(1))
-            month = int(match.group(2))
-            year = match.group(3)
-            if year:
-                year = int(year)
-            else:
-                year = datetime.date.today().year
-            return datetime.date(year, month, day)
 
-        raise Exception(f"Invalid date string {date_string}")
+        Dates in the ISO 8601 form "YYYY-MM-DD" used for storage are accepted too.
+        Raises ValueError for any other string. See dates.parse_date().
+        """
+        return dates.parse_date(date_string)
 
     def _parse_date(self, date):
         """
@@ -70,18 +71,7 @@ class QueryData():
         if isinstance(date, datetime.date):
             return date
 
-        entry_date = datetime.date.today()
-
-        if date.lower() == "today":
-            pass
-        elif date.lower() == "tomorrow":
-            entry_date += datetime.date.timedelta(days=1)
-        elif date.lower() == "yesterday":
-            entry_date -= datetime.date.timedelta(days=1)
-        else:
-            entry_date = self.parse_date_string_to_date_object(date)
-
-        return entry_date
+        return dates.parse_date(date)
 
     def get_dict(self):
         """
@@ -91,252 +81,1526 @@ class QueryData():
 
     def get_date_string(self):
         """
-        Return self.date as a string formatted as: "dd-mm-YYYY".
+        Return self.date as an ISO 8601 string formatted as: "YYYY-MM-DD". Dates
+        are stored this way so that they sort chronologically.
         """
-        return self.date.strftime("%d-%m-%Y")
+        return self.date.isoformat()
 
-    def get_query_set_string(self):
+    def _get_query_values(self):
         """
-        Returns contained data as a string which is correctly formatted to be directly
-        passed to SQL to set data in a row.
+        Return the dictionary of get_dict() with dates converted to the strings they
+        are stored as.
         """
-        logging.info("compiling query set string using data: %s", self)
-
-        query_set_list = []
         data = self.get_dict()
-        for key, val in data.items():
-            if isinstance(val, str):
-                query_set_list.append(f"{key} = '{val}'")
-            elif isinstance(val, int):
-                query_set_list.append(f"{key} = {val}")
-            elif isinstance(val, datetime.date):
-                val = val.strftime("%d-%m-%Y")
-                query_set_list.append(f"{key} = '{val}'")
+        if "date" in data:
+            data["date"] = data["date"].isoformat()
+
+        return data
+
+    def get_query_set_clause(self):
+        """
+        Returns contained data as an SQL clause to set data in a row, e.g.
+        "calories = ?, portion_type = ?", together with the list of values to bind
+        to its placeholders.
+        """
+        logging.debug("compiling query set clause using data: %s", self)
+
+        data = self._get_query_values()
+        set_clause = ", ".join(f"{key} = ?" for key in data)
+
+        return set_clause, list(data.values())
+
+    def get_query_match_clause(self, match_mode="exact"):
+        """
+        Returns contained data as an SQL search condition with placeholders, e.g.
+        "food_name = ? AND portion_type = ?", together with the list of values to
+        bind to them. Values are never formatted into the SQL itself, so the same
+        statement is reused from the statement cache for different values.
+
+        match_mode decides how food_name and portion_type are matched:
+            "exact"     - the column equals the value (default)
+            "prefix"    - the column starts with the value, case sensitive
+            "substring" - the column contains the value, case insensitive
+        The remaining columns are always matched exactly. Exact and prefix matches
+        can be answered from an index, substring matches always scan the table.
+        """
+        logging.debug("compiling match clause using data: %s", self)
+
+        if match_mode not in QueryData.match_modes:
+            raise ValueError(f"Invalid match mode {match_mode}")
+
+        conditions = []
+        parameters = []
+        for key, value in self._get_query_values().items():
+            if match_mode == "exact" or key not in ("food_name", "portion_type"):
+                conditions.append(f"{key} = ?")
+                parameters.append(value)
+            elif match_mode == "prefix":
+                # a range instead of LIKE so that the primary key index can be used
+                conditions.append(f"{key} >= ?")
+                parameters.append(value)
+                if value:
+                    conditions.append(f"{key} < ?")
+                    parameters.append(value[:-1] + chr(ord(value[-1]) + 1))
+            else:
+                escaped_value = QueryData.like_special_characters.sub(r"\\\1", value)
+                conditions.append(f"{key} LIKE ? ESCAPE '\\'")
+                parameters.append(f"%{escaped_value}%")
+
+        return " AND ".join(conditions), parameters
+
+
+class RecordRow():
+    """
+    A row of the record table as returned by the ORM. The date is kept as the
+    stored string until it is first accessed.
+    """
+
+    __slots__ = ("_date", "food_name", "portion_type", "servings")
+    columns = ("date", "food_name", "portion_type", "servings")
+
+    def __init__(self, date, food_name, portion_type, servings):
+        self._date = date
+        self.food_name = food_name
+        self.portion_type = portion_type
+        self.servings = servings
+
+    @classmethod
+    def from_cursor(cls, _cursor, row):
+        """
+        Row factory for sqlite3 cursors selecting RecordRow.columns.
+        """
+        return cls(*row)
+
+    @property
+    def date(self):
+        """
+        The date of the entry as a date object, parsed on first access.
+        """
+        if isinstance(self._date, str):
+            self._date = datetime.date.fromisoformat(self._date)
+        return self._date
+
+    def __iter__(self):
+        return iter((self.date, self.food_name, self.portion_type, self.servings))
+
+    def __eq__(self, other):
+        if not isinstance(other, RecordRow):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return (
+            f"RecordRow(date={self.date}, food_name={self.food_name}, "
+            f"portion_type={self.portion_type}, servings={self.servings})"
+        )
+
+    def get_dict(self):
+        """
+        Return the row as a dictionary of the values that are set, in the same form
+        as QueryData.get_dict().
+        """
+        return {
+            key: value for key, value in zip(RecordRow.columns, self)
+            if value is not None
+        }
+
+
+class FoodRow():
+    """
+    A row of the foods table as returned by the ORM.
+    """
+
+    __slots__ = ("food_name", "portion_type", "calories", "total_calories")
+    columns = ("food_name", "portion_type", "calories", "total_calories")
 
-        return ", ".join(query_set_list)
+    def __init__(self, food_name, portion_type, calories, total_calories):
+        self.food_name = food_name
+        self.portion_type = portion_type
+        self.calories = calories
+        self.total_calories = total_calories
 
-    def get_query_match_string(self):
+    @classmethod
+    def from_cursor(cls, _cursor, row):
         """
-        Returns contained data as a string which is correctly formatted to be directly
-        passed to SQL as a search query.
+        Row factory for sqlite3 cursors selecting FoodRow.columns.
         """
-        logging.info("compiling match string using data: %s", self)
+        return cls(*row)
+
+    def __iter__(self):
+        return iter(
+            (self.food_name, self.portion_type, self.calories, self.total_calories)
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, FoodRow):
+            return NotImplemented
+        return tuple(self) == tuple(other)
 
-        output_data = dict(self.data)
-        if output_data["date"]is not None:
-            output_data["date"] = output_data["date"].strftime("%d-%m-%Y")
+    def __hash__(self):
+        return hash(tuple(self))
 
-        match_string = " AND ".join(
-            [
-                f"{key} LIKE '%{value}%'" for key, value in output_data.items()
-                if value is not None
-            ]
+    def __repr__(self):
+        return (
+            f"FoodRow(food_name={self.food_name}, portion_type={self.portion_type}, "
+            f"calories={self.calories}, total_calories={self.total_calories})"
         )
 
-        return match_string
+    def get_dict(self):
+        """
+        Return the row as a dictionary of the values that are set, in the same form
+        as QueryData.get_dict(). total_calories is left out as QueryData has no such
+        field.
+        """
+        return {
+            key: value for key, value in zip(FoodRow.columns[:3], self)
+            if value is not None
+        }
+
+
+ROW_TYPES = {"foods": FoodRow, "record": RecordRow}
+
+
+STATEMENT_CACHE_SIZE = 256
+FOOD_CACHE_SIZE = 4096
+ITER_BATCH_SIZE = 1000
+WRITE_RETRIES = 5
+WRITE_RETRY_BACKOFF = 0.05
+MAX_BATCH_SIZE = 1000
+# above this many changed foods in one transaction the search index is rebuilt
+# on next use instead of being updated food by food
+FOOD_INDEX_UPDATE_LIMIT = 1000
+GROUP_COMMIT_INTERVAL = 0.05
+# seconds between checks whether other connections have written to the database
+CHANGE_CHECK_INTERVAL = 0.1
+
+# applied to every new connection, in this order so that a locked database is
+# already waited on while the journal mode is being set
+DEFAULT_PRAGMAS = {
+    # milliseconds to wait for another process to release a lock
+    "busy_timeout": 5000,
+    # write-ahead logging lets readers and a writer work at the same time
+    "journal_mode": "wal",
+    # in wal mode "normal" only syncs at checkpoints and is still corruption safe
+    "synchronous": "normal",
+    # negative values are in KiB
+    "cache_size": -16000,
+    "mmap_size": 64 * 1024 * 1024,
+}
+
+
+class LRUCache():
+    """
+    Thread safe mapping holding at most `maxsize` entries, evicting the least
+    recently used entry first. Counts cache hits and misses.
+
+    generation changes on every invalidate() and clear(). Passing the generation
+    seen before a value was read to put() drops the value if entries were
+    invalidated in the meantime, as it may be older than the invalidation.
+    """
+
+    missing = object()
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the value stored under key, or LRUCache.missing if there is none.
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return LRUCache.missing
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        """
+        Stores value under key, evicting the least recently used entry if full.
+        Does nothing if generation is given and no longer current.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        """
+        Removes the entries of all given keys.
+        """
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def get_stats(self):
+        """
+        Returns a dictionary with the hit and miss counts and the current size.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+class ConnectionPool():
+    """
+    Keeps long-lived connections to a single database file.
+
+    All writes go through one writer connection which only one thread can hold at a
+    time, while reads are spread over up to `size` reader connections so that readers
+    never have to wait on each other or on the writer.
+
+    Every connection is set up with the given PRAGMA settings, by default the ones
+    of DEFAULT_PRAGMAS. Write-ahead logging lets readers in this and other
+    processes carry on while a write is in progress.
+
+    If trace_callback is given it is called with every SQL statement executed on
+    any of the connections, see sqlite3.Connection.set_trace_callback().
+    Connections are instances of factory, a subclass of sqlite3.Connection.
+    """
+
+    def __init__(
+        self, DB_PATH, size=4, pragmas=None, trace_callback=None,
+        factory=sqlite3.Connection
+    ):
+        self.DB_PATH = DB_PATH
+        self.size = size
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.trace_callback = trace_callback
+        self.factory = factory
+        self.write_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._writer = None
+        self._idle_readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._connections = []
+        # connection only used by has_changed(), and its PRAGMA data_version then
+        self._watcher = None
+        self._watch_lock = threading.Lock()
+        self._data_version = None
+        self._next_change_check = 0.0
+
+    def connect(self):
+        """
+        Open a new connection to the database. Connections are in autocommit mode,
+        transactions are started and ended explicitly by the ORM.
+        """
+        logging.debug("Creating new database connection")
+        connection = sqlite3.connect(
+            self.DB_PATH,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=self.factory,
+        )
+        if self.trace_callback is not None:
+            connection.set_trace_callback(self.trace_callback)
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self._connections.append(connection)
+
+        return connection
+
+    @contextmanager
+    def writer(self):
+        """
+        Hand out the writer connection, blocking until no other thread holds it.
+        """
+        with self.write_lock:
+            if self._writer is None:
+                self._writer = self.connect()
+            yield self._writer
+
+    @contextmanager
+    def reader(self):
+        """
+        Hand out an idle reader connection, opening a new one if fewer than `size`
+        exist and otherwise waiting until one is returned.
+        """
+        # every connection to ":memory:" is its own database, so all access has to
+        # go through the one connection that holds the tables
+        if self.DB_PATH == ":memory:":
+            with self.writer() as connection:
+                yield connection
+            return
+
+        try:
+            connection = self._idle_readers.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_connect = self._reader_count < self.size
+                if can_connect:
+                    self._reader_count += 1
+            if can_connect:
+                connection = self.connect()
+            else:
+                connection = self._idle_readers.get()
+
+        try:
+            yield connection
+        finally:
+            # unless the pool was closed meanwhile, which closed the connection too
+            with self._lock:
+                if connection in self._connections:
+                    self._idle_readers.put(connection)
+
+    def has_changed(self):
+        """
+        Returns whether any connection, including the writer of this pool, has
+        committed to the database since the last check. The first check after the
+        pool was opened returns True.
+
+        This checks PRAGMA data_version on a connection of its own, which neither
+        reads nor writes anything else, so checks never wait on the writer. To
+        keep lookups from going to SQLite every time, it is checked at most every
+        CHANGE_CHECK_INTERVAL seconds and by one thread at a time. In between it
+        returns False, so commits of others are noticed that much later.
+        """
+        if self.DB_PATH == ":memory:":
+            # nothing but this pool can write to its in-memory database
+            return False
+        now = time.monotonic()
+        if now < self._next_change_check:
+            return False
+        if not self._watch_lock.acquire(blocking=False):
+            return False
+        try:
+            if self._watcher is None:
+                self._watcher = self.connect()
+            data_version = self._watcher.execute("PRAGMA data_version").fetchone()[0]
+            changed = data_version != self._data_version
+            self._data_version = data_version
+            self._next_change_check = now + CHANGE_CHECK_INTERVAL
+            return changed
+        finally:
+            self._watch_lock.release()
+
+    def close(self):
+        """
+        Close every connection in the pool. The pool can still be used afterwards,
+        in which case new connections are opened as needed.
+        """
+        logging.info("Closing all database connections")
+        with self.write_lock, self._watch_lock, self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+            self._watcher = None
+            self._data_version = None
+            self._next_change_check = 0.0
+            self._writer = None
+            self._idle_readers = queue.LifoQueue()
+            self._reader_count = 0
+
+
+SCHEMA_VERSION = 5
+TABLE_NAMES = ("foods", "record")
+# user the rows of databases from before profiles existed belong to
+DEFAULT_USER = "default"
+
+
+def group_committed(method):
+    """
+    Decorator for ORM write methods. In group commit mode a call is queued on the
+    ORM's BatchWriter and returns None right away, unless it is made from inside a
+    transaction, in which case it joins that transaction as usual.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if (
+            self.batch_writer is not None
+            and self._transaction_owner != threading.get_ident()
+        ):
+            self.batch_writer.submit(method, self, *args, **kwargs)
+            return None
+
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def chain_callbacks(callbacks):
+    """
+    Returns a function calling each of callbacks with its arguments, the only
+    callback if there is one, or None if there are none.
+    """
+    if len(callbacks) <= 1:
+        return callbacks[0] if callbacks else None
+
+    def chained(*args):
+        for callback in callbacks:
+            callback(*args)
+
+    return chained
+
+
+# flag of generator functions in their code object, inspect.CO_GENERATOR without
+# importing inspect and its start up time
+GENERATOR_FLAG = 0x20
+
+
+def instrumented(method):
+    """
+    Decorator for ORM operations. If the ORM collects metrics, every call is timed
+    and counted under the name of the method, along with the SQL statements it runs
+    and the rows it returns. Otherwise it costs no more than an attribute lookup.
+
+    Goes below group_committed, so that queued writes are timed when they run.
+    """
+    name = method.__name__
+    if method.__code__.co_flags & GENERATOR_FLAG:
+        @functools.wraps(method)
+        def generator_wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+
+            return self.metrics.time_iterator(name, method(self, *args, **kwargs))
+
+        return generator_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.metrics is None:
+            return method(self, *args, **kwargs)
+
+        start_time = self.metrics.start(name)
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException:
+            self.metrics.finish(name, start_time, failed=True)
+            raise
+
+        rows_read = len(result) if isinstance(result, list) else 0
+        self.metrics.finish(name, start_time, rows_read)
+        return result
+
+    return wrapper
 
 
 class CalorieCounterORM():
     """
     ORM to handle the database.
+
+    Connections are kept open between calls. Every write runs inside a transaction
+    which is committed when the outermost `transaction()` block ends, so several
+    writes can be batched into a single commit:
+
+        with CalorieCounterORM(DB_PATH) as orm:
+            with orm.transaction():
+                orm.add_row_to_table("record", entry_1)
+                orm.add_row_to_table("record", entry_2)
+
+    Passing persistent=False restores the old behaviour of closing the connections
+    after every commit.
+
+    With group_commit=True writes are queued in memory instead, and written by a
+    background thread in a single transaction once group_commit_size writes are
+    queued or group_commit_interval seconds have passed. Queued writes are not
+    visible to reads until they are written; flush() writes them right away and
+    waits for the commit. Queued writes are also flushed by close() and when the
+    interpreter exits.
+
+    With collect_metrics=True the latency, SQL statements and rows of every
+    operation are recorded, see get_metrics(). A profiling.SQLProfiler passed as
+    sql_profiler times every SQL statement.
+
+    Every row belongs to a user, and an ORM only ever reads and writes the rows of
+    its user_id, so each user has their own foods, record and summaries. user_id
+    leads every key and index, so the queries of one user don't get slower as more
+    users share the database. Open one ORM per user to work with several of them.
     """
 
-    valid_date_regex = r"^([\d]{1,2})-?([\d]{1,2})-?([\d]{4})?$"
+    def __init__(
+        self, DB_PATH, persistent=True, pool_size=4, food_cache_size=FOOD_CACHE_SIZE,
+        pragmas=None, write_retries=WRITE_RETRIES, group_commit=False,
+        group_commit_size=MAX_BATCH_SIZE, group_commit_interval=GROUP_COMMIT_INTERVAL,
+        collect_metrics=False, sql_profiler=None, user_id=DEFAULT_USER
+    ):
+        if not user_id:
+            raise ValueError("user_id must not be empty")
 
-    def __init__(self, DB_PATH):
         self.DB_PATH = DB_PATH
-        self.db_connection = None
-        if not path.exists(self.DB_PATH):
-            self.create_db_and_tables()
+        self.user_id = user_id
+        self.persistent = persistent
+        self.write_retries = write_retries
+        self.metrics = None
+        if collect_metrics:
+            import metrics  # pylint: disable=import-outside-toplevel
+            self.metrics = metrics.Metrics()
+        trace_callbacks = []
+        if self.metrics is not None:
+            trace_callbacks.append(self.metrics.trace_statement)
+        factory = sqlite3.Connection
+        if sql_profiler is not None:
+            trace_callbacks.append(sql_profiler.trace_statement)
+            factory = sql_profiler.connection_factory
+        self.pool = ConnectionPool(
+            DB_PATH, size=pool_size, pragmas=pragmas,
+            trace_callback=chain_callbacks(trace_callbacks), factory=factory,
+        )
+        self.food_cache = LRUCache(food_cache_size)
+        self._transaction_owner = None
+        self._transaction_depth = 0
+        self._invalidated_foods = set()
+        self._food_index = None
+        self._recorded_foods = set()
+        self._food_index_outdated = False
+        self.batch_writer = None
+        self.create_db_and_tables()
+
+        if group_commit:
+            self.batch_writer = BatchWriter(
+                self, max_batch_size=group_commit_size, max_delay=group_commit_interval
+            )
+            atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Write any queued writes and close all connections to the database.
+        """
+        if self.batch_writer is not None:
+            self.batch_writer.close()
+            self.batch_writer = None
+            atexit.unregister(self.close)
+        self.pool.close()
 
-    def get_or_create_db_cursor(self):
+    def flush(self):
         """
-        Returns a cursor of the database connection. If one already exists then return
-        it, if not then create a new one and return that.
+        In group commit mode, writes all queued writes and waits until they have
+        been committed. Does nothing otherwise.
         """
-        if self.db_connection is None:
-            logging.info("Creating new database connection")
-            self.db_connection = sqlite3.connect(self.DB_PATH)
+        if self.batch_writer is not None:
+            self.batch_writer.flush()
 
-        logging.info("Supplying cursor to database connection")
-        cursor = self.db_connection.cursor()
+    @contextmanager
+    def transaction(self):
+        """
+        Yields a cursor on the writer connection inside a transaction. Nested blocks
+        join the enclosing transaction, which is committed when the outermost block
+        exits and rolled back if it raises.
+        """
+        with self.pool.writer() as connection:
+            if self._transaction_depth == 0:
+                self._begin_transaction(connection)
+                self._transaction_owner = threading.get_ident()
+            self._transaction_depth += 1
+
+            try:
+                yield connection.cursor()
+            except BaseException:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    logging.info("Rolling back transaction")
+                    self._transaction_owner = None
+                    connection.rollback()
+                    # values read inside the transaction may have been cached
+                    self.food_cache.clear()
+                    self._invalidated_foods.clear()
+                    # the search index may have been built from uncommitted rows
+                    self._food_index = None
+                    self._recorded_foods.clear()
+                    self._food_index_outdated = False
+                raise
+
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._transaction_owner = None
+                self.commit_changes()
+                # other threads may have cached the old values of changed foods
+                # before the commit made the new ones visible to them
+                self.food_cache.invalidate(self._invalidated_foods)
+                self._update_food_index(self._invalidated_foods | self._recorded_foods)
+                self._invalidated_foods.clear()
+                self._recorded_foods.clear()
+
+    def _begin_transaction(self, connection):
+        """
+        Starts a write transaction, taking the database write lock right away. If
+        another process still holds the lock once busy_timeout has run out, this is
+        retried up to write_retries times with exponential backoff.
+        """
+        logging.debug("Beginning transaction")
+        for attempt in range(self.write_retries + 1):
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == self.write_retries:
+                    raise
+                import random  # pylint: disable=import-outside-toplevel
+                delay = WRITE_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+                logging.warning("Database is locked, retrying in %.2fs", delay)
+                time.sleep(delay)
+
+    def _invalidate_foods(self, foods):
+        """
+        Removes the given (food_name, portion_type) keys from the food cache, both
+        now and again once the current transaction has been committed.
+        """
+        self.food_cache.invalidate(foods)
+        self._invalidated_foods.update(foods)
 
-        return cursor
+    def _count_rows_written(self, cursor):
+        """
+        Counts the rows changed by the last statement on cursor as written by the
+        current operation, if metrics are collected.
+        """
+        if self.metrics is not None:
+            self.metrics.count_rows_written(cursor.rowcount)
+
+    def get_metrics(self):
+        """
+        Returns the metrics.Metrics collected so far, including the hit counts of the
+        food cache, or None if the ORM does not collect metrics.
+        """
+        if self.metrics is not None:
+            self.metrics.set_cache_stats("food", self.food_cache.get_stats())
+
+        return self.metrics
+
+    @contextmanager
+    def read_cursor(self):
+        """
+        Yields a cursor for reading. Inside a transaction this is a cursor on the
+        writer connection so that uncommitted changes are visible, otherwise it is a
+        cursor on one of the pooled reader connections.
+        """
+        if self._transaction_owner == threading.get_ident():
+            with self.pool.writer() as connection:
+                yield connection.cursor()
+        else:
+            with self.pool.reader() as connection:
+                yield connection.cursor()
 
     def commit_changes(self):
         """
-        Commits any changes and closes the database connection.
+        Commits any pending changes. Unless the ORM is persistent the database
+        connections are closed afterwards.
+        """
+        with self.pool.writer() as connection:
+            if self._transaction_depth:
+                raise Exception("Cannot commit from inside a transaction block")
+            if connection.in_transaction:
+                logging.debug("Committing changes")
+                connection.commit()
+
+        if not self.persistent:
+            self.pool.close()
+
+    def get_schema_version(self):
         """
-        logging.info("Committing changes and closing database connection")
-        self.db_connection.commit()
-        self.db_connection.close()
-        self.db_connection = None
+        Returns the schema version of the database, stored in its user_version.
+        Databases created before the schema was versioned report version 0.
+        """
+        with self.read_cursor() as cursor:
+            cursor.execute("PRAGMA user_version")
+            return cursor.fetchone()[0]
 
     def create_db_and_tables(self):
         """
-        Creates the database with the two separate tables.
+        Creates the database tables, or migrates the tables of an existing database
+        to the current SCHEMA_VERSION. Each migration brings the schema up by one
+        version, so a new database simply runs all of them.
         """
-        cursor = self.get_or_create_db_cursor()
+        # checked on the writer connection, which nearly every caller needs anyway,
+        # so that a single write from the command line opens just one connection
+        with self.pool.writer() as connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                return
+
+        migrations = [
+            self._migrate_to_v1,
+            self._migrate_to_v2,
+            self._migrate_to_v3,
+            self._migrate_to_v4,
+            self._migrate_to_v5,
+        ]
+
+        with self.transaction() as cursor:
+            # re-read inside the transaction in case another process migrated first
+            cursor.execute("PRAGMA user_version")
+            version = cursor.fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
+
+            for migration in migrations[version:]:
+                logging.info("Migrating database to %s", migration.__name__)
+                migration(cursor)
+
+            # the summary triggers always follow the current schema, so they are
+            # recreated and the summaries recomputed after any migration
+            self._create_summary_triggers(cursor)
+            cursor.execute("DELETE FROM daily_summary")
+            self._populate_daily_summary(cursor)
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
-        logging.info("Creating new database and tables")
+    def _migrate_to_v1(self, cursor):
+        """
+        Adds primary keys to both tables and an index on record.date. Legacy tables
+        without keys are copied over, merging duplicate rows on the way.
+        """
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS record (
-                date text,
-                food_name text,
-                portion_type text,
-                servings integer
+            CREATE TABLE foods_v1 (
+                food_name text NOT NULL,
+                portion_type text NOT NULL DEFAULT '',
+                calories integer,
+                PRIMARY KEY (food_name, portion_type)
             )
             """
         )
+        # food_name leads the key so that it also serves lookups by food, date
+        # ranges are covered by record_date_index instead
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS foods (
-                food_name text,
-                portion_type text,
-                calories integer
+            CREATE TABLE record_v1 (
+                date text NOT NULL,
+                food_name text NOT NULL,
+                portion_type text NOT NULL DEFAULT '',
+                servings integer NOT NULL DEFAULT 1,
+                PRIMARY KEY (food_name, portion_type, date)
             )
             """
         )
 
-        self.commit_changes()
+        cursor.execute(
+            """
+            SELECT name
+            FROM sqlite_master
+            WHERE type = 'table' AND name IN ('foods', 'record')
+            """
+        )
+        legacy_tables = {row[0] for row in cursor.fetchall()}
+        if "foods" in legacy_tables:
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO foods_v1
+                SELECT food_name, coalesce(portion_type, ''), calories
+                FROM foods
+                WHERE food_name IS NOT NULL
+                ORDER BY rowid
+                """
+            )
+            cursor.execute("DROP TABLE foods")
+        if "record" in legacy_tables:
+            cursor.execute(
+                """
+                INSERT INTO record_v1
+                SELECT
+                    date,
+                    food_name,
+                    coalesce(portion_type, ''),
+                    sum(coalesce(servings, 1))
+                FROM record
+                WHERE date IS NOT NULL AND food_name IS NOT NULL
+                GROUP BY date, food_name, coalesce(portion_type, '')
+                """
+            )
+            cursor.execute("DROP TABLE record")
+
+        cursor.execute("ALTER TABLE foods_v1 RENAME TO foods")
+        cursor.execute("ALTER TABLE record_v1 RENAME TO record")
+        cursor.execute("CREATE INDEX record_date_index ON record (date)")
 
-    def get_rows_from_table(self, table_name, match_data):
+    def _migrate_to_v2(self, cursor):
         """
-        Retrieve all entries from specified table that fits the match_data. Always
-        returns a list of none or more QueryData instances.
+        Converts record dates from "DD-MM-YYYY" to ISO 8601 "YYYY-MM-DD" strings,
+        which sort chronologically and so allow range scans on record_date_index.
+        """
+        cursor.execute(
+            """
+            UPDATE record
+            SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' ||
+                substr(date, 1, 2)
+            WHERE date GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]'
+            """
+        )
 
-        Supplying no match_data is a valid search, in that case we return the entire
-        table.
+    def _migrate_to_v3(self, cursor):
+        """
+        Adds the daily_summary table holding the total calories of every recorded
+        day. The triggers of _create_summary_triggers() keep it up to date on every
+        change to record or foods, so summaries never have to be aggregated from
+        record when they are read.
         """
-        cursor = self.get_or_create_db_cursor()
+        cursor.execute(
+            """
+            CREATE TABLE daily_summary (
+                date text PRIMARY KEY,
+                calories integer NOT NULL DEFAULT 0
+            )
+            """
+        )
 
-        logging.info(
-            "Getting rows from %s table that match %s", table_name, match_data
+    def _migrate_to_v4(self, cursor):
+        """
+        Adds composite foods. food_ingredients holds an edge for every ingredient of
+        a food, and foods.total_calories caches the fully expanded calories of each
+        food: its own calories plus those of all its ingredients.
+        """
+        cursor.execute(
+            """
+            ALTER TABLE foods
+            ADD COLUMN total_calories integer NOT NULL DEFAULT 0
+            """
+        )
+        cursor.execute("UPDATE foods SET total_calories = coalesce(calories, 0)")
+        cursor.execute(
+            """
+            CREATE TABLE food_ingredients (
+                food_name text NOT NULL,
+                portion_type text NOT NULL DEFAULT '',
+                ingredient_name text NOT NULL,
+                ingredient_portion_type text NOT NULL DEFAULT '',
+                servings integer NOT NULL DEFAULT 1,
+                PRIMARY KEY (
+                    food_name, portion_type, ingredient_name, ingredient_portion_type
+                )
+            )
+            """
+        )
+        # the reverse edges, to find every food that uses a changed ingredient
+        cursor.execute(
+            """
+            CREATE INDEX food_ingredients_ingredient_index
+            ON food_ingredients (ingredient_name, ingredient_portion_type)
+            """
         )
 
-        match_string = match_data.get_query_match_string()
+    def _migrate_to_v5(self, cursor):
+        """
+        Adds user profiles. Every table gets a user_id column leading its primary
+        key, and record_date_index becomes an index on (user_id, date), so the rows
+        of one user are always found by a range scan of their own. Existing rows
+        are given to DEFAULT_USER.
+
+        SQLite can't change the primary key of a table, so the tables are copied.
+        """
+        # the triggers refer to the tables being replaced, they are recreated
+        # after the migration
+        self._drop_summary_triggers(cursor)
+
+        cursor.execute(
+            """
+            CREATE TABLE foods_v5 (
+                user_id text NOT NULL,
+                food_name text NOT NULL,
+                portion_type text NOT NULL DEFAULT '',
+                calories integer,
+                total_calories integer NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, food_name, portion_type)
+            )
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE record_v5 (
+                user_id text NOT NULL,
+                date text NOT NULL,
+                food_name text NOT NULL,
+                portion_type text NOT NULL DEFAULT '',
+                servings integer NOT NULL DEFAULT 1,
+                PRIMARY KEY (user_id, food_name, portion_type, date)
+            )
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE daily_summary_v5 (
+                user_id text NOT NULL,
+                date text NOT NULL,
+                calories integer NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, date)
+            )
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE food_ingredients_v5 (
+                user_id text NOT NULL,
+                food_name text NOT NULL,
+                portion_type text NOT NULL DEFAULT '',
+                ingredient_name text NOT NULL,
+                ingredient_portion_type text NOT NULL DEFAULT '',
+                servings integer NOT NULL DEFAULT 1,
+                PRIMARY KEY (
+                    user_id, food_name, portion_type, ingredient_name,
+                    ingredient_portion_type
+                )
+            )
+            """
+        )
+
+        # the summaries are recomputed after the migration anyway
+        columns = {
+            "foods": "food_name, portion_type, calories, total_calories",
+            "record": "date, food_name, portion_type, servings",
+            "food_ingredients": (
+                "food_name, portion_type, ingredient_name, ingredient_portion_type, "
+                "servings"
+            ),
+        }
+        for table_name, table_columns in columns.items():
+            cursor.execute(
+                f"""
+                INSERT INTO {table_name}_v5 (user_id, {table_columns})
+                SELECT ?, {table_columns}
+                FROM {table_name}
+                """,
+                (DEFAULT_USER,),
+            )
+        for table_name in ("foods", "record", "daily_summary", "food_ingredients"):
+            cursor.execute(f"DROP TABLE {table_name}")
+            cursor.execute(f"ALTER TABLE {table_name}_v5 RENAME TO {table_name}")
+
+        cursor.execute("CREATE INDEX record_date_index ON record (user_id, date)")
+        cursor.execute(
+            """
+            CREATE INDEX food_ingredients_ingredient_index
+            ON food_ingredients (user_id, ingredient_name, ingredient_portion_type)
+            """
+        )
+
+    @staticmethod
+    def _drop_summary_triggers(cursor):
+        """
+        Drops the triggers created by _create_summary_triggers().
+        """
         cursor.execute(
-            f"""
-            SELECT *
-            FROM {table_name}
-            WHERE {match_string}
+            """
+            SELECT name
+            FROM sqlite_master
+            WHERE type = 'trigger' AND name LIKE '%_summary'
             """
         )
-        rows = cursor.fetchall()
+        for (trigger_name,) in cursor.fetchall():
+            cursor.execute(f"DROP TRIGGER {trigger_name}")
+
+    @classmethod
+    def _create_summary_triggers(cls, cursor):
+        """
+        (Re)creates the triggers which keep daily_summary in sync with record and
+        foods. Rows only ever affect the summaries of their own user.
+        """
+        cls._drop_summary_triggers(cursor)
 
-        query_results = []
-        if table_name == "foods":
-            for row in rows:
-                query_data = QueryData(
-                    food_name=row[0],
-                    portion_type=row[1],
-                    calories=row[2]
+        # changes to record only ever touch the days of the changed rows
+        cursor.execute(
+            """
+            CREATE TRIGGER record_insert_summary AFTER INSERT ON record
+            BEGIN
+                INSERT INTO daily_summary (user_id, date, calories)
+                VALUES (
+                    NEW.user_id,
+                    NEW.date,
+                    NEW.servings * coalesce((
+                        SELECT total_calories
+                        FROM foods
+                        WHERE
+                            user_id = NEW.user_id AND
+                            food_name = NEW.food_name AND
+                            portion_type = NEW.portion_type
+                    ), 0)
                 )
-                query_results.append(query_data.get_dict())
-        elif table_name == "record":
-            for row in rows:
-                query_data = QueryData(
-                    date=row[0],
-                    food_name=row[1],
-                    portion_type=row[2],
-                    servings=row[3]
+                ON CONFLICT (user_id, date)
+                DO UPDATE SET calories = calories + excluded.calories;
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER record_update_summary AFTER UPDATE ON record
+            BEGIN
+                UPDATE daily_summary
+                SET calories = calories - OLD.servings * coalesce((
+                    SELECT total_calories
+                    FROM foods
+                    WHERE
+                        user_id = OLD.user_id AND
+                        food_name = OLD.food_name AND
+                        portion_type = OLD.portion_type
+                ), 0)
+                WHERE user_id = OLD.user_id AND date = OLD.date;
+                INSERT INTO daily_summary (user_id, date, calories)
+                VALUES (
+                    NEW.user_id,
+                    NEW.date,
+                    NEW.servings * coalesce((
+                        SELECT total_calories
+                        FROM foods
+                        WHERE
+                            user_id = NEW.user_id AND
+                            food_name = NEW.food_name AND
+                            portion_type = NEW.portion_type
+                    ), 0)
                 )
-                query_results.append(query_data.get_dict())
+                ON CONFLICT (user_id, date)
+                DO UPDATE SET calories = calories + excluded.calories;
+                DELETE FROM daily_summary
+                WHERE
+                    user_id = OLD.user_id AND
+                    date = OLD.date AND
+                    NOT EXISTS (
+                        SELECT 1 FROM record
+                        WHERE user_id = OLD.user_id AND date = OLD.date
+                    );
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER record_delete_summary AFTER DELETE ON record
+            BEGIN
+                UPDATE daily_summary
+                SET calories = calories - OLD.servings * coalesce((
+                    SELECT total_calories
+                    FROM foods
+                    WHERE
+                        user_id = OLD.user_id AND
+                        food_name = OLD.food_name AND
+                        portion_type = OLD.portion_type
+                ), 0)
+                WHERE user_id = OLD.user_id AND date = OLD.date;
+                DELETE FROM daily_summary
+                WHERE
+                    user_id = OLD.user_id AND
+                    date = OLD.date AND
+                    NOT EXISTS (
+                        SELECT 1 FROM record
+                        WHERE user_id = OLD.user_id AND date = OLD.date
+                    );
+            END
+            """
+        )
 
-        return query_results
+        # a change to a food recalculates every day on which that food was recorded
+        for event, food in [
+            ("INSERT", "NEW"), ("DELETE", "OLD"), ("UPDATE", "OLD"), ("UPDATE", "NEW")
+        ]:
+            columns = (
+                " OF total_calories, user_id, food_name, portion_type"
+                * (event == "UPDATE")
+            )
+            cursor.execute(
+                f"""
+                CREATE TRIGGER foods_{event.lower()}_{food.lower()}_summary
+                AFTER {event}{columns} ON foods
+                BEGIN
+                    UPDATE daily_summary
+                    SET calories = (
+                        SELECT total(record.servings * foods.total_calories)
+                        FROM record
+                        JOIN foods
+                            ON foods.user_id = record.user_id
+                            AND foods.food_name = record.food_name
+                            AND foods.portion_type = record.portion_type
+                        WHERE
+                            record.user_id = daily_summary.user_id AND
+                            record.date = daily_summary.date
+                    )
+                    WHERE user_id = {food}.user_id AND date IN (
+                        SELECT date
+                        FROM record
+                        WHERE
+                            user_id = {food}.user_id AND
+                            food_name = {food}.food_name AND
+                            portion_type = {food}.portion_type
+                    );
+                END
+                """
+            )
 
-    def add_row_to_table(self, table_name, new_data):
+    @staticmethod
+    def _populate_daily_summary(cursor, user_id=None):
         """
-        Adds new_data to the specified table.
+        Fills daily_summary by aggregating the record table, for every user or only
+        for user_id. The summaries being filled must have been deleted first.
         """
-        cursor = self.get_or_create_db_cursor()
+        where_clause = "" if user_id is None else "WHERE record.user_id = ?"
+        cursor.execute(
+            f"""
+            INSERT INTO daily_summary (user_id, date, calories)
+            SELECT
+                record.user_id,
+                record.date,
+                total(record.servings * foods.total_calories)
+            FROM record
+            LEFT JOIN foods
+                ON foods.user_id = record.user_id
+                AND foods.food_name = record.food_name
+                AND foods.portion_type = record.portion_type
+            {where_clause}
+            GROUP BY record.user_id, record.date
+            """,
+            () if user_id is None else (user_id,),
+        )
 
-        if not new_data.food_name:
-            logging.warn("No food_name given")
-            return
+    def _get_where_clause(self, table_name, match_data, match_mode):
+        """
+        Returns the WHERE clause matching the rows of the user that match
+        match_data, and the parameters to bind to it. No match_data, or match_data
+        without any values, matches every row of the user.
+        """
+        if table_name not in TABLE_NAMES:
+            raise ValueError(f"Invalid table name {table_name}")
 
-        match_dict = new_data.get_dict()
-        match_dict['servings'] = None
-        match_data = QueryData(**match_dict)
+        if match_data is None or not match_data.get_dict():
+            return "WHERE user_id = ?", [self.user_id]
 
-        if table_name == "record":
-            record_entries = self.get_rows_from_table(
-                "record",
-                match_data
-            )
+        match_clause, parameters = match_data.get_query_match_clause(match_mode)
 
-            if len(record_entries) > 1:
-                raise Exception("More than one matching entry on record")
-                return
+        return f"WHERE user_id = ? AND {match_clause}", [self.user_id] + parameters
 
-            # increment servings count if entry already exists in the database
-            if record_entries:
-                logging.info(
-                    "Food already exists at this date, incrementing servings count"
-                )
+    @instrumented
+    def get_rows_from_table(self, table_name, match_data=None, match_mode="exact"):
+        """
+        Retrieve all entries from specified table that fits the match_data. Always
+        returns a list of none or more FoodRow or RecordRow instances.
+
+        Supplying no match_data is a valid search, in that case we return the entire
+        table. See QueryData.get_query_match_clause() for the match modes.
+        """
+        logging.info(
+            "Getting rows from %s table that match %s", table_name, match_data
+        )
 
-                record_entry = record_entries[0]
-                record_entry['servings'] += new_data.servings
-                update_data = QueryData(**record_entry)
+        # lookups of a single food are answered from the food cache
+        if (
+            table_name == "foods" and match_mode == "exact" and match_data is not None
+            and match_data.get_dict().keys() == {"food_name", "portion_type"}
+        ):
+            food = self.get_food(match_data.food_name, match_data.portion_type)
+            return [food] if food else []
+
+        with self.read_cursor() as cursor:
+            self._select_rows(cursor, table_name, match_data, match_mode)
+            return cursor.fetchall()
+
+    @instrumented
+    def iter_rows(
+        self, table_name, match_data=None, batch_size=ITER_BATCH_SIZE,
+        match_mode="exact"
+    ):
+        """
+        Generator version of get_rows_from_table() which fetches batch_size rows at a
+        time, so memory use stays the same no matter how many rows match.
 
-                self.update_row_in_table(
-                    "record",
-                    update_data,
-                    match_data
-                )
-                return
+        The generator holds on to a database connection until it is exhausted or
+        closed.
+        """
+        logging.info(
+            "Iterating over rows from %s table that match %s", table_name, match_data
+        )
+
+        with self.read_cursor() as cursor:
+            self._select_rows(cursor, table_name, match_data, match_mode)
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                yield from rows
+                rows = cursor.fetchmany(batch_size)
+
+    def _select_rows(self, cursor, table_name, match_data, match_mode):
+        """
+        Executes the query for the rows of table_name matching match_data on
+        cursor, which then produces FoodRow or RecordRow instances.
+        """
+        where_clause, parameters = self._get_where_clause(
+            table_name, match_data, match_mode
+        )
+        row_type = ROW_TYPES[table_name]
 
+        cursor.row_factory = row_type.from_cursor
+        cursor.execute(
+            f"""
+            SELECT {", ".join(row_type.columns)}
+            FROM {table_name}
+            {where_clause}
+            """,
+            parameters,
+        )
+
+    @instrumented
+    def get_records_between(self, start, end):
+        """
+        Retrieve all record entries from start to end, both inclusive, as a list of
+        RecordRow instances ordered by date. start and end can be anything accepted
+        as a QueryData date. This is a single range scan over record_date_index.
+        """
+        start_date = QueryData(date=start).get_date_string()
+        end_date = QueryData(date=end).get_date_string()
+        logging.info("Getting record entries between %s and %s", start_date, end_date)
+
+        with self.read_cursor() as cursor:
+            cursor.row_factory = RecordRow.from_cursor
             cursor.execute(
                 """
-                INSERT INTO record
-                VALUES (
-                    :date,
-                    :food_name,
-                    :portion_type,
-                    :servings
-                )
+                SELECT date, food_name, portion_type, servings
+                FROM record
+                WHERE user_id = ? AND date BETWEEN ? AND ?
+                ORDER BY date
                 """,
-                {
-                    "date": new_data.get_date_string(),
-                    "food_name": new_data.food_name,
-                    "portion_type": new_data.portion_type,
-                    "servings": new_data.servings,
-                },
+                (self.user_id, start_date, end_date),
             )
+            return cursor.fetchall()
 
-        elif table_name == "foods":
-            match_data = QueryData(
-                new_data.food_name,
-                new_data.portion_type
-            )
-            food_exists = self.get_rows_from_table(
-                "foods",
-                match_data
-            )
-            if food_exists:
-                logging.warn("Food already exists in database")
-                return
+    @instrumented
+    def daily_totals(self, start, end):
+        """
+        Yields (date, calories) tuples for every day from start to end, both
+        inclusive, on which anything was recorded. start and end can be anything
+        accepted as a QueryData date.
+
+        Totals are read from the daily_summary table, which is kept up to date on
+        every write, so this only reads one row per day. Entries of foods that are
+        missing from the foods table count as 0 calories.
+        """
+        start_date = QueryData(date=start).get_date_string()
+        end_date = QueryData(date=end).get_date_string()
+        logging.info("Getting daily totals between %s and %s", start_date, end_date)
 
+        with self.read_cursor() as cursor:
             cursor.execute(
                 """
-                INSERT INTO foods
-                VALUES (
-                    :food_name,
-                    :portion_type,
-                    :calories
-                )
+                SELECT date, calories
+                FROM daily_summary
+                WHERE user_id = ? AND date BETWEEN ? AND ?
+                ORDER BY date
                 """,
-                {
-                    "food_name": new_data.food_name,
-                    "portion_type": new_data.portion_type,
-                    "calories": new_data.calories,
-                },
+                (self.user_id, start_date, end_date),
+            )
+            for date_string, calories in cursor:
+                yield datetime.date.fromisoformat(date_string), calories
+
+    @instrumented
+    def rebuild_summaries(self):
+        """
+        Recomputes the daily summaries of the user from scratch. Returns the sorted
+        list of dates whose stored totals differed from the recomputed ones, which
+        should always be empty.
+
+        In group commit mode the queued writes are flushed first, so that they are
+        part of the rebuilt summaries.
+        """
+        if self._transaction_owner != threading.get_ident():
+            self.flush()
+
+        logging.info("Rebuilding daily summaries of %s", self.user_id)
+
+        with self.transaction() as cursor:
+            select_totals = "SELECT date, calories FROM daily_summary WHERE user_id = ?"
+            cursor.execute(select_totals, (self.user_id,))
+            stored_totals = dict(cursor.fetchall())
+            cursor.execute(
+                "DELETE FROM daily_summary WHERE user_id = ?", (self.user_id,)
             )
+            self._populate_daily_summary(cursor, self.user_id)
+            cursor.execute(select_totals, (self.user_id,))
+            rebuilt_totals = dict(cursor.fetchall())
+
+        return sorted(
+            datetime.date.fromisoformat(date_string)
+            for date_string in stored_totals.keys() | rebuilt_totals.keys()
+            if stored_totals.get(date_string) != rebuilt_totals.get(date_string)
+        )
 
-        self.commit_changes()
+    @group_committed
+    @instrumented
+    def add_row_to_table(self, table_name, new_data):
+        """
+        Adds new_data to the specified table. An omitted portion type is stored as an
+        empty string and omitted servings default to 1.
 
-    def delete_rows_in_table(self, table_name, match_data):
+        Adding a record entry that already exists for that date increments its
+        servings count, adding a food that already exists does nothing. Returns
+        whether a row was written, or None in group commit mode.
+        """
+        if not new_data.food_name:
+            logging.warning("No food_name given")
+            return False
+
+        portion_type = new_data.portion_type or ""
+        servings = 1 if new_data.servings is None else new_data.servings
+
+        with self.transaction() as cursor:
+            if table_name == "record":
+                cursor.execute(
+                    """
+                    INSERT INTO record (
+                        user_id, date, food_name, portion_type, servings
+                    )
+                    VALUES (:user_id, :date, :food_name, :portion_type, :servings)
+                    ON CONFLICT (user_id, date, food_name, portion_type)
+                    DO UPDATE SET servings = servings + excluded.servings
+                    """,
+                    {
+                        "user_id": self.user_id,
+                        "date": new_data.get_date_string(),
+                        "food_name": new_data.food_name,
+                        "portion_type": portion_type,
+                        "servings": servings,
+                    },
+                )
+                self._count_rows_written(cursor)
+                self._recorded_foods.add((new_data.food_name, portion_type))
+                return True
+
+            elif table_name == "foods":
+                cursor.execute(
+                    """
+                    INSERT INTO foods (user_id, food_name, portion_type, calories)
+                    VALUES (:user_id, :food_name, :portion_type, :calories)
+                    ON CONFLICT (user_id, food_name, portion_type) DO NOTHING
+                    """,
+                    {
+                        "user_id": self.user_id,
+                        "food_name": new_data.food_name,
+                        "portion_type": portion_type,
+                        "calories": new_data.calories,
+                    },
+                )
+                self._count_rows_written(cursor)
+                if not cursor.rowcount:
+                    logging.warning("Food already exists in database")
+                    return False
+
+                self._refresh_food_totals(
+                    cursor, [(new_data.food_name, portion_type)]
+                )
+                return True
+
+        return False
+
+    @group_committed
+    @instrumented
+    def add_rows_to_table(self, table_name, new_rows):
+        """
+        Bulk version of add_row_to_table() which adds every QueryData instance in the
+        new_rows iterable in a single transaction.
+
+        Duplicates within new_rows are merged in memory first: servings of record
+        entries for the same date, food and portion type are summed, and only the
+        first of several identical foods is kept. The merged rows are then written
+        with a single executemany() call.
+        """
+        merged_rows = {}
+        for new_data in new_rows:
+            if not new_data.food_name:
+                logging.warning("No food_name given")
+                continue
+
+            portion_type = new_data.portion_type or ""
+            if table_name == "record":
+                key = (new_data.get_date_string(), new_data.food_name, portion_type)
+                servings = 1 if new_data.servings is None else new_data.servings
+                merged_rows[key] = merged_rows.get(key, 0) + servings
+            elif table_name == "foods":
+                key = (new_data.food_name, portion_type)
+                merged_rows.setdefault(key, new_data.calories)
+
+        logging.info(
+            "Adding %s merged rows to %s table", len(merged_rows), table_name
+        )
+        if not merged_rows:
+            return
+
+        with self.transaction() as cursor:
+            if table_name == "record":
+                cursor.executemany(
+                    """
+                    INSERT INTO record (
+                        user_id, date, food_name, portion_type, servings
+                    )
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, date, food_name, portion_type)
+                    DO UPDATE SET servings = servings + excluded.servings
+                    """,
+                    (
+                        (self.user_id,) + key + (servings,)
+                        for key, servings in merged_rows.items()
+                    ),
+                )
+                self._count_rows_written(cursor)
+                self._recorded_foods.update(key[1:] for key in merged_rows)
+            elif table_name == "foods":
+                cursor.executemany(
+                    """
+                    INSERT INTO foods (user_id, food_name, portion_type, calories)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id, food_name, portion_type) DO NOTHING
+                    """,
+                    (
+                        (self.user_id,) + key + (calories,)
+                        for key, calories in merged_rows.items()
+                    ),
+                )
+                self._count_rows_written(cursor)
+
+                # only foods linked to an ingredient edge have totals other than
+                # their own calories, which is what the column defaults to
+                cursor.execute(
+                    """
+                    SELECT food_name, portion_type
+                    FROM food_ingredients
+                    WHERE user_id = :user_id
+                    UNION
+                    SELECT ingredient_name, ingredient_portion_type
+                    FROM food_ingredients
+                    WHERE user_id = :user_id
+                    """,
+                    {"user_id": self.user_id},
+                )
+                linked_foods = set(cursor.fetchall())
+                unlinked_foods = merged_rows.keys() - linked_foods
+                cursor.executemany(
+                    """
+                    UPDATE foods
+                    SET total_calories = coalesce(calories, 0)
+                    WHERE user_id = ? AND food_name = ? AND portion_type = ?
+                    """,
+                    ((self.user_id,) + food for food in unlinked_foods),
+                )
+                self._invalidate_foods(unlinked_foods)
+                self._refresh_food_totals(cursor, merged_rows.keys() & linked_foods)
+
+    @group_committed
+    @instrumented
+    def delete_rows_in_table(self, table_name, match_data, match_mode="exact"):
         """
         Behaves similarly to get_rows_from_table() but deletes matching rows instead of
         returning them.
@@ -345,41 +1609,88 @@ class CalorieCounterORM():
             "Deleting rows from %s table that match %s", table_name, match_data
         )
 
-        cursor = self.get_or_create_db_cursor()
+        where_clause, parameters = self._get_where_clause(
+            table_name, match_data, match_mode
+        )
 
-        match_string = query_data.get_query_match_string()
+        with self.transaction() as cursor:
+            if table_name == "foods":
+                deleted_foods = self._get_food_keys(cursor, where_clause, parameters)
 
-        self.commit_changes()
+            cursor.execute(
+                f"""
+                DELETE
+                FROM {table_name}
+                {where_clause}
+                """,
+                parameters,
+            )
+            self._count_rows_written(cursor)
+
+            if table_name == "record":
+                self._food_index_outdated = True
+            if table_name == "foods":
+                cursor.executemany(
+                    """
+                    DELETE
+                    FROM food_ingredients
+                    WHERE user_id = ? AND food_name = ? AND portion_type = ?
+                    """,
+                    ((self.user_id,) + food for food in deleted_foods),
+                )
+                self._refresh_food_totals(cursor, deleted_foods)
 
+    @group_committed
+    @instrumented
     def delete_table(self, table_name):
         """
-        Delete given table.
+        Delete every row of the user from given table, along with the ingredients
+        of deleted foods. The table itself is kept as it holds the rows of the other
+        users too.
         """
-        logging.info("Deleting table %s", table_name)
-        cursor = self.get_or_create_db_cursor()
-        cursor.execute(
-            f"""
-            DROP
-            TABLE IF EXISTS {table_name}
-            """
-        )
-        self.commit_changes()
+        if table_name not in TABLE_NAMES:
+            raise ValueError(f"Invalid table name {table_name}")
+
+        logging.info("Deleting table %s of %s", table_name, self.user_id)
+        with self.transaction() as cursor:
+            if table_name == "foods":
+                deleted_foods = self._get_food_keys(
+                    cursor, "WHERE user_id = ?", (self.user_id,)
+                )
 
-    def update_row_in_table(self, table_name, update_data, match_data):
-        """
-        Replace columns of all rows that match the match criteria.
+            cursor.execute(
+                f"""
+                DELETE
+                FROM {table_name}
+                WHERE user_id = ?
+                """,
+                (self.user_id,),
+            )
+            self._count_rows_written(cursor)
 
-        Columns that should be updated should be passed as kwargs in the form
-        <column name>=<new data>, e.g:
+            if table_name == "record":
+                self._food_index_outdated = True
+            if table_name == "foods":
+                cursor.execute(
+                    "DELETE FROM food_ingredients WHERE user_id = ?", (self.user_id,)
+                )
+                self._invalidate_foods(deleted_foods)
 
-        Targeting specific rows to be updated is done by passing kwargs in
-        the form match_<column name>=<match criteria>.
+    @group_committed
+    @instrumented
+    def update_row_in_table(
+        self, table_name, update_data, match_data, match_mode="exact"
+    ):
+        """
+        Replace columns of all rows that match the match criteria.
 
-        An example usage of this function might look like this:
+        Columns that should be updated are the values set in update_data, rows to be
+        updated are the ones matching match_data. An example usage of this function
+        might look like this:
 
             update_row_in_table('foods',
-                match_food_name='broccoli', match_portion_type='head',
-                calories=50
+                QueryData(calories=50),
+                QueryData(food_name='broccoli', portion_type='head'),
             )
 
         In this example case we update the calories value for a head of
@@ -389,24 +1700,492 @@ class CalorieCounterORM():
             "Updating row in %s table with data: %s", table_name, update_data,
         )
 
-        match_string = match_data.get_query_match_string()
-        update_string = update_data.get_query_set_string()
+        where_clause, match_parameters = self._get_where_clause(
+            table_name, match_data, match_mode
+        )
+        set_clause, set_parameters = update_data.get_query_set_clause()
+        if not set_clause:
+            logging.warning("No data to update given")
+            return
+
+        with self.transaction() as cursor:
+            if table_name == "foods":
+                old_foods = self._get_food_keys(cursor, where_clause, match_parameters)
+
+            cursor.execute(
+                f"""
+                UPDATE {table_name}
+                SET {set_clause}
+                {where_clause}
+                """,
+                set_parameters + match_parameters,
+            )
+            self._count_rows_written(cursor)
+
+            if table_name == "record":
+                self._food_index_outdated = True
+            if table_name == "foods":
+                new_foods = [
+                    (
+                        update_data.food_name or food_name,
+                        portion_type if update_data.portion_type is None
+                        else update_data.portion_type,
+                    )
+                    for food_name, portion_type in old_foods
+                ]
+                self._refresh_food_totals(cursor, old_foods + new_foods)
+
+    @staticmethod
+    def _get_food_keys(cursor, where_clause, parameters):
+        """
+        Returns the (food_name, portion_type) keys of all foods matching the where
+        clause.
+        """
+        cursor.execute(
+            f"""
+            SELECT food_name, portion_type
+            FROM foods
+            {where_clause}
+            """,
+            parameters,
+        )
+
+        return cursor.fetchall()
 
-        cursor = self.get_or_create_db_cursor()
-        if table_name == "record":
+    def _get_cached_food(self, food_name, portion_type):
+        """
+        Returns the (calories, total_calories) of a food, or None if it doesn't
+        exist. Results are kept in the food cache, which every write to foods
+        invalidates. Writes of other processes, or other ORMs, clear the whole
+        cache, as it can't be told which foods they changed. They are noticed
+        within CHANGE_CHECK_INTERVAL seconds, see ConnectionPool.has_changed().
+        """
+        key = (food_name, portion_type)
+        if self.pool.has_changed():
+            self.food_cache.clear()
+        food = self.food_cache.get(key)
+        if food is not LRUCache.missing:
+            return food
+
+        # a commit of this ORM's writer may invalidate the food while it is read
+        generation = self.food_cache.generation
+        with self.read_cursor() as cursor:
             cursor.execute(
-                f"""UPDATE record
-                SET {update_string}
-                WHERE {match_string}
                 """
+                SELECT calories, total_calories
+                FROM foods
+                WHERE user_id = ? AND food_name = ? AND portion_type = ?
+                """,
+                (self.user_id,) + key,
             )
-        elif table_name == "foods":
+            food = cursor.fetchone()
+
+        self.food_cache.put(key, food, generation)
+
+        return food
+
+    def get_food_index(self):
+        """
+        Returns a search.FoodSearchIndex of all foods of the user, ranked by their
+        number of record entries, for autocompletion and fuzzy search:
+
+            orm.get_food_index().complete("bro")
+            orm.get_food_index().search("brocoli")
+
+        The index is built on first use and updated after every commit of this ORM,
+        so it does not see writes made by other processes.
+        """
+        import search  # pylint: disable=import-outside-toplevel
+
+        # built on the writer connection so that no commit can happen in between
+        with self.pool.writer() as connection:
+            if self._food_index is None:
+                logging.info("Building food search index")
+                cursor = connection.cursor()
+                cursor.execute(
+                    """
+                    SELECT foods.food_name, foods.portion_type, count(record.date)
+                    FROM foods
+                    LEFT JOIN record
+                        ON record.user_id = foods.user_id
+                        AND record.food_name = foods.food_name
+                        AND record.portion_type = foods.portion_type
+                    WHERE foods.user_id = ?
+                    GROUP BY foods.food_name, foods.portion_type
+                    """,
+                    (self.user_id,),
+                )
+                self._food_index = search.FoodSearchIndex(cursor)
+
+            return self._food_index
+
+    def _update_food_index(self, foods):
+        """
+        Brings the entries of the given (food_name, portion_type) keys in the search
+        index, if it has been built, up to date with the database. Called with the
+        foods changed by a transaction once it has been committed.
+        """
+        outdated = self._food_index_outdated
+        self._food_index_outdated = False
+        if self._food_index is None:
+            return
+        if outdated or len(foods) > FOOD_INDEX_UPDATE_LIMIT:
+            self._food_index = None
+            return
+
+        with self.pool.writer() as connection:
+            cursor = connection.cursor()
+            for food_name, portion_type in foods:
+                cursor.execute(
+                    """
+                    SELECT
+                        EXISTS (
+                            SELECT 1 FROM foods
+                            WHERE user_id = ? AND food_name = ? AND portion_type = ?
+                        ),
+                        (
+                            SELECT count(*) FROM record
+                            WHERE user_id = ? AND food_name = ? AND portion_type = ?
+                        )
+                    """,
+                    (self.user_id, food_name, portion_type) * 2,
+                )
+                exists, frequency = cursor.fetchone()
+                if exists:
+                    self._food_index.add(food_name, portion_type, frequency)
+                else:
+                    self._food_index.remove(food_name, portion_type)
+
+    @instrumented
+    def get_food(self, food_name, portion_type=""):
+        """
+        Returns the foods row of a food as a FoodRow, or None if the food doesn't
+        exist.
+        """
+        food = self._get_cached_food(food_name, portion_type or "")
+        if food is None:
+            return None
+
+        return FoodRow(food_name, portion_type or "", *food)
+
+    def get_food_calories(self, food_name, portion_type=""):
+        """
+        Returns the fully expanded calories of a food, i.e. its own calories plus
+        those of all its ingredients, or None if the food doesn't exist. This reads
+        the cached foods.total_calories, so no ingredients are walked.
+        """
+        food = self._get_cached_food(food_name, portion_type or "")
+
+        return food[1] if food else None
+
+    @instrumented
+    def get_food_ingredients(self, food_name, portion_type=""):
+        """
+        Returns the direct ingredients of a food as a list of
+        (ingredient_name, ingredient_portion_type, servings) tuples.
+        """
+        with self.read_cursor() as cursor:
             cursor.execute(
-                f"""
-                UPDATE foods
-                SET {update_string}
-                WHERE {match_string}
                 """
+                SELECT ingredient_name, ingredient_portion_type, servings
+                FROM food_ingredients
+                WHERE user_id = ? AND food_name = ? AND portion_type = ?
+                ORDER BY ingredient_name, ingredient_portion_type
+                """,
+                (self.user_id, food_name, portion_type),
+            )
+            return cursor.fetchall()
+
+    @group_committed
+    @instrumented
+    def set_food_ingredients(self, food_name, portion_type, ingredients):
+        """
+        Replaces the ingredients of a food with the given list of
+        (ingredient_name, ingredient_portion_type, servings) tuples, making it a
+        composite food, e.g:
+
+            set_food_ingredients("toast with butter", "slice", [
+                ("bread", "slice", 1),
+                ("butter", "spread", 1),
+            ])
+
+        Raises ValueError, leaving the ingredients unchanged, if this would make the
+        food an ingredient of itself.
+        """
+        portion_type = portion_type or ""
+        logging.info(
+            "Setting ingredients of %s (%s) to %s", food_name, portion_type, ingredients
+        )
+
+        with self.transaction() as cursor:
+            cursor.execute(
+                """
+                DELETE
+                FROM food_ingredients
+                WHERE user_id = ? AND food_name = ? AND portion_type = ?
+                """,
+                (self.user_id, food_name, portion_type),
+            )
+            cursor.executemany(
+                """
+                INSERT INTO food_ingredients (
+                    user_id, food_name, portion_type, ingredient_name,
+                    ingredient_portion_type, servings
+                )
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (
+                    user_id, food_name, portion_type, ingredient_name,
+                    ingredient_portion_type
+                )
+                DO UPDATE SET servings = servings + excluded.servings
+                """,
+                [
+                    (self.user_id, food_name, portion_type, name,
+                     ingredient_portion_type or "", servings)
+                    for name, ingredient_portion_type, servings in ingredients
+                ],
+            )
+            self._count_rows_written(cursor)
+
+            cursor.execute(
+                """
+                WITH RECURSIVE reachable (food_name, portion_type) AS (
+                    SELECT ingredient_name, ingredient_portion_type
+                    FROM food_ingredients
+                    WHERE
+                        user_id = :user_id AND
+                        food_name = :food_name AND
+                        portion_type = :portion_type
+                    UNION
+                    SELECT ingredient_name, ingredient_portion_type
+                    FROM food_ingredients
+                    JOIN reachable USING (food_name, portion_type)
+                    WHERE food_ingredients.user_id = :user_id
+                )
+                SELECT 1
+                FROM reachable
+                WHERE food_name = :food_name AND portion_type = :portion_type
+                """,
+                {
+                    "user_id": self.user_id,
+                    "food_name": food_name,
+                    "portion_type": portion_type,
+                },
             )
+            if cursor.fetchone():
+                raise ValueError(
+                    f"{food_name} ({portion_type}) cannot be an ingredient of itself"
+                )
 
-        self.commit_changes()
+            self._refresh_food_totals(cursor, [(food_name, portion_type)])
+
+    def _refresh_food_totals(self, cursor, changed_foods):
+        """
+        Recalculates foods.total_calories of the changed foods and of every food
+        that directly or indirectly includes them, found by walking the reverse
+        ingredient edges. Foods are recalculated in dependency order, so each one
+        only has to add up the already updated totals of its direct ingredients.
+        """
+        affected_foods = set(changed_foods)
+        unvisited_foods = list(affected_foods)
+        dependents = {}
+        while unvisited_foods:
+            food = unvisited_foods.pop()
+            cursor.execute(
+                """
+                SELECT food_name, portion_type
+                FROM food_ingredients
+                WHERE
+                    user_id = ? AND
+                    ingredient_name = ? AND
+                    ingredient_portion_type = ?
+                """,
+                (self.user_id,) + food,
+            )
+            dependents[food] = cursor.fetchall()
+            for dependent in dependents[food]:
+                if dependent not in affected_foods:
+                    affected_foods.add(dependent)
+                    unvisited_foods.append(dependent)
+
+        logging.info("Recalculating total calories of %s foods", len(affected_foods))
+        self._invalidate_foods(affected_foods)
+
+        pending_ingredients = dict.fromkeys(affected_foods, 0)
+        for food in affected_foods:
+            for dependent in dependents[food]:
+                pending_ingredients[dependent] += 1
+
+        ready_foods = [food for food, count in pending_ingredients.items() if not count]
+        recalculated_count = 0
+        while ready_foods:
+            food = ready_foods.pop()
+            cursor.execute(
+                """
+                UPDATE foods
+                SET total_calories = coalesce(calories, 0) + (
+                    SELECT total(food_ingredients.servings * ingredient.total_calories)
+                    FROM food_ingredients
+                    JOIN foods AS ingredient
+                        ON ingredient.user_id = food_ingredients.user_id
+                        AND ingredient.food_name = food_ingredients.ingredient_name
+                        AND ingredient.portion_type =
+                            food_ingredients.ingredient_portion_type
+                    WHERE
+                        food_ingredients.user_id = foods.user_id AND
+                        food_ingredients.food_name = foods.food_name AND
+                        food_ingredients.portion_type = foods.portion_type
+                )
+                WHERE user_id = ? AND food_name = ? AND portion_type = ?
+                """,
+                (self.user_id,) + food,
+            )
+            recalculated_count += 1
+            for dependent in dependents[food]:
+                pending_ingredients[dependent] -= 1
+                if not pending_ingredients[dependent]:
+                    ready_foods.append(dependent)
+
+        if recalculated_count < len(affected_foods):
+            raise ValueError("Ingredients of foods form a cycle")
+
+
+class BatchWriter():
+    """
+    Runs write operations on an ORM from a dedicated writer thread.
+
+    submit() queues an operation and returns a concurrent.futures.Future for its
+    result. Queued operations are grouped and run in one shared transaction, each
+    inside its own savepoint, so that a failing operation is rolled back on its own
+    without affecting the others. Futures are only resolved once the transaction
+    has been committed.
+
+    A batch is written as soon as it holds max_batch_size operations, or max_delay
+    seconds after its first operation was queued. With the default max_delay of 0
+    it holds whatever was queued while the previous batch was being written.
+    """
+
+    def __init__(self, orm, max_batch_size=MAX_BATCH_SIZE, max_delay=0):
+        self.orm = orm
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batch_count = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="BatchWriter", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queue function(*args, **kwargs) to be run on the writer thread. Returns a
+        Future which is resolved with its result after it has been committed.
+        """
+        if self._closed:
+            raise RuntimeError("BatchWriter has been closed")
+
+        from concurrent.futures import Future  # pylint: disable=import-outside-toplevel
+        future = Future()
+        self._queue.put((future, function, args, kwargs))
+
+        return future
+
+    def flush(self):
+        """
+        Writes the current batch right away and blocks until every operation
+        submitted before this call has been committed.
+        """
+        if self._closed or threading.current_thread() is self._thread:
+            return
+
+        from concurrent.futures import Future  # pylint: disable=import-outside-toplevel
+        future = Future()
+        self._queue.put((future, None, (), {}))
+        future.result()
+
+    def close(self):
+        """
+        Runs all queued operations and stops the writer thread.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        """
+        Main loop of the writer thread, writing queued operations in batches.
+        """
+        stopping = False
+        while not stopping:
+            operation = self._queue.get()
+            deadline = time.monotonic() + self.max_delay
+            batch = []
+            flushes = []
+            while True:
+                if operation is None:
+                    stopping = True
+                    break
+                if operation[1] is None:
+                    flushes.append(operation[0])
+                    break
+
+                batch.append(operation)
+                if len(batch) >= self.max_batch_size:
+                    break
+
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        operation = self._queue.get(timeout=timeout)
+                    else:
+                        operation = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(batch)
+            for future in flushes:
+                future.set_result(None)
+
+    def _write_batch(self, batch):
+        """
+        Runs a batch of operations in a single transaction.
+        """
+        logging.info("Writing batch of %s operations", len(batch))
+        self.batch_count += 1
+
+        outcomes = []
+        try:
+            with self.orm.transaction() as cursor:
+                for future, function, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+
+                    cursor.execute("SAVEPOINT batch_operation")
+                    try:
+                        result = function(*args, **kwargs)
+                    except Exception as e:  # pylint: disable=broad-except
+                        logging.error("Batched %s failed: %s", function.__name__, e)
+                        cursor.execute("ROLLBACK TO batch_operation")
+                        cursor.execute("RELEASE batch_operation")
+                        # values read by the failed operation may have been cached
+                        self.orm.food_cache.clear()
+                        outcomes.append((future, None, e))
+                    else:
+                        cursor.execute("RELEASE batch_operation")
+                        outcomes.append((future, result, None))
+        except Exception as e:  # pylint: disable=broad-except
+            logging.error("Writing batch failed: %s", e)
+            # including the operations which never started, e.g. if BEGIN failed
+            for future, _function, _args, _kwargs in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, exception in outcomes:
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
@@ -1,51 +1,55 @@
 """
 Entry point of the script.
 Contains most of the interface logic.
+
+The script is run from shell hooks many times a day, so only the command line
+interface is imported up front. Everything else, including the database, is loaded
+once a command actually needs it, which keeps --help and usage errors fast.
 """
 
-import datetime
-import sqlite3
-import logging
+import functools
 
-import db
 import cli
-import cfg
 
-ORM = db.CalorieCounterORM(cfg.DB_PATH)
+# profiling.SQLProfiler of every ORM opened while --profile is given
+SQL_PROFILER = None
 
+# user given with --user, cfg.USER_ID if None
+USER_ID = None
 
-def main():
-    """
-    Main function of the program
-    """
-    args = cli.parser.parse_args()
 
-    if args.subparser_name == "food":
-        logging.info("food subparser used")
+@functools.lru_cache(maxsize=None)
+def get_orm(**orm_kwargs):
+    """
+    Opens the database the first time it is needed and returns the ORM of the user
+    given with --user. orm_kwargs are passed on to CalorieCounterORM.
 
-        new_data = db.QueryData(
-            food_name=args.food,
-            portion_type=args.type,
-            calories=args.calories
-        )
-        ORM.add_row_to_table('food', new_data)
+    If cfg.METRICS_PATH is set the ORM collects metrics, which are added to that
+    file when the script exits.
+    """
+    # pylint: disable=import-outside-toplevel
+    import cfg
+    import db
 
-    elif args.subparser_name == "entry":
-        logging.info("entry subparser used")
+    collect_metrics = cfg.METRICS_PATH is not None
+    orm = db.CalorieCounterORM(
+        cfg.DB_PATH, pragmas=cfg.DB_PRAGMAS, collect_metrics=collect_metrics,
+        sql_profiler=SQL_PROFILER, user_id=USER_ID or cfg.USER_ID, **orm_kwargs
+    )
+    if collect_metrics:
+        import atexit
+        import metrics
+        atexit.register(lambda: metrics.save(cfg.METRICS_PATH, orm.get_metrics()))
 
-        new_data = db.QueryData(
-            food_name=args.food,
-            portion_type=args.type,
-            servings=args.servings,
-            date=args.date
-        )
-        ORM.add_row_to_table('record', new_data)
+    return orm
 
-    else:
-        logging.info("No subparser used")
 
+def configure_logging():
+    """
+    Sets up the log format of the script.
+    """
+    import logging  # pylint: disable=import-outside-toplevel
 
-if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO,
         format=(
@@ -54,4 +58,218 @@ if __name__ == "__main__":
         ),
     )
     logging.info("Starting script")
+
+
+def add_food(orm, args):
+    """
+    Adds the food of the food command to the database.
+    """
+    import db  # pylint: disable=import-outside-toplevel
+
+    new_data = db.QueryData(
+        food_name=args.food,
+        portion_type=args.type,
+        calories=args.calories
+    )
+    orm.add_row_to_table('foods', new_data)
+    if args.ingredient:
+        orm.set_food_ingredients(args.food, args.type, args.ingredient)
+
+
+def add_entry(orm, args):
+    """
+    Adds the record entry of the entry command to the database.
+    """
+    import db  # pylint: disable=import-outside-toplevel
+
+    new_data = db.QueryData(
+        food_name=args.food,
+        portion_type=args.type,
+        servings=args.servings,
+        date=args.date
+    )
+    orm.add_row_to_table('record', new_data)
+
+
+def show_summary(orm, args):
+    """
+    Prints the total calories of every day of the summary command.
+    """
+    for day, calories in orm.daily_totals(args.start, args.end):
+        print(f"{day.isoformat()}: {calories} calories")
+
+
+def print_metrics(metrics, as_json):
+    """
+    Prints metrics as a table, or as JSON if as_json is true.
+    """
+    if as_json:
+        import json  # pylint: disable=import-outside-toplevel
+        print(json.dumps(metrics.to_dict(), indent=2))
+    else:
+        print(metrics.format_table())
+
+
+def show_stats(args):
+    """
+    Prints the metrics of all runs of the script collected in cfg.METRICS_PATH, or
+    clears them.
+    """
+    # pylint: disable=import-outside-toplevel
+    import cfg
+    import metrics
+
+    if cfg.METRICS_PATH is None:
+        print("Metrics are not collected, set METRICS_PATH in cfg.py to collect them")
+    elif args.reset:
+        metrics.reset(cfg.METRICS_PATH)
+        print("Cleared the collected metrics")
+    else:
+        print_metrics(metrics.load(cfg.METRICS_PATH), args.json)
+
+
+def show_session_stats(orm, args):
+    """
+    Prints the metrics of the open ORM, or clears them, for the stats command of
+    the shell.
+    """
+    orm_metrics = orm.get_metrics()
+    if orm_metrics is None:
+        print("Metrics are not collected, set METRICS_PATH in cfg.py to collect them")
+    elif args.reset:
+        orm_metrics.clear()
+        print("Cleared the metrics of this session")
+    else:
+        print_metrics(orm_metrics, args.json)
+
+
+def print_progress(verb):
+    """
+    Returns a progress callback which keeps a count of transferred rows on one line
+    of standard error.
+    """
+    import sys  # pylint: disable=import-outside-toplevel
+
+    def progress(row_count):
+        print(f"\r{verb} {row_count} rows", end="", file=sys.stderr, flush=True)
+
+    return progress
+
+
+def transfer_rows(orm, args):
+    """
+    Runs the import or export command.
+    """
+    # pylint: disable=import-outside-toplevel
+    import contextlib
+    import sys
+    import transfer
+
+    if args.path == "-":
+        file_format = args.format or "csv"
+        file = contextlib.nullcontext(
+            sys.stdin if args.subparser_name == "import" else sys.stdout
+        )
+    else:
+        file_format = transfer.get_file_format(args.path, args.format)
+        file = open(  # pylint: disable=consider-using-with
+            args.path,
+            "r" if args.subparser_name == "import" else "w",
+            encoding="utf-8",
+            newline="",
+        )
+
+    with file as opened_file:
+        if args.subparser_name == "import":
+            imported, skipped = transfer.import_rows(
+                orm, args.table, opened_file, file_format, args.chunk_size,
+                print_progress("Imported"),
+            )
+            print(file=sys.stderr)
+            print(f"Imported {imported} rows, skipped {skipped} invalid rows")
+        else:
+            exported = transfer.export_rows(
+                orm, args.table, opened_file, file_format, print_progress("Exported")
+            )
+            print(file=sys.stderr)
+            print(f"Exported {exported} rows", file=sys.stderr)
+
+
+def run_command(args):
+    """
+    Runs the command given on the command line.
+    """
+    import logging  # pylint: disable=import-outside-toplevel
+
+    if args.subparser_name == "food":
+        logging.info("food subparser used")
+        add_food(get_orm(), args)
+
+    elif args.subparser_name == "entry":
+        logging.info("entry subparser used")
+        add_entry(get_orm(), args)
+
+    elif args.subparser_name == "summary":
+        logging.info("summary subparser used")
+        show_summary(get_orm(), args)
+
+    elif args.subparser_name == "rebuild-summaries":
+        logging.info("rebuild-summaries subparser used")
+
+        corrected_days = get_orm().rebuild_summaries()
+        print(f"Rebuilt daily summaries, {len(corrected_days)} days were out of date")
+        for day in corrected_days:
+            print(day.isoformat())
+
+    elif args.subparser_name == "serve":
+        logging.info("serve subparser used")
+
+        import server  # pylint: disable=import-outside-toplevel
+        server.serve(get_orm(), args.host, args.port)
+
+    elif args.subparser_name == "shell":
+        logging.info("shell subparser used")
+
+        import shell  # pylint: disable=import-outside-toplevel
+        orm = get_orm(group_commit=True, group_commit_interval=shell.COMMIT_INTERVAL)
+        shell.run(orm, {
+            "food": add_food,
+            "entry": add_entry,
+            "summary": show_summary,
+            "stats": show_session_stats,
+        })
+
+    elif args.subparser_name in ("import", "export"):
+        logging.info("%s subparser used", args.subparser_name)
+        transfer_rows(get_orm(), args)
+
+    elif args.subparser_name == "stats":
+        logging.info("stats subparser used")
+        show_stats(args)
+
+    else:
+        logging.info("No subparser used")
+
+
+def main():
+    """
+    Main function of the program
+    """
+    global SQL_PROFILER, USER_ID  # pylint: disable=global-statement
+
+    args = cli.parser.parse_args()
+    configure_logging()
+    USER_ID = args.user
+
+    if args.profile:
+        import profiling  # pylint: disable=import-outside-toplevel
+        SQL_PROFILER = profiling.SQLProfiler()
+        profiling.run(
+            run_command, args, args.profile_output, sql_profiler=SQL_PROFILER
+        )
+    else:
+        run_command(args)
+
+
+if __name__ == "__main__":
     main()
@@ -0,0 +1,423 @@
+"""
+Counters and latency histograms of the operations of the ORM.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where runs saving at the same time may lose numbers
+    fcntl = None
+
+# upper bounds of the latency histogram buckets in milliseconds, the last bucket
+# holds everything slower
+BUCKET_BOUNDS = (
+    0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000,
+    5000,
+)
+
+# name statements executed outside of any operation are counted under
+OTHER_OPERATION = "other"
+
+
+class Histogram():
+    """
+    Latency histogram with fixed, roughly logarithmic buckets, so that histograms of
+    different runs can be added up.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def add(self, duration):
+        """
+        Adds a duration in milliseconds.
+        """
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, duration)] += 1
+        self.total += duration
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if self.max is None or duration > self.max:
+            self.max = duration
+
+    def merge(self, other):
+        """
+        Adds the durations of another histogram to this one.
+        """
+        self.counts = [count + other_count for count, other_count in zip(
+            self.counts, other.counts
+        )]
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def get_percentile(self, percentile):
+        """
+        Returns the upper bound of the bucket holding the given percentile of the
+        durations, or the largest duration if that is lower.
+        """
+        count = len(self)
+        if not count:
+            return None
+
+        rank = percentile / 100 * count
+        seen = 0
+        for bound, bucket_count in zip(BUCKET_BOUNDS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def to_dict(self):
+        """
+        Returns the numbers as a dictionary that can be dumped as JSON.
+        """
+        return {
+            "count": len(self),
+            "total_ms": self.total,
+            "min_ms": self.min,
+            "max_ms": self.max,
+            "p50_ms": self.get_percentile(50),
+            "p95_ms": self.get_percentile(95),
+            "p99_ms": self.get_percentile(99),
+            "bucket_bounds_ms": list(BUCKET_BOUNDS),
+            "bucket_counts": self.counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a histogram from the output of to_dict().
+        """
+        histogram = cls()
+        histogram.counts = list(data["bucket_counts"])
+        histogram.total = data["total_ms"]
+        histogram.min = data["min_ms"]
+        histogram.max = data["max_ms"]
+        return histogram
+
+
+class OperationStats():
+    """
+    Calls, failures, latencies, executed SQL statements and rows read and written
+    of one operation.
+    """
+
+    def __init__(self):
+        self.errors = 0
+        self.latency = Histogram()
+        self.statements = {}
+        self.rows_read = 0
+        self.rows_written = 0
+
+    def merge(self, other):
+        """
+        Adds the numbers of another OperationStats instance to this one.
+        """
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+        for kind, count in other.statements.items():
+            self.statements[kind] = self.statements.get(kind, 0) + count
+        self.rows_read += other.rows_read
+        self.rows_written += other.rows_written
+
+    def to_dict(self):
+        """
+        Returns the numbers as a dictionary that can be dumped as JSON.
+        """
+        return {
+            "calls": len(self.latency),
+            "errors": self.errors,
+            "rows_read": self.rows_read,
+            "rows_written": self.rows_written,
+            "statements": dict(sorted(self.statements.items())),
+            "latency": self.latency.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates an OperationStats instance from the output of to_dict().
+        """
+        stats = cls()
+        stats.errors = data["errors"]
+        stats.latency = Histogram.from_dict(data["latency"])
+        stats.statements = dict(data["statements"])
+        stats.rows_read = data["rows_read"]
+        stats.rows_written = data["rows_written"]
+        return stats
+
+
+class Metrics():
+    """
+    Collects an OperationStats instance for every operation of the ORM.
+
+    Operations are timed with start() and finish(), or time_iterator() for
+    generators. SQL statements reported to trace_statement(), the trace callback
+    of the database connections, and rows reported to count_rows_written() are
+    counted for the innermost operation running on the same thread. All methods
+    are thread-safe.
+    """
+
+    def __init__(self):
+        self.operations = {}
+        self.cache_stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_operation_stack(self):
+        stack = getattr(self._local, "operations", None)
+        if stack is None:
+            stack = self._local.operations = []
+        return stack
+
+    def _get_stats(self, operation):
+        stats = self.operations.get(operation)
+        if stats is None:
+            stats = self.operations[operation] = OperationStats()
+        return stats
+
+    def start(self, operation):
+        """
+        Marks the start of an operation on this thread and returns its start time.
+        """
+        self._get_operation_stack().append(operation)
+        return time.perf_counter()
+
+    def finish(self, operation, start_time, rows_read=0, failed=False):
+        """
+        Marks the end of the operation started at start_time on this thread.
+        """
+        duration = (time.perf_counter() - start_time) * 1000
+        self._get_operation_stack().pop()
+        with self._lock:
+            stats = self._get_stats(operation)
+            stats.latency.add(duration)
+            stats.rows_read += rows_read
+            if failed:
+                stats.errors += 1
+
+    def time_iterator(self, operation, iterator):
+        """
+        Yields the items of iterator, timing the whole iteration as one call of the
+        operation. Only the time spent producing items counts, not the time the
+        caller spends between them. Closing the returned generator closes iterator too.
+        """
+        duration = 0
+        rows_read = 0
+        failed = False
+        stack = self._get_operation_stack()
+        try:
+            while True:
+                stack.append(operation)
+                start_time = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                except BaseException:
+                    failed = True
+                    raise
+                finally:
+                    duration += time.perf_counter() - start_time
+                    stack.pop()
+                rows_read += 1
+                yield item
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            with self._lock:
+                stats = self._get_stats(operation)
+                stats.latency.add(duration * 1000)
+                stats.rows_read += rows_read
+                if failed:
+                    stats.errors += 1
+
+    def trace_statement(self, statement):
+        """
+        Counts an executed SQL statement by its first keyword, e.g. SELECT. Meant to
+        be the trace callback of database connections.
+        """
+        stack = self._get_operation_stack()
+        operation = stack[-1] if stack else OTHER_OPERATION
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        with self._lock:
+            statements = self._get_stats(operation).statements
+            statements[kind] = statements.get(kind, 0) + 1
+
+    def count_rows_written(self, count):
+        """
+        Adds count rows to the rows written by the current operation of this thread.
+        """
+        if count <= 0:
+            return
+
+        stack = self._get_operation_stack()
+        operation = stack[-1] if stack else OTHER_OPERATION
+        with self._lock:
+            self._get_stats(operation).rows_written += count
+
+    def set_cache_stats(self, name, stats):
+        """
+        Stores the hit and miss counts of a cache, as returned by
+        LRUCache.get_stats().
+        """
+        with self._lock:
+            self.cache_stats[name] = dict(stats)
+
+    def clear(self):
+        """
+        Forgets all numbers collected so far.
+        """
+        with self._lock:
+            self.operations = {}
+            self.cache_stats = {}
+
+    def merge(self, other):
+        """
+        Adds the numbers of another Metrics instance to this one.
+        """
+        with self._lock:
+            for operation, stats in other.operations.items():
+                self._get_stats(operation).merge(stats)
+            for name, stats in other.cache_stats.items():
+                cache_stats = self.cache_stats.setdefault(name, {})
+                for key in ("hits", "misses"):
+                    cache_stats[key] = cache_stats.get(key, 0) + stats.get(key, 0)
+                for key in ("size", "maxsize"):
+                    if key in stats:
+                        cache_stats[key] = stats[key]
+
+    def to_dict(self):
+        """
+        Returns all numbers as a dictionary that can be dumped as JSON.
+        """
+        with self._lock:
+            caches = {}
+            for name, stats in sorted(self.cache_stats.items()):
+                lookups = stats.get("hits", 0) + stats.get("misses", 0)
+                caches[name] = dict(
+                    stats, hit_rate=stats.get("hits", 0) / lookups if lookups else None
+                )
+            return {
+                "operations": {
+                    operation: stats.to_dict()
+                    for operation, stats in sorted(self.operations.items())
+                },
+                "caches": caches,
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a Metrics instance from the output of to_dict().
+        """
+        metrics = cls()
+        metrics.operations = {
+            operation: OperationStats.from_dict(stats)
+            for operation, stats in data.get("operations", {}).items()
+        }
+        metrics.cache_stats = {
+            name: {key: value for key, value in stats.items() if key != "hit_rate"}
+            for name, stats in data.get("caches", {}).items()
+        }
+        return metrics
+
+    def format_table(self):
+        """
+        Returns the numbers as a human readable table.
+        """
+        data = self.to_dict()
+        lines = [
+            f"{'operation':24} {'calls':>7} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'max ms':>8} {'rows read':>10} {'written':>8} {'statements':>10}"
+        ]
+        for operation, stats in data["operations"].items():
+            latency = stats["latency"]
+            lines.append(
+                f"{operation:24} {stats['calls']:7} {stats['errors']:6} "
+                f"{format_duration(latency['p50_ms'])} "
+                f"{format_duration(latency['p95_ms'])} "
+                f"{format_duration(latency['max_ms'])} "
+                f"{stats['rows_read']:10} {stats['rows_written']:8} "
+                f"{sum(stats['statements'].values()):10}"
+            )
+
+        for name, stats in data["caches"].items():
+            hit_rate = stats["hit_rate"]
+            lines.append(
+                f"{name} cache: {stats.get('hits', 0)} hits, "
+                f"{stats.get('misses', 0)} misses"
+                + ("" if hit_rate is None else f", {hit_rate:.1%} hit rate")
+            )
+
+        return "\n".join(lines)
+
+
+def format_duration(duration):
+    """
+    Formats a duration in milliseconds, or None, for format_table().
+    """
+    return f"{'-':>8}" if duration is None else f"{duration:8.3f}"
+
+
+def load(path):
+    """
+    Returns the Metrics saved at path, or empty Metrics if there are none.
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            return Metrics.from_dict(json.load(file))
+    except FileNotFoundError:
+        return Metrics()
+
+
+@contextmanager
+def locked(path):
+    """
+    Holds an exclusive lock on a lock file next to the metrics file at path while in
+    the with block. path itself can't be locked as save() replaces it.
+    """
+    with open(f"{path}.lock", "a", encoding="utf-8") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def save(path, metrics):
+    """
+    Adds metrics to the Metrics saved at path, so that the numbers of short runs of
+    the script add up. Runs saving at the same time take turns, so that none of
+    them overwrites the numbers of another.
+    """
+    with locked(path):
+        total = load(path)
+        total.merge(metrics)
+        # written to a new file first so that a crash never leaves a broken file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(total.to_dict(), file, indent=2)
+        os.replace(tmp_path, path)
+
+
+def reset(path):
+    """
+    Removes the Metrics saved at path, if there are any.
+    """
+    with locked(path):
+        if os.path.exists(path):
+            os.remove(path)
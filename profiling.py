@@ -0,0 +1,249 @@
+"""
+Profiling of a single command of the script, for the --profile option.
+"""
+
+import cProfile
+import pstats
+import sqlite3
+import sys
+import threading
+import time
+
+# functions and SQL statements shown in the summary printed at exit
+SUMMARY_LIMIT = 15
+
+
+def normalize_statement(statement):
+    """
+    Returns statement with all runs of whitespace replaced by a single space.
+    """
+    return " ".join(statement.split())
+
+
+class SQLProfiler():
+    """
+    Times the SQL statements executed on connections created with
+    connection_factory, and counts the statements SQLite actually runs for each of
+    them as reported to trace_statement(), the trace callback of the connections.
+    Those include one statement for every row of an executemany() and the
+    statements of triggers.
+
+    Statements are summed up by their SQL text, and also logged one by one in the
+    order they were executed. Time spent fetching rows counts for the statement
+    that produced them.
+    """
+
+    def __init__(self):
+        # normalized SQL text -> [calls, traced statements, total seconds]
+        self.statements = {}
+        # [start offset in seconds, duration in seconds, normalized SQL text] of
+        # every executed statement
+        self.log = []
+        self.start_time = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.connection_factory = make_connection_factory(self)
+
+    def start(self, statement):
+        """
+        Marks the start of executing statement on this thread and returns its log
+        entry.
+        """
+        sql = normalize_statement(statement)
+        entry = [time.perf_counter() - self.start_time, 0.0, sql]
+        with self._lock:
+            self.statements.setdefault(sql, [0, 0, 0.0])[0] += 1
+            self.log.append(entry)
+        self._local.sql = sql
+        return entry
+
+    def finish(self, entry, duration):
+        """
+        Adds duration seconds spent executing, or fetching the rows of, the
+        statement of a log entry.
+        """
+        self._local.sql = None
+        with self._lock:
+            entry[1] += duration
+            self.statements[entry[2]][2] += duration
+
+    def trace_statement(self, statement):
+        """
+        Counts a statement run by SQLite for the statement being executed on this
+        thread.
+        """
+        sql = getattr(self._local, "sql", None) or normalize_statement(statement)
+        with self._lock:
+            self.statements.setdefault(sql, [0, 0, 0.0])[1] += 1
+
+    def write_log(self, file):
+        """
+        Writes the start offset, duration and text of every executed statement to
+        file, one statement per line.
+        """
+        file.write("start ms\tduration ms\tstatement\n")
+        for start, duration, sql in self.log:
+            file.write(f"{start * 1000:.3f}\t{duration * 1000:.3f}\t{sql}\n")
+
+    def format_summary(self, limit=SUMMARY_LIMIT):
+        """
+        Returns a table of the limit statements that took the most time in total.
+        """
+        lines = [f"{'total ms':>10} {'calls':>7} {'statements':>10}  statement"]
+        ranked = sorted(self.statements.items(), key=lambda item: -item[1][2])
+        for sql, (calls, traced, duration) in ranked[:limit]:
+            if len(sql) > 100:
+                sql = sql[:97] + "..."
+            lines.append(f"{duration * 1000:10.3f} {calls:7} {traced:10}  {sql}")
+
+        return "\n".join(lines)
+
+
+def make_connection_factory(profiler):
+    """
+    Returns a sqlite3.Connection subclass whose statements are timed by profiler.
+    """
+
+    class ProfilingCursor(sqlite3.Cursor):
+        """
+        Cursor timing its statements and the fetching of their rows.
+        """
+
+        _entry = None
+
+        def execute(self, sql, parameters=()):
+            """
+            Executes a statement and times it.
+            """
+            entry = profiler.start(sql)
+            start_time = time.perf_counter()
+            try:
+                return super().execute(sql, parameters)
+            finally:
+                profiler.finish(entry, time.perf_counter() - start_time)
+                self._entry = entry
+
+        def executemany(self, sql, seq_of_parameters):
+            """
+            Executes a statement for every set of parameters and times it.
+            """
+            entry = profiler.start(sql)
+            start_time = time.perf_counter()
+            try:
+                return super().executemany(sql, seq_of_parameters)
+            finally:
+                profiler.finish(entry, time.perf_counter() - start_time)
+                self._entry = entry
+
+        def _fetch(self, fetch, *args):
+            """
+            Calls fetch(*args) and adds its time to the last executed statement.
+            """
+            if self._entry is None:
+                return fetch(*args)
+
+            start_time = time.perf_counter()
+            try:
+                return fetch(*args)
+            finally:
+                profiler.finish(self._entry, time.perf_counter() - start_time)
+
+        def fetchone(self):
+            """
+            Fetches the next row, timed like the statement.
+            """
+            return self._fetch(super().fetchone)
+
+        def fetchmany(self, size=None):
+            """
+            Fetches the next size rows, timed like the statement.
+            """
+            if size is None:
+                return self._fetch(super().fetchmany)
+            return self._fetch(super().fetchmany, size)
+
+        def fetchall(self):
+            """
+            Fetches the remaining rows, timed like the statement.
+            """
+            return self._fetch(super().fetchall)
+
+        def __next__(self):
+            """
+            Returns the next row when iterating, timed like the statement.
+            """
+            return self._fetch(super().__next__)
+
+    class ProfilingConnection(sqlite3.Connection):
+        """
+        Connection handing out ProfilingCursors, which also times the statements
+        executed on it directly and its commits and rollbacks.
+        """
+
+        def cursor(self, factory=None):
+            """
+            Returns a new ProfilingCursor, or a cursor of factory if one is given.
+            """
+            return super().cursor(ProfilingCursor if factory is None else factory)
+
+        def execute(self, sql, parameters=()):
+            """
+            Executes a statement on a new ProfilingCursor and returns the cursor.
+            """
+            return self.cursor().execute(sql, parameters)
+
+        def executemany(self, sql, seq_of_parameters):
+            """
+            Executes a statement for every set of parameters on a new
+            ProfilingCursor and returns the cursor.
+            """
+            return self.cursor().executemany(sql, seq_of_parameters)
+
+        def commit(self):
+            """
+            Commits the current transaction and times it.
+            """
+            entry = profiler.start("COMMIT")
+            start_time = time.perf_counter()
+            try:
+                super().commit()
+            finally:
+                profiler.finish(entry, time.perf_counter() - start_time)
+
+        def rollback(self):
+            """
+            Rolls back the current transaction and times it.
+            """
+            entry = profiler.start("ROLLBACK")
+            start_time = time.perf_counter()
+            try:
+                super().rollback()
+            finally:
+                profiler.finish(entry, time.perf_counter() - start_time)
+
+    return ProfilingConnection
+
+
+def run(function, args, output_path, limit=SUMMARY_LIMIT, sql_profiler=None):
+    """
+    Runs function(args) under cProfile and writes the statistics to output_path,
+    to be read with pstats, and the statements logged by sql_profiler to
+    output_path with a .sql suffix. When function returns or raises, a summary of
+    the limit functions with the most own time and, if given, the limit SQL
+    statements with the most total time is printed to standard error.
+    """
+    profile = cProfile.Profile()
+    try:
+        profile.runcall(function, args)
+    finally:
+        profile.dump_stats(output_path)
+        print(f"\nProfile written to {output_path}", file=sys.stderr)
+        stats = pstats.Stats(profile, stream=sys.stderr)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(limit)
+
+        if sql_profiler is not None:
+            sql_path = f"{output_path}.sql"
+            with open(sql_path, "w", encoding="utf-8") as file:
+                sql_profiler.write_log(file)
+            print(f"SQL statements written to {sql_path}\n", file=sys.stderr)
+            print(sql_profiler.format_summary(limit), file=sys.stderr)
@@ -0,0 +1,401 @@
+"""
+In-memory search index over the food catalog, for autocompletion and fuzzy lookups.
+"""
+
+import bisect
+import heapq
+import math
+import re
+import threading
+
+# minimum trigram similarity of a fuzzy matched word, the default of pg_trgm
+SIMILARITY_THRESHOLD = 0.3
+
+# largest code point, sorts after every other character of a prefix
+MAX_CHARACTER = chr(0x10FFFF)
+
+WORD_REGEX = re.compile(r"\w+")
+
+
+def get_words(text):
+    """
+    Returns the case folded words of text.
+    """
+    return WORD_REGEX.findall(text.casefold())
+
+
+def get_trigrams(word):
+    """
+    Returns the set of trigrams of a word, padded like pg_trgm does so that its
+    start weighs more than its end.
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodSearchIndex():
+    """
+    Indexes (food_name, portion_type) keys of foods for two kinds of lookups:
+
+        complete(prefix) - foods whose name starts with prefix
+        search(text)     - foods with a word similar to every word of text, for typos
+                           like "brocoli", using trigram similarity as pg_trgm does
+
+    Both rank their results by frequency, the number of record entries of a food,
+    so the foods used most often come first. Equally frequent foods are in
+    alphabetical order.
+
+    Foods are kept as (casefolded name, food_name, portion_type) entries in sorted
+    lists: one of all foods for prefix lookups, and one for every word of the
+    names, which the trigrams of the word point to for fuzzy lookups. The entries of
+    every word are also kept in a set, to intersect them when text has several
+    words. Most foods of a large catalog have never been recorded. Those all have a
+    frequency of 0 and are therefore already ranked by the order of the lists, so
+    lookups only need to rank the few recorded foods, which are kept apart, and can
+    then stop as soon as enough of the rest have been read.
+
+    Foods are added, updated and removed one at a time, touching only the entries of
+    that food, so the index is kept up to date incrementally instead of being
+    rebuilt. All methods are thread-safe.
+    """
+
+    def __init__(self, foods=()):
+        """
+        Builds the index from an iterable of (food_name, portion_type, frequency)
+        tuples.
+        """
+        self._lock = threading.RLock()
+        self._frequencies = {}
+        self._names = []
+        self._recorded_names = []
+        self._word_entries = {}
+        self._word_entry_sets = {}
+        self._word_recorded_entries = {}
+        self._trigram_words = {}
+        for food_name, portion_type, frequency in foods:
+            key = (food_name, portion_type)
+            entry = self._get_entry(key)
+            self._frequencies[key] = frequency
+            self._names.append(entry)
+            for word in get_words(food_name):
+                self._get_word_entries(word).append(entry)
+                self._word_entry_sets[word].add(entry)
+            if frequency:
+                self._set_recorded(entry, True)
+
+        # sorted once here instead of inserting every food in order
+        self._names.sort()
+        self._recorded_names.sort()
+        for entries in self._word_entries.values():
+            entries.sort()
+
+    def __len__(self):
+        return len(self._frequencies)
+
+    def __contains__(self, key):
+        return key in self._frequencies
+
+    @staticmethod
+    def _get_entry(key):
+        """
+        Returns the entry of a (food_name, portion_type) key in the sorted lists.
+        """
+        return (key[0].casefold(),) + key
+
+    def _get_word_entries(self, word):
+        """
+        Returns the sorted list of entries containing word, adding the word to the
+        index if it is new.
+        """
+        entries = self._word_entries.get(word)
+        if entries is None:
+            entries = self._word_entries[word] = []
+            self._word_entry_sets[word] = set()
+            for trigram in get_trigrams(word):
+                self._trigram_words.setdefault(trigram, set()).add(word)
+
+        return entries
+
+    def _set_recorded(self, entry, recorded):
+        """
+        Adds entry to, or removes it from, the entries of recorded foods.
+        """
+        if recorded:
+            bisect.insort(self._recorded_names, entry)
+        else:
+            remove_sorted(self._recorded_names, entry)
+
+        for word in get_words(entry[1]):
+            if recorded:
+                self._word_recorded_entries.setdefault(word, set()).add(entry)
+            else:
+                self._word_recorded_entries[word].discard(entry)
+
+    def add(self, food_name, portion_type="", frequency=0):
+        """
+        Adds a food, or sets its frequency if it is already indexed.
+        """
+        key = (food_name, portion_type)
+        entry = self._get_entry(key)
+        with self._lock:
+            old_frequency = self._frequencies.get(key)
+            self._frequencies[key] = frequency
+            if old_frequency is None:
+                bisect.insort(self._names, entry)
+                for word in get_words(food_name):
+                    bisect.insort(self._get_word_entries(word), entry)
+                    self._word_entry_sets[word].add(entry)
+
+            if bool(frequency) != bool(old_frequency):
+                self._set_recorded(entry, bool(frequency))
+
+    def remove(self, food_name, portion_type=""):
+        """
+        Removes a food, if it is indexed.
+        """
+        key = (food_name, portion_type)
+        entry = self._get_entry(key)
+        with self._lock:
+            if key not in self._frequencies:
+                return
+
+            if self._frequencies.pop(key):
+                self._set_recorded(entry, False)
+            remove_sorted(self._names, entry)
+            for word in get_words(food_name):
+                entries = self._word_entries[word]
+                remove_sorted(entries, entry)
+                self._word_entry_sets[word].discard(entry)
+                if entries:
+                    continue
+
+                del self._word_entries[word]
+                del self._word_entry_sets[word]
+                self._word_recorded_entries.pop(word, None)
+                for trigram in get_trigrams(word):
+                    words = self._trigram_words[trigram]
+                    words.discard(word)
+                    if not words:
+                        del self._trigram_words[trigram]
+
+    def get_frequency(self, food_name, portion_type=""):
+        """
+        Returns the number of record entries of a food, None if it is not indexed.
+        """
+        return self._frequencies.get((food_name, portion_type))
+
+    def _get_rank(self, entry):
+        return -self._frequencies[entry[1:]]
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns the keys of up to limit foods whose name starts with prefix, ignoring
+        case, the most frequent first.
+        """
+        folded_prefix = prefix.casefold()
+        end_entry = (folded_prefix + MAX_CHARACTER,)
+        with self._lock:
+            start = bisect.bisect_left(self._recorded_names, (folded_prefix,))
+            end = bisect.bisect_left(self._recorded_names, end_entry)
+            # nsmallest() is stable, so ties stay in alphabetical order
+            entries = heapq.nsmallest(
+                limit, self._recorded_names[start:end], key=self._get_rank
+            )
+
+            index = bisect.bisect_left(self._names, (folded_prefix,))
+            while len(entries) < limit and index < len(self._names):
+                entry = self._names[index]
+                if entry >= end_entry:
+                    break
+                if not self._frequencies[entry[1:]]:
+                    entries.append(entry)
+                index += 1
+
+        return [entry[1:] for entry in entries]
+
+    def _get_similar_words(self, word, threshold):
+        """
+        Returns a dictionary mapping the indexed words whose trigram similarity to
+        word is at least threshold to that similarity.
+
+        Similarity is the number of trigrams two words share divided by the number of
+        trigrams in either of them. A match shares at least min_shared of the n
+        trigrams of word, so it is in at least one of the n - min_shared + 1
+        shortest posting lists, and only words in those are counted as candidates.
+        """
+        trigrams = get_trigrams(word)
+        # rounded first so that e.g. 0.3 * 10 does not round up to 4
+        min_shared = max(1, math.ceil(round(threshold * len(trigrams), 9)))
+        postings = sorted(
+            (self._trigram_words.get(trigram, ()) for trigram in trigrams), key=len
+        )
+        candidate_count = len(postings) - min_shared + 1
+
+        shared = {}
+        for words in postings[:candidate_count]:
+            for candidate in words:
+                shared[candidate] = shared.get(candidate, 0) + 1
+        for words in postings[candidate_count:]:
+            for candidate in shared:
+                if candidate in words:
+                    shared[candidate] += 1
+
+        similar_words = {}
+        for candidate, count in shared.items():
+            similarity = count / (len(trigrams) + len(get_trigrams(candidate)) - count)
+            if similarity >= threshold:
+                similar_words[candidate] = similarity
+
+        return similar_words
+
+    def search(self, text, limit=10, threshold=SIMILARITY_THRESHOLD):
+        """
+        Returns the keys of up to limit foods which have a word with a trigram
+        similarity of at least threshold to each word of text. The foods whose words
+        are the most similar come first, equally similar foods by frequency.
+        """
+        with self._lock:
+            word_matches = []
+            for word in get_words(text):
+                similar_words = self._get_similar_words(word, threshold)
+                if not similar_words:
+                    return []
+                word_matches.append(similar_words)
+
+            if not word_matches:
+                return []
+            if len(word_matches) == 1:
+                entries = self._search_word(word_matches[0], limit)
+            else:
+                entries = self._search_words(word_matches, limit)
+
+        return [entry[1:] for entry in entries]
+
+    def _search_word(self, similar_words, limit):
+        """
+        Returns up to limit entries containing one of similar_words, ranked by the
+        highest similarity of their words and then by frequency.
+
+        Words of equal similarity form a tier. Within a tier the recorded foods come
+        first, followed by the rest in the merged order of the word lists. Those
+        lists are only read until limit entries have been found.
+        """
+        tiers = {}
+        for word, similarity in similar_words.items():
+            tiers.setdefault(similarity, []).append(word)
+
+        results = []
+        seen = set()
+        for similarity in sorted(tiers, reverse=True):
+            words = tiers[similarity]
+            recorded_entries = set().union(
+                *(self._word_recorded_entries.get(word, ()) for word in words)
+            )
+            recorded_entries -= seen
+            seen |= recorded_entries
+            results += sorted(
+                recorded_entries, key=lambda entry: (self._get_rank(entry), entry)
+            )
+
+            for entry in heapq.merge(*(self._word_entries[word] for word in words)):
+                if len(results) >= limit:
+                    return results[:limit]
+                if entry in seen:
+                    continue
+                seen.add(entry)
+                if not self._frequencies[entry[1:]]:
+                    results.append(entry)
+
+        return results[:limit]
+
+    def _search_words(self, word_matches, limit):
+        """
+        Returns up to limit entries containing a similar word for every dictionary of
+        similar words in word_matches, ranked by the sum of the highest similarity
+        for each and then by frequency.
+
+        Entries are only handled in sets, never one by one: set operations reuse the
+        hashes the sets store, while hashing an entry tuple again costs more than
+        the lookup itself. Entries are grouped by their score, which only takes a
+        few distinct values, and ranked a group at a time like in _search_word().
+        """
+        # the candidates are the foods of the word matching the fewest foods, the
+        # others only need to be looked up for those
+        word_matches.sort(
+            key=lambda similar_words: sum(
+                len(self._word_entries[word]) for word in similar_words
+            )
+        )
+        candidates = union(self._word_entry_sets[word] for word in word_matches[0])
+        for similar_words in word_matches[1:]:
+            candidates = union(
+                self._word_entry_sets[word] & candidates for word in similar_words
+            )
+            if not candidates:
+                return []
+
+        # similar words are visited from the most to the least similar, so that each
+        # entry is scored with the highest similarity of its words
+        score_groups = {0: candidates}
+        for similar_words in word_matches:
+            new_score_groups = {}
+            for score, group in score_groups.items():
+                for word, similarity in sorted(
+                    similar_words.items(), key=by_similarity, reverse=True
+                ):
+                    entries = self._word_entry_sets[word] & group
+                    if not entries:
+                        continue
+                    group = group - entries
+                    if score + similarity in new_score_groups:
+                        new_score_groups[score + similarity] |= entries
+                    else:
+                        new_score_groups[score + similarity] = entries
+            score_groups = new_score_groups
+
+        recorded_entries = candidates.intersection(set().union(
+            *(self._word_recorded_entries.get(word, ()) for word in word_matches[0])
+        ))
+        results = []
+        for score in sorted(score_groups, reverse=True):
+            group = score_groups[score]
+            group_recorded_entries = group & recorded_entries
+            results += sorted(
+                group_recorded_entries,
+                key=lambda entry: (self._get_rank(entry), entry),
+            )
+            if len(results) >= limit:
+                break
+            results += heapq.nsmallest(
+                limit - len(results), group - group_recorded_entries
+            )
+            if len(results) >= limit:
+                break
+
+        return results[:limit]
+
+
+def by_similarity(similar_word):
+    """
+    Sort key of (word, similarity) items.
+    """
+    return similar_word[1]
+
+
+def union(sets):
+    """
+    Returns the union of an iterable of sets, which is the only set itself instead
+    of a copy if there is just one. The result must therefore not be modified.
+    """
+    sets = list(sets)
+    if len(sets) == 1:
+        return sets[0]
+
+    return set().union(*sets)
+
+
+def remove_sorted(entries, entry):
+    """
+    Removes entry from the sorted list entries.
+    """
+    del entries[bisect.bisect_left(entries, entry)]
@@ -0,0 +1,253 @@
+"""
+Long-running HTTP/JSON server exposing the calorie tracker.
+
+Endpoints:
+    GET  /foods?food_name=&portion_type=&match=  - foods, optionally matching
+    POST /foods                                  - add a food
+    GET  /entries?start=&end=                    - record entries in a date range
+    POST /entries                                - add an entry, or a list of them
+    GET  /summary?start=&end=                    - total calories per day
+    GET  /stats                                  - metrics of the ORM, if collected
+
+Dates accept everything a QueryData date does and default to today. Request bodies
+are validated like imported rows, see transfer.parse_row(). Invalid requests are
+answered with 400, adding a food that already exists with 409 and failures of the
+server itself with 500.
+"""
+
+import json
+import logging
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import db
+import transfer
+
+
+def parse_ingredients(ingredients):
+    """
+    Validates the ingredients of a posted food, a list of
+    [food_name, portion_type, servings] lists, and returns them as a list of
+    tuples. Raises ValueError if they are invalid.
+    """
+    if not isinstance(ingredients, list):
+        raise ValueError("ingredients must be a list")
+
+    parsed_ingredients = []
+    for ingredient in ingredients:
+        if not isinstance(ingredient, list) or len(ingredient) != 3:
+            raise ValueError(
+                "every ingredient must be a [food_name, portion_type, servings] list"
+            )
+        food_name, portion_type, servings = ingredient
+        food = transfer.parse_row(
+            "foods", {"food_name": food_name, "portion_type": portion_type}
+        )
+        servings = transfer.parse_integer(servings, "servings")
+        if servings is not None and servings < 1:
+            raise ValueError(f"servings must be positive, not {servings}")
+        parsed_ingredients.append(
+            (food.food_name, food.portion_type, 1 if servings is None else servings)
+        )
+
+    return parsed_ingredients
+
+
+def row_to_json(row):
+    """
+    Converts a FoodRow or RecordRow to a JSON serializable dictionary.
+    """
+    data = row.get_dict()
+    if "date" in data:
+        data["date"] = data["date"].isoformat()
+
+    return data
+
+
+class TrackerServer(ThreadingHTTPServer):
+    """
+    HTTP server handling every request on its own thread with one shared, warm ORM.
+    Entry writes go through a BatchWriter, so writes of concurrent requests are
+    committed together.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, orm):
+        super().__init__(server_address, TrackerRequestHandler)
+        self.orm = orm
+        self.writer = db.BatchWriter(orm)
+
+    def server_close(self):
+        super().server_close()
+        self.writer.close()
+
+
+class TrackerRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes requests to the ORM and answers them with JSON.
+    """
+
+    server_version = "CalorieTracker/1.0"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Handle GET requests.
+        """
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        routes = {
+            "/foods": self.get_foods,
+            "/entries": self.get_entries,
+            "/summary": self.get_summary,
+            "/stats": self.get_stats,
+        }
+        self.handle_route(routes, url.path, query)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Handle POST requests.
+        """
+        routes = {
+            "/foods": self.post_food,
+            "/entries": self.post_entries,
+        }
+        self.handle_route(routes, urlsplit(self.path).path, None)
+
+    def handle_route(self, routes, route, query):
+        """
+        Calls the handler of the route with either the query parameters or the JSON
+        request body, and sends its result back.
+        """
+        if route not in routes:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {route}"})
+            return
+
+        try:
+            if query is None:
+                length = int(self.headers.get("Content-Length", 0))
+                query = json.loads(self.rfile.read(length) or "{}")
+            status, data = routes[route](query)
+        except ValueError as e:
+            # also raised for malformed JSON, dates and numbers
+            logging.warning("Bad request to %s: %s", route, e)
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Request to %s failed", route)
+            self.send_json(
+                HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"}
+            )
+            return
+
+        self.send_json(status, data)
+
+    def send_json(self, status, data):
+        """
+        Send data as a JSON response.
+        """
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.info("%s - %s", self.address_string(), format % args)
+
+    def get_foods(self, query):
+        """
+        List foods, optionally matching food_name and portion_type.
+        """
+        match_data = db.QueryData(
+            food_name=query.get("food_name"), portion_type=query.get("portion_type")
+        )
+        foods = self.server.orm.get_rows_from_table(
+            "foods", match_data, query.get("match", "exact")
+        )
+
+        return HTTPStatus.OK, [row_to_json(food) for food in foods]
+
+    def get_entries(self, query):
+        """
+        List record entries from start to end.
+        """
+        entries = self.server.orm.get_records_between(
+            query.get("start", "today"), query.get("end", "today")
+        )
+
+        return HTTPStatus.OK, [row_to_json(entry) for entry in entries]
+
+    def get_summary(self, query):
+        """
+        List the total calories of every day from start to end.
+        """
+        totals = self.server.orm.daily_totals(
+            query.get("start", "today"), query.get("end", "today")
+        )
+
+        return HTTPStatus.OK, [
+            {"date": day.isoformat(), "calories": calories} for day, calories in totals
+        ]
+
+    def get_stats(self, _query):
+        """
+        Dump the metrics the ORM collected since the server started.
+        """
+        metrics = self.server.orm.get_metrics()
+        if metrics is None:
+            return HTTPStatus.NOT_FOUND, {"error": "Metrics are not collected"}
+
+        return HTTPStatus.OK, metrics.to_dict()
+
+    def post_food(self, data):
+        """
+        Add a food, with optional ingredients as [food_name, portion_type, servings]
+        lists. Nothing is changed if the food already exists.
+        """
+        new_data = transfer.parse_row("foods", transfer.decode_row(data))
+        ingredients = parse_ingredients(data.get("ingredients") or [])
+        added = self.server.writer.submit(
+            self.server.orm.add_row_to_table, "foods", new_data
+        ).result()
+        if not added:
+            return HTTPStatus.CONFLICT, {"error": "Food already exists"}
+
+        if ingredients:
+            self.server.writer.submit(
+                self.server.orm.set_food_ingredients,
+                new_data.food_name,
+                new_data.portion_type,
+                ingredients,
+            ).result()
+
+        return HTTPStatus.CREATED, row_to_json(new_data)
+
+    def post_entries(self, data):
+        """
+        Add a record entry, or a list of them in one go.
+        """
+        entries = [
+            transfer.parse_row("record", {"date": "today", **transfer.decode_row(entry)})
+            for entry in (data if isinstance(data, list) else [data])
+        ]
+        self.server.writer.submit(
+            self.server.orm.add_rows_to_table, "record", entries
+        ).result()
+
+        return HTTPStatus.CREATED, [row_to_json(entry) for entry in entries]
+
+
+def serve(orm, host="127.0.0.1", port=8080):
+    """
+    Serve the tracker over HTTP until interrupted.
+    """
+    with TrackerServer((host, port), orm) as server:
+        logging.info("Serving on http://%s:%s", host, port)
+        print(f"Serving on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,187 @@
+"""
+Interactive shell accepting the commands of the command line interface in a loop.
+"""
+
+import cmd
+import logging
+import shlex
+
+import cli
+
+# seconds after which the writes of a shell session are committed at the latest
+COMMIT_INTERVAL = 60
+
+# commands which only write, so they don't need queued writes to be committed first
+WRITE_COMMANDS = ("food", "entry")
+
+# options of the command line which apply to the whole run, by their dest, and
+# therefore can only be given when the shell is started
+GLOBAL_OPTIONS = {
+    "profile": "--profile",
+    "profile_output": "--profile-output",
+    "user": "--user",
+}
+
+# options whose values are not food names
+VALUE_OPTIONS = ("--type", "--servings", "--date", "--start", "--end")
+
+# most food names offered for completion, the most frequently recorded first
+COMPLETION_LIMIT = 50
+
+
+class TrackerShell(cmd.Cmd):
+    """
+    Reads commands with the same syntax as the command line, e.g.
+
+        > entry bread --type slice --servings 2
+        > summary --start yesterday
+
+    and runs them with the handler of their command, a function taking the ORM and
+    the parsed arguments. The ORM is kept open for the whole session, so commands
+    run without paying for the interpreter start up and database open every time.
+    Food names are completed with tab from the food search index of the ORM.
+
+    The ORM is expected to be in group commit mode, so that all writes of a session
+    are committed together. Queued writes are committed before any command that
+    reads, on `commit` and when the shell is left.
+    """
+
+    intro = "Calorie tracker shell. Type help for a list of commands, quit to leave."
+    prompt = "> "
+
+    def __init__(self, orm, handlers, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+        self.orm = orm
+        self.handlers = handlers
+
+    def default(self, line):
+        """
+        Parses line as a command of the command line interface and runs it.
+        """
+        try:
+            words = shlex.split(line)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=self.stdout)
+            return
+
+        try:
+            args = cli.parser.parse_args(words)
+        except SystemExit:
+            # argparse has already printed the usage or help
+            return
+
+        global_options = [
+            option for dest, option in GLOBAL_OPTIONS.items()
+            if getattr(args, dest) != cli.parser.get_default(dest)
+        ]
+        if global_options:
+            print(
+                f"ERROR: {', '.join(global_options)} can only be given when starting "
+                "the shell",
+                file=self.stdout,
+            )
+            return
+
+        if args.subparser_name not in self.handlers:
+            print(
+                f"{args.subparser_name} is not available in the shell", file=self.stdout
+            )
+            return
+
+        if args.subparser_name not in WRITE_COMMANDS:
+            self.orm.flush()
+        try:
+            self.handlers[args.subparser_name](self.orm, args)
+        except Exception as e:  # pylint: disable=broad-except
+            logging.error("%s failed: %s", args.subparser_name, e)
+            print(f"ERROR: {e}", file=self.stdout)
+            return
+
+        if args.subparser_name == "food":
+            # complete new foods right away instead of once they are committed
+            food_index = self.orm.get_food_index()
+            if (args.food, args.type or "") not in food_index:
+                food_index.add(args.food, args.type or "")
+
+    def emptyline(self):
+        """
+        Do nothing on an empty line instead of repeating the last command.
+        """
+
+    def complete_food_name(self, prefix):
+        """
+        Returns the names of known foods starting with prefix, the most frequently
+        recorded first.
+        """
+        keys = self.orm.get_food_index().complete(prefix, COMPLETION_LIMIT)
+        return list(dict.fromkeys(food_name for food_name, _ in keys))
+
+    def completenames(self, text, *ignored):
+        names = super().completenames(text, *ignored)
+        return sorted(names + [name for name in self.handlers if name.startswith(text)])
+
+    def completedefault(self, text, line, begidx, endidx):
+        previous_words = line[:begidx].split()
+        if previous_words and previous_words[-1] in VALUE_OPTIONS:
+            return []
+
+        return self.complete_food_name(text)
+
+    def do_commit(self, _):
+        """
+        Commit the writes of the session so far.
+        """
+        self.orm.flush()
+        print("Committed", file=self.stdout)
+
+    def do_quit(self, _):
+        """
+        Commit the writes of the session and leave the shell.
+        """
+        return True
+
+    def do_EOF(self, _):  # pylint: disable=invalid-name
+        """
+        Leave the shell on end of input.
+        """
+        print(file=self.stdout)
+        return True
+
+    def help_food(self):
+        """
+        Show the usage of the food command.
+        """
+        cli.food_parser.print_help(self.stdout)
+
+    def help_entry(self):
+        """
+        Show the usage of the entry command.
+        """
+        cli.entry_parser.print_help(self.stdout)
+
+    def help_summary(self):
+        """
+        Show the usage of the summary command.
+        """
+        cli.summary_parser.print_help(self.stdout)
+
+    def help_stats(self):
+        """
+        Show the usage of the stats command.
+        """
+        cli.stats_parser.print_help(self.stdout)
+
+
+def run(orm, handlers):
+    """
+    Runs the shell until it is left, then commits its writes and closes the ORM.
+    """
+    shell = TrackerShell(orm, handlers)
+    try:
+        shell.cmdloop()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        orm.close()
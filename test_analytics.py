@@ -0,0 +1,111 @@
+"""
+Unit tests for analytics.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import unittest
+from unittest.case import TestCase
+from datetime import date, timedelta
+
+import db
+
+try:
+    import numpy
+    import analytics
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestRecordHistory(TestCase):
+    """
+    Test the columnar analysis of the record history
+    """
+
+    def setUp(self):
+        self.orm = db.CalorieCounterORM(":memory:")
+        self.orm.add_rows_to_table(
+            "foods",
+            [
+                db.QueryData(food_name="broccoli", portion_type="head", calories=30),
+                db.QueryData(food_name="coffee", calories=5),
+            ],
+        )
+        self.orm.add_rows_to_table(
+            "record",
+            [
+                db.QueryData(date=date(2020, 5, 1), food_name="broccoli",
+                             portion_type="head", servings=2),
+                db.QueryData(date=date(2020, 5, 1), food_name="coffee", servings=4),
+                db.QueryData(date=date(2020, 5, 3), food_name="coffee"),
+                db.QueryData(date=date(2020, 5, 3), food_name="unknown food"),
+                db.QueryData(date=date(2020, 6, 1), food_name="broccoli",
+                             portion_type="head"),
+            ],
+        )
+        self.history = analytics.load_history(
+            self.orm, date(2020, 5, 1), date(2020, 5, 4)
+        )
+
+    def tearDown(self):
+        self.orm.close()
+
+    def test_columns(self):
+        self.assertEqual(len(self.history), 4)
+        self.assertEqual(
+            self.history.day_ordinals.tolist(),
+            [date(2020, 5, 1).toordinal()] * 2 + [date(2020, 5, 3).toordinal()] * 2,
+        )
+        self.assertEqual(sorted(self.history.calories.tolist()), [0, 5, 20, 60])
+        self.assertIn(-1, self.history.food_ids.tolist())
+
+    def test_daily_totals(self):
+        self.assertEqual(self.history.daily_totals().tolist(), [80, 0, 5, 0])
+        self.assertEqual(
+            self.history.get_days().tolist(),
+            [date(2020, 5, day).toordinal() for day in range(1, 5)],
+        )
+
+    def test_rolling_mean(self):
+        means = self.history.rolling_mean(2)
+        self.assertTrue(numpy.isnan(means[0]))
+        self.assertEqual(means[1:].tolist(), [40, 2.5, 2.5])
+        self.assertTrue(numpy.isnan(self.history.rolling_mean(7)).all())
+
+    def test_food_contributions(self):
+        self.assertEqual(
+            self.history.food_contributions(),
+            [
+                (("broccoli", "head"), 60, 0.7058823529411765),
+                (("coffee", ""), 25, 0.29411764705882354),
+                (None, 0, 0.0),
+            ],
+        )
+
+    def test_ten_years_of_history(self):
+        start = date(2010, 1, 1)
+        self.orm.add_rows_to_table(
+            "record",
+            [
+                db.QueryData(date=start + timedelta(days=day), food_name=food_name)
+                for day in range(3653)
+                for food_name in ("broccoli", "coffee", "tea")
+            ],
+        )
+
+        history = analytics.load_history(self.orm, start, date(2019, 12, 31))
+        self.assertEqual(len(history), 3 * 3652)
+        # broccoli has no portion type, so only coffee is a known food
+        self.assertEqual(history.daily_totals().tolist(), [5] * 3652)
+        means = history.rolling_mean(30)
+        self.assertTrue(numpy.isnan(means[:29]).all())
+        self.assertTrue((means[29:] == 5).all())
+        self.assertEqual(
+            history.food_contributions(),
+            [(("coffee", ""), 5 * 3652, 1.0), (None, 0, 0.0)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
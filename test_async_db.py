@@ -0,0 +1,100 @@
+"""
+Unit tests for async_db.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import async_db
+import db
+
+
+class TestAsyncCalorieCounterORM(unittest.IsolatedAsyncioTestCase):
+    """
+    Test the asyncio front-end of the ORM
+    """
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        db_path = os.path.join(self.tmp_dir.name, "test.db")
+        self.orm = await async_db.AsyncCalorieCounterORM.open(db_path)
+        await self.orm.add_rows_to_table(
+            "foods",
+            [
+                db.QueryData(food_name="broccoli", portion_type="head", calories=30),
+                db.QueryData(food_name="bread", portion_type="slice", calories=80),
+            ],
+        )
+
+    async def asyncTearDown(self):
+        await self.orm.close()
+        self.tmp_dir.cleanup()
+
+    async def test_concurrent_writes_share_transactions(self):
+        batch_count = self.orm.writer.batch_count
+        # the writer thread waits for the lock until every write has been submitted,
+        # instead of possibly writing each one as soon as it arrives
+        with self.orm.orm.pool.write_lock:
+            writes = asyncio.gather(*(
+                self.orm.add_row_to_table(
+                    "record",
+                    db.QueryData(date=date(2020, 5, 15), food_name="broccoli",
+                                 portion_type="head"),
+                )
+                for _ in range(50)
+            ))
+            await asyncio.sleep(0)
+        await writes
+
+        self.assertLess(self.orm.writer.batch_count - batch_count, 50)
+        self.assertEqual(
+            await self.orm.daily_totals(date(2020, 5, 15), date(2020, 5, 15)),
+            [(date(2020, 5, 15), 1500)],
+        )
+        rows = await self.orm.get_rows_from_table("record")
+        self.assertEqual(rows[0].servings, 50)
+
+    async def test_failed_write_does_not_affect_others(self):
+        results = await asyncio.gather(
+            self.orm.set_food_ingredients("bread", "slice", [("bread", "slice", 1)]),
+            self.orm.update_row_in_table(
+                "foods", db.QueryData(calories=40), db.QueryData(food_name="broccoli")
+            ),
+            return_exceptions=True,
+        )
+
+        self.assertIsInstance(results[0], ValueError)
+        self.assertIsNone(results[1])
+        self.assertEqual(await self.orm.get_food_calories("broccoli", "head"), 40)
+        self.assertEqual(await self.orm.get_food_calories("bread", "slice"), 80)
+
+    async def test_reads(self):
+        self.assertEqual(
+            await self.orm.get_food("broccoli", "head"),
+            db.FoodRow("broccoli", "head", 30, 30),
+        )
+        await self.orm.delete_rows_in_table("foods", db.QueryData(food_name="bread"))
+        self.assertEqual(
+            len(await self.orm.get_rows_from_table("foods")), 1
+        )
+        self.assertEqual(
+            await self.orm.get_records_between(date(2020, 1, 1), date(2020, 12, 31)),
+            [],
+        )
+
+    async def test_open_with_pool_size(self):
+        db_path = os.path.join(self.tmp_dir.name, "test.db")
+        async with await async_db.AsyncCalorieCounterORM.open(
+            db_path, reader_threads=4, pool_size=2
+        ) as orm:
+            self.assertEqual(orm.orm.pool.size, 2)
+            self.assertEqual(await orm.get_food_calories("bread", "slice"), 80)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Unit tests for dates.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import unittest
+from datetime import date
+from unittest.case import TestCase
+
+import dates
+
+
+class TestParseDate(TestCase):
+    """
+    Test converting date strings to dates
+    """
+
+    def test_absolute_dates(self):
+        for date_string in ("15-05-2020", "15052020", "1552020", "2020-05-15"):
+            with self.subTest(date_string=date_string):
+                self.assertEqual(dates.parse_date(date_string), date(2020, 5, 15))
+
+    def test_relative_dates(self):
+        today = date(2020, 12, 31)
+        self.assertEqual(dates.parse_date("today", today), today)
+        self.assertEqual(dates.parse_date("TOMORROW", today), date(2021, 1, 1))
+        self.assertEqual(dates.parse_date("yesterday", today), date(2020, 12, 30))
+        self.assertEqual(dates.parse_date("today"), date.today())
+
+    def test_dates_without_year_are_in_the_current_year(self):
+        self.assertEqual(dates.parse_date("1505", date(2019, 1, 1)), date(2019, 5, 15))
+        self.assertEqual(dates.parse_date("15-05", date(2021, 1, 1)), date(2021, 5, 15))
+        self.assertEqual(dates.parse_date("29-02", date(2020, 1, 1)), date(2020, 2, 29))
+        with self.assertRaises(ValueError):
+            dates.parse_date("29-02", date(2021, 1, 1))
+
+    def test_invalid_dates(self):
+        for date_string in ("", "someday", "15/05/2020", "32-05-2020", "2020-13-01"):
+            with self.subTest(date_string=date_string):
+                with self.assertRaises(ValueError):
+                    dates.parse_date(date_string)
+
+    def test_conversions_are_memoized(self):
+        dates.parse_date("16-05-2020")
+        hits = dates._parse_date_string.cache_info().hits  # pylint: disable=protected-access
+        self.assertEqual(dates.parse_date("16-05-2020"), date(2020, 5, 16))
+        self.assertEqual(
+            dates._parse_date_string.cache_info().hits,  # pylint: disable=protected-access
+            hits + 1,
+        )
+
+
+class TestParseDates(TestCase):
+    """
+    Test converting columns of date strings
+    """
+
+    def test_column(self):
+        self.assertEqual(
+            dates.parse_dates(["15-05-2020", "2020-05-16", "15-05-2020", "today"]),
+            [date(2020, 5, 15), date(2020, 5, 16), date(2020, 5, 15), date.today()],
+        )
+
+    def test_invalid_values(self):
+        self.assertEqual(
+            dates.parse_dates(["someday", None, 15052020, ["2020-05-15"], "15052020"]),
+            [None, None, None, None, date(2020, 5, 15)],
+        )
+        self.assertEqual(dates.parse_dates(["someday"], invalid=False), [False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,22 +4,77 @@ Unit tests for db.py
 
 # pylint: disable=missing-function-docstring
 
+import os
 import sqlite3
+import tempfile
+import threading
 import unittest
+from unittest import mock
 from unittest.case import TestCase
-from datetime import date
+from datetime import date, timedelta
 
 import db
 
 
+LEGACY_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS record (
+        date text,
+        food_name text,
+        portion_type text,
+        servings integer
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS foods (
+        food_name text,
+        portion_type text,
+        calories integer
+    )
+    """,
+]
+
+
+class DatabaseFileTestCase(TestCase):
+    """
+    Creates a database file in a temporary directory which is opened both directly
+    through sqlite3 (self.db_connection) and through the ORM (self.orm).
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.db_path = os.path.join(self.tmp_dir.name, "test.db")
+        self.db_connection = sqlite3.connect(self.db_path)
+        cursor = self.db_connection.cursor()
+        for statement in LEGACY_SCHEMA:
+            cursor.execute(statement)
+        self.populate(cursor)
+        self.db_connection.commit()
+        self.orm = db.CalorieCounterORM(self.db_path)
+
+    def populate(self, cursor):
+        """
+        Hook for subclasses to insert test data.
+        """
+
+    def tearDown(self):
+        self.orm.close()
+        self.db_connection.close()
+        self.tmp_dir.cleanup()
+
+
 class TestCreateDatabase(TestCase):
     """
     Test the creation of a new database
     """
 
     def test_create_db(self):
-        with sqlite3.connect(":memory:") as db_connection:
-            # first verify that database has no tables
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "test.db")
+            self.assertFalse(os.path.exists(db_path))
+            db.CalorieCounterORM(db_path).close()
+
+            db_connection = sqlite3.connect(db_path)
             cursor = db_connection.cursor()
             cursor.execute(
                 """
@@ -29,83 +84,51 @@ class TestCreateDatabase(TestCase):
             """
             )
             query = cursor.fetchall()
-            self.assertFalse(("record",) in query)
-            self.assertFalse(("foods",) in query)
-            db.create_db_and_tables(db_connection)
-            cursor.execute(
-                """
-                SELECT name
-                FROM sqlite_master
-                WHERE type='table'
-            """
-            )
-            query = cursor.fetchall()
+            db_connection.close()
             self.assertTrue(("record",) in query)
             self.assertTrue(("foods",) in query)
 
+    def test_create_in_memory_db(self):
+        with db.CalorieCounterORM(":memory:") as orm:
+            orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+            self.assertEqual(len(orm.get_rows_from_table("foods")), 1)
+
 
-class TestDatabaseWithEmptyTables(TestCase):
+class TestDatabaseWithEmptyTables(DatabaseFileTestCase):
     """
     Run tests on databases that have tables but no data
     """
 
-    def setUp(self):
-        self.db_connection = sqlite3.connect(":memory:")
-        cursor = self.db_connection.cursor()
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS record (
-                date text,
-                food_name text,
-                portion_type text,
-                servings integer
-            )
-        """
-        )
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS foods (
-                food_name text,
-                portion_type text,
-                calories integer
-            )
-        """
-        )
-        self.db_connection.commit()
-
-    def tearDown(self):
-        self.db_connection.close()
-
     def test_get_empty_rows(self):
-        record_rows = db.get_rows_from_table(self.db_connection, "record")
-        foods_rows = db.get_rows_from_table(self.db_connection, "foods")
+        record_rows = self.orm.get_rows_from_table("record")
+        foods_rows = self.orm.get_rows_from_table("foods")
         self.assertEqual([], record_rows)
         self.assertEqual([], foods_rows)
 
     def test_add_row_to_record_table(self):
-        db.add_row_to_table(
-            self.db_connection, "record", food_name="broccoli", date=date(2020, 5, 15)
+        self.orm.add_row_to_table(
+            "record", db.QueryData(food_name="broccoli", date=date(2020, 5, 15))
         )
 
         cursor = self.db_connection.cursor()
         cursor.execute(
             """
-            SELECT *
+            SELECT date, food_name, portion_type, servings
             FROM record
         """
         )
         rows = cursor.fetchall()
-        self.assertEqual(rows, [("15-05-2020", "broccoli", "", 1)])
+        self.assertEqual(rows, [("2020-05-15", "broccoli", "", 1)])
 
     def test_add_row_to_foods_table(self):
-        db.add_row_to_table(
-            self.db_connection, "foods", food_name="broccoli", calories=50
+        self.orm.add_row_to_table(
+            "foods", db.QueryData(food_name="broccoli", calories=50)
         )
 
         cursor = self.db_connection.cursor()
         cursor.execute(
             """
-            SELECT *
+            SELECT food_name, portion_type, calories
             FROM foods
         """
         )
@@ -116,33 +139,12 @@ class TestDatabaseWithEmptyTables(TestCase):
     #     pass
 
 
-class TestDatabaseWithData(TestCase):
+class TestDatabaseWithData(DatabaseFileTestCase):
     """
     Run tests on databases that have test data
     """
 
-    def setUp(self):
-        self.db_connection = sqlite3.connect(":memory:")
-        cursor = self.db_connection.cursor()
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS record (
-                date text,
-                food_name text,
-                portion_type text,
-                servings integer
-            )
-        """
-        )
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS foods (
-                food_name text,
-                portion_type text,
-                calories integer
-            )
-        """
-        )
+    def populate(self, cursor):
         cursor.execute(
             """
             INSERT INTO record
@@ -190,23 +192,19 @@ class TestDatabaseWithData(TestCase):
                 200
         )"""
         )
-        self.db_connection.commit()
-
-    def tearDown(self):
-        self.db_connection.close()
 
     def test_get_rows_with_no_match_critera(self):
-        record_rows = db.get_rows_from_table(self.db_connection, "record")
-        foods_rows = db.get_rows_from_table(self.db_connection, "foods")
+        record_rows = self.orm.get_rows_from_table("record")
+        foods_rows = self.orm.get_rows_from_table("foods")
         self.assertEqual(len(record_rows), 2)
         self.assertEqual(len(foods_rows), 3)
 
     def test_get_rows_with_single_match_criteria(self):
-        record_rows = db.get_rows_from_table(
-            self.db_connection, "record", match_food_name="apple sauce"
+        record_rows = self.orm.get_rows_from_table(
+            "record", db.QueryData(food_name="apple sauce")
         )
         self.assertEqual(
-            record_rows[0],
+            record_rows[0].get_dict(),
             {
                 "date": date(1895, 10, 19),
                 "food_name": "apple sauce",
@@ -214,24 +212,25 @@ class TestDatabaseWithData(TestCase):
                 "servings": 5,
             },
         )
-        foods_rows = db.get_rows_from_table(
-            self.db_connection, "foods", match_food_name="apple sauce"
+        foods_rows = self.orm.get_rows_from_table(
+            "foods", db.QueryData(food_name="apple sauce")
         )
         self.assertEqual(
-            foods_rows[0],
+            foods_rows[0].get_dict(),
             {"food_name": "apple sauce", "portion_type": "jar", "calories": 200},
         )
 
     def test_get_rows_with_multiple_match_criteria(self):
-        record_rows = db.get_rows_from_table(
-            self.db_connection,
+        record_rows = self.orm.get_rows_from_table(
             "record",
-            match_food_name="apple sauce",
-            match_portion_type="jar",
-            match_date=date(1895, 10, 19),
+            db.QueryData(
+                food_name="apple sauce",
+                portion_type="jar",
+                date=date(1895, 10, 19),
+            ),
         )
         self.assertEqual(
-            record_rows[0],
+            record_rows[0].get_dict(),
             {
                 "date": date(1895, 10, 19),
                 "food_name": "apple sauce",
@@ -239,21 +238,34 @@ class TestDatabaseWithData(TestCase):
                 "servings": 5,
             },
         )
-        foods_rows = db.get_rows_from_table(
-            self.db_connection,
+        foods_rows = self.orm.get_rows_from_table(
             "foods",
-            match_food_name="apple sauce",
-            match_portion_type="jar",
-            match_calories=200,
+            db.QueryData(
+                food_name="apple sauce",
+                portion_type="jar",
+                calories=200,
+            ),
         )
         self.assertEqual(
-            foods_rows[0],
+            foods_rows[0].get_dict(),
             {"food_name": "apple sauce", "portion_type": "jar", "calories": 200},
         )
 
+    def test_iter_rows(self):
+        record_rows = self.orm.iter_rows("record", batch_size=1)
+        self.assertEqual(
+            sorted(row.food_name for row in record_rows), ["apple sauce", "broccoli"]
+        )
+        foods_rows = self.orm.iter_rows(
+            "foods", db.QueryData(food_name="coffee"), batch_size=1
+        )
+        self.assertEqual(next(foods_rows).food_name, "coffee")
+        self.assertEqual(next(foods_rows).food_name, "coffee")
+        self.assertEqual(list(foods_rows), [])
+
     def test_delete_rows(self):
-        db.delete_rows_in_table(
-            self.db_connection, "foods", match_food_name="apple sauce"
+        self.orm.delete_rows_in_table(
+            "foods", db.QueryData(food_name="apple sauce")
         )
         cursor = self.db_connection.cursor()
         cursor.execute(
@@ -266,19 +278,16 @@ class TestDatabaseWithData(TestCase):
         self.assertEqual(len(rows), 2)
 
     def test_update_row_in_foods_table(self):
-        db.update_row_in_table(
-            self.db_connection,
+        self.orm.update_row_in_table(
             "foods",
-            match_food_name="coffee",
-            match_portion_type="black",
-            calories=50,
-            portion_type="black with sugar",
+            db.QueryData(calories=50, portion_type="black with sugar"),
+            db.QueryData(food_name="coffee", portion_type="black"),
         )
 
         cursor = self.db_connection.cursor()
         cursor.execute(
             """
-            SELECT *
+            SELECT food_name, portion_type, calories
             FROM foods
             WHERE
                 food_name = 'coffee' AND
@@ -290,7 +299,7 @@ class TestDatabaseWithData(TestCase):
 
         cursor.execute(
             """
-            SELECT *
+            SELECT food_name, portion_type, calories
             FROM foods
             WHERE
                 food_name = 'coffee' AND
@@ -300,28 +309,986 @@ class TestDatabaseWithData(TestCase):
         rows = cursor.fetchall()
         self.assertEqual(rows[0], ("coffee", "black with sugar", 50))
 
+    def test_exact_match_does_not_match_substrings(self):
+        self.orm.add_row_to_table(
+            "foods", db.QueryData(food_name="apple", portion_type="jar", calories=80)
+        )
+        foods_rows = self.orm.get_rows_from_table(
+            "foods", db.QueryData(food_name="apple")
+        )
+        self.assertEqual(foods_rows, [db.FoodRow("apple", "jar", 80, 80)])
+
+    def test_get_rows_with_prefix_match(self):
+        foods_rows = self.orm.get_rows_from_table(
+            "foods", db.QueryData(food_name="cof"), match_mode="prefix"
+        )
+        self.assertEqual(len(foods_rows), 2)
+
+    def test_get_rows_with_substring_match(self):
+        foods_rows = self.orm.get_rows_from_table(
+            "foods", db.QueryData(portion_type="MILK"), match_mode="substring"
+        )
+        self.assertEqual(len(foods_rows), 1)
+        foods_rows = self.orm.get_rows_from_table(
+            "foods", db.QueryData(food_name="%"), match_mode="substring"
+        )
+        self.assertEqual(foods_rows, [])
+
+    def test_values_are_bound_as_parameters(self):
+        match_data = db.QueryData(food_name="coffee", portion_type="it's black")
+        self.assertEqual(
+            match_data.get_query_match_clause(),
+            (
+                "food_name = ? AND portion_type = ?",
+                ["coffee", "it's black"],
+            ),
+        )
+        self.assertEqual(
+            self.orm.get_rows_from_table("foods", match_data), []
+        )
+
+    def test_get_records_between(self):
+        self.assertEqual(
+            self.orm.get_records_between(date(1895, 1, 1), "31-12-2019"),
+            [db.RecordRow("1895-10-19", "apple sauce", "jar", 5)],
+        )
+        self.assertEqual(
+            len(self.orm.get_records_between(date(1895, 1, 1), date(2020, 5, 15))), 2
+        )
+
+    def test_daily_totals(self):
+        self.orm.add_rows_to_table(
+            "foods",
+            [
+                db.QueryData(food_name="broccoli", portion_type="head", calories=30),
+            ],
+        )
+        self.orm.add_rows_to_table(
+            "record",
+            [
+                db.QueryData(date=date(2020, 5, 15), food_name="apple sauce",
+                             portion_type="jar", servings=2),
+                db.QueryData(date=date(2020, 5, 16), food_name="coffee",
+                             portion_type="black", servings=3),
+                db.QueryData(date=date(2020, 5, 17), food_name="unknown food"),
+            ],
+        )
+        self.assertEqual(
+            list(self.orm.daily_totals(date(2020, 1, 1), date(2020, 12, 31))),
+            [
+                (date(2020, 5, 15), 430),
+                (date(2020, 5, 16), 90),
+                (date(2020, 5, 17), 0),
+            ],
+        )
+        self.assertEqual(
+            list(self.orm.daily_totals(date(2020, 5, 16), date(2020, 5, 16))),
+            [(date(2020, 5, 16), 90)],
+        )
+
     # def test_update_row_in_record_table(self):
     #     pass
 
     def test_increase_servings_count_in_record_table(self):
-        db.add_row_to_table(
-            self.db_connection,
+        self.orm.add_row_to_table(
             "record",
-            date=date(2020, 5, 15),
-            food_name="broccoli",
-            portion_type="head",
+            db.QueryData(
+                date=date(2020, 5, 15),
+                food_name="broccoli",
+                portion_type="head",
+            ),
         )
 
         cursor = self.db_connection.cursor()
         cursor.execute(
             """
-            SELECT *
+            SELECT date, food_name, portion_type, servings
             FROM record
             WHERE food_name = 'broccoli'
         """
         )
         rows = cursor.fetchall()
-        self.assertEqual(rows[0], ("15-05-2020", "broccoli", "head", 2))
+        self.assertEqual(rows[0], ("2020-05-15", "broccoli", "head", 2))
+
+
+class TestRowTypes(TestCase):
+    """
+    Test the row types returned by the ORM
+    """
+
+    def test_record_row_parses_date_lazily(self):
+        row = db.RecordRow("2020-05-15", "broccoli", "head", 1)
+        self.assertEqual(row._date, "2020-05-15")  # pylint: disable=protected-access
+        self.assertEqual(row.date, date(2020, 5, 15))
+        self.assertEqual(row, db.RecordRow(date(2020, 5, 15), "broccoli", "head", 1))
+        self.assertEqual(
+            row.get_dict(),
+            {
+                "date": date(2020, 5, 15),
+                "food_name": "broccoli",
+                "portion_type": "head",
+                "servings": 1,
+            },
+        )
+
+    def test_query_data_parses_relative_dates(self):
+        today = date.today()
+        self.assertEqual(db.QueryData(date="today").date, today)
+        self.assertEqual(db.QueryData(date="Tomorrow").date, today + timedelta(days=1))
+        self.assertEqual(db.QueryData(date="yesterday").date, today - timedelta(days=1))
+        with self.assertRaises(ValueError):
+            db.QueryData(date="someday")
+
+    def test_rows_have_no_instance_dict(self):
+        self.assertFalse(hasattr(db.RecordRow("2020-05-15", "a", "", 1), "__dict__"))
+        self.assertFalse(hasattr(db.FoodRow("a", "", 1, 1), "__dict__"))
+
+
+class TestBulkInsert(DatabaseFileTestCase):
+    """
+    Test adding many rows at once with add_rows_to_table()
+    """
+
+    def populate(self, cursor):
+        cursor.execute("INSERT INTO record VALUES ('15-05-2020', 'broccoli', 'head', 1)")
+        cursor.execute("INSERT INTO foods VALUES ('broccoli', 'head', 30)")
+
+    def test_add_rows_to_record_table_merges_servings(self):
+        self.orm.add_rows_to_table(
+            "record",
+            [
+                db.QueryData(date=date(2020, 5, 15), food_name="broccoli",
+                             portion_type="head", servings=2),
+                db.QueryData(date=date(2020, 5, 15), food_name="broccoli",
+                             portion_type="head"),
+                db.QueryData(date=date(2020, 5, 16), food_name="broccoli",
+                             portion_type="head"),
+                db.QueryData(date=date(2020, 5, 16), food_name="apple"),
+            ],
+        )
+
+        cursor = self.db_connection.cursor()
+        cursor.execute(
+            """
+            SELECT date, food_name, portion_type, servings
+            FROM record
+            ORDER BY date, food_name
+            """
+        )
+        self.assertEqual(
+            cursor.fetchall(),
+            [
+                ("2020-05-15", "broccoli", "head", 4),
+                ("2020-05-16", "apple", "", 1),
+                ("2020-05-16", "broccoli", "head", 1),
+            ],
+        )
+
+    def test_add_rows_to_foods_table_skips_existing(self):
+        self.orm.add_rows_to_table(
+            "foods",
+            [
+                db.QueryData(food_name="broccoli", portion_type="head", calories=50),
+                db.QueryData(food_name="apple", calories=80),
+                db.QueryData(food_name="apple", calories=90),
+            ],
+        )
+
+        cursor = self.db_connection.cursor()
+        cursor.execute("SELECT food_name, portion_type, calories FROM foods ORDER BY food_name")
+        self.assertEqual(
+            cursor.fetchall(), [("apple", "", 80), ("broccoli", "head", 30)]
+        )
+
+
+class TestSchemaMigration(DatabaseFileTestCase):
+    """
+    Test the migration of legacy databases to the versioned schema
+    """
+
+    def populate(self, cursor):
+        cursor.execute("INSERT INTO record VALUES ('15-05-2020', 'broccoli', 'head', 1)")
+        cursor.execute("INSERT INTO record VALUES ('15-05-2020', 'broccoli', 'head', 2)")
+        cursor.execute("INSERT INTO record VALUES ('15-05-2020', 'apple', NULL, 1)")
+        cursor.execute("INSERT INTO foods VALUES ('broccoli', 'head', 30)")
+        cursor.execute("INSERT INTO foods VALUES ('broccoli', 'head', 40)")
+
+    def test_schema_version_is_current(self):
+        self.assertEqual(self.orm.get_schema_version(), db.SCHEMA_VERSION)
+
+    def test_duplicate_rows_are_merged(self):
+        cursor = self.db_connection.cursor()
+        cursor.execute(
+            """
+            SELECT date, food_name, portion_type, servings
+            FROM record
+            ORDER BY food_name
+            """
+        )
+        self.assertEqual(
+            cursor.fetchall(),
+            [("2020-05-15", "apple", "", 1), ("2020-05-15", "broccoli", "head", 3)],
+        )
+        cursor.execute("SELECT food_name, portion_type, calories FROM foods")
+        self.assertEqual(cursor.fetchall(), [("broccoli", "head", 30)])
+
+    def test_lookups_use_indexes(self):
+        # a fresh connection, so the query planner sees the migrated schema
+        self.db_connection.close()
+        self.db_connection = sqlite3.connect(self.db_path)
+        cursor = self.db_connection.cursor()
+        cursor.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT * FROM record
+            WHERE user_id = 'default' AND date BETWEEN '2020-05-01' AND '2020-05-31'
+            """
+        )
+        self.assertIn("record_date_index", cursor.fetchall()[0][3])
+        cursor.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT * FROM foods
+            WHERE
+                user_id = 'default' AND
+                food_name = 'broccoli' AND
+                portion_type = 'head'
+            """
+        )
+        self.assertIn("INDEX", cursor.fetchall()[0][3])
+
+
+class TestDailySummary(DatabaseFileTestCase):
+    """
+    Test that the daily_summary table stays in sync with record and foods
+    """
+
+    def populate(self, cursor):
+        cursor.execute("INSERT INTO record VALUES ('15-05-2020', 'broccoli', 'head', 2)")
+        cursor.execute("INSERT INTO record VALUES ('15-05-2020', 'coffee', '', 1)")
+        cursor.execute("INSERT INTO record VALUES ('16-05-2020', 'broccoli', 'head', 1)")
+        cursor.execute("INSERT INTO foods VALUES ('broccoli', 'head', 30)")
+
+    def get_totals(self):
+        return list(self.orm.daily_totals(date(2020, 1, 1), date(2020, 12, 31)))
+
+    def assert_totals(self, expected_totals):
+        self.assertEqual(self.get_totals(), expected_totals)
+        self.assertEqual(self.orm.rebuild_summaries(), [])
+        self.assertEqual(self.get_totals(), expected_totals)
+
+    def test_migration_fills_summary(self):
+        self.assert_totals([(date(2020, 5, 15), 60), (date(2020, 5, 16), 30)])
+
+    def test_adding_entries_updates_summary(self):
+        self.orm.add_row_to_table(
+            "record",
+            db.QueryData(date=date(2020, 5, 16), food_name="broccoli",
+                         portion_type="head", servings=2),
+        )
+        self.orm.add_row_to_table(
+            "record",
+            db.QueryData(date=date(2020, 5, 17), food_name="broccoli",
+                         portion_type="head"),
+        )
+        self.assert_totals(
+            [(date(2020, 5, 15), 60), (date(2020, 5, 16), 90), (date(2020, 5, 17), 30)]
+        )
+
+    def test_updating_and_deleting_entries_updates_summary(self):
+        self.orm.update_row_in_table(
+            "record",
+            db.QueryData(date=date(2020, 5, 17)),
+            db.QueryData(date=date(2020, 5, 15), food_name="broccoli"),
+        )
+        self.orm.delete_rows_in_table("record", db.QueryData(date=date(2020, 5, 16)))
+        self.assert_totals([(date(2020, 5, 15), 0), (date(2020, 5, 17), 60)])
+
+    def test_changing_foods_recalculates_affected_days(self):
+        self.orm.update_row_in_table(
+            "foods", db.QueryData(calories=50), db.QueryData(food_name="broccoli")
+        )
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="coffee", calories=5))
+        self.assert_totals([(date(2020, 5, 15), 105), (date(2020, 5, 16), 50)])
+
+        self.orm.delete_rows_in_table("foods", db.QueryData(food_name="broccoli"))
+        self.assert_totals([(date(2020, 5, 15), 5), (date(2020, 5, 16), 0)])
+
+    def test_rebuild_reports_out_of_date_days(self):
+        cursor = self.db_connection.cursor()
+        cursor.execute("UPDATE daily_summary SET calories = 0")
+        self.db_connection.commit()
+        self.assertEqual(
+            self.orm.rebuild_summaries(), [date(2020, 5, 15), date(2020, 5, 16)]
+        )
+        self.assert_totals([(date(2020, 5, 15), 60), (date(2020, 5, 16), 30)])
+
+
+class TestCompositeFoods(DatabaseFileTestCase):
+    """
+    Test foods made up of other foods
+    """
+
+    def populate(self, cursor):
+        cursor.execute("INSERT INTO foods VALUES ('bread', 'slice', 80)")
+        cursor.execute("INSERT INTO foods VALUES ('butter', 'spread', 40)")
+        cursor.execute("INSERT INTO foods VALUES ('toast with butter', 'slice', 0)")
+        cursor.execute("INSERT INTO foods VALUES ('breakfast', '', 10)")
+        cursor.execute(
+            "INSERT INTO record VALUES ('15-05-2020', 'breakfast', '', 1)"
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.orm.set_food_ingredients(
+            "toast with butter", "slice", [("bread", "slice", 1), ("butter", "spread", 1)]
+        )
+        self.orm.set_food_ingredients(
+            "breakfast", "", [("toast with butter", "slice", 2)]
+        )
+
+    def test_calories_are_expanded_recursively(self):
+        self.assertEqual(self.orm.get_food_calories("toast with butter", "slice"), 120)
+        self.assertEqual(self.orm.get_food_calories("breakfast"), 250)
+        self.assertEqual(self.orm.get_food_calories("unknown food"), None)
+        self.assertEqual(
+            self.orm.get_food_ingredients("breakfast"),
+            [("toast with butter", "slice", 2)],
+        )
+
+    def test_changing_an_ingredient_updates_dependents(self):
+        self.orm.update_row_in_table(
+            "foods",
+            db.QueryData(calories=50),
+            db.QueryData(food_name="butter", portion_type="spread"),
+        )
+        self.assertEqual(self.orm.get_food_calories("toast with butter", "slice"), 130)
+        self.assertEqual(self.orm.get_food_calories("breakfast"), 270)
+        self.assertEqual(
+            list(self.orm.daily_totals(date(2020, 5, 15), date(2020, 5, 15))),
+            [(date(2020, 5, 15), 270)],
+        )
+
+        self.orm.delete_rows_in_table("foods", db.QueryData(food_name="bread"))
+        self.assertEqual(self.orm.get_food_calories("breakfast"), 110)
+        self.assertEqual(self.orm.rebuild_summaries(), [])
+
+    def test_adding_a_missing_ingredient_updates_dependents(self):
+        self.orm.set_food_ingredients(
+            "breakfast", "", [("toast with butter", "slice", 2), ("coffee", "", 1)]
+        )
+        self.assertEqual(self.orm.get_food_calories("breakfast"), 250)
+        self.orm.add_rows_to_table(
+            "foods", [db.QueryData(food_name="coffee", calories=5)]
+        )
+        self.assertEqual(self.orm.get_food_calories("breakfast"), 255)
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.orm.set_food_ingredients("bread", "slice", [("breakfast", "", 1)])
+        self.assertEqual(self.orm.get_food_ingredients("bread", "slice"), [])
+        self.assertEqual(self.orm.get_food_calories("breakfast"), 250)
+
+
+class TestFoodCache(DatabaseFileTestCase):
+    """
+    Test the LRU cache of food lookups
+    """
+
+    def populate(self, cursor):
+        cursor.execute("INSERT INTO foods VALUES ('coffee', 'black', 30)")
+        cursor.execute("INSERT INTO foods VALUES ('milk', 'cup', 100)")
+
+    def test_repeated_lookups_hit_the_cache(self):
+        for _ in range(3):
+            self.assertEqual(
+                self.orm.get_food("coffee", "black"),
+                db.FoodRow("coffee", "black", 30, 30),
+            )
+        self.assertEqual(self.orm.food_cache.hits, 2)
+        self.assertEqual(self.orm.food_cache.misses, 1)
+
+        self.assertEqual(
+            self.orm.get_rows_from_table(
+                "foods", db.QueryData(food_name="coffee", portion_type="black")
+            ),
+            [db.FoodRow("coffee", "black", 30, 30)],
+        )
+        self.assertEqual(self.orm.food_cache.hits, 3)
+
+    def test_writes_invalidate_the_cache(self):
+        self.assertIsNone(self.orm.get_food("tea"))
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="tea", calories=2))
+        self.assertEqual(self.orm.get_food_calories("tea"), 2)
+
+        self.orm.update_row_in_table(
+            "foods", db.QueryData(calories=40), db.QueryData(food_name="coffee")
+        )
+        self.assertEqual(self.orm.get_food_calories("coffee", "black"), 40)
+
+        self.orm.set_food_ingredients("coffee", "black", [("milk", "cup", 1)])
+        self.assertEqual(self.orm.get_food_calories("coffee", "black"), 140)
+        self.orm.update_row_in_table(
+            "foods", db.QueryData(calories=50), db.QueryData(food_name="milk")
+        )
+        self.assertEqual(self.orm.get_food_calories("coffee", "black"), 90)
+
+        self.orm.delete_rows_in_table("foods", db.QueryData(food_name="coffee"))
+        self.assertIsNone(self.orm.get_food("coffee", "black"))
+
+    def test_rollback_clears_the_cache(self):
+        with self.assertRaises(RuntimeError):
+            with self.orm.transaction():
+                self.orm.add_row_to_table(
+                    "foods", db.QueryData(food_name="tea", calories=2)
+                )
+                self.assertEqual(self.orm.get_food_calories("tea"), 2)
+                raise RuntimeError
+        self.assertIsNone(self.orm.get_food("tea"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = db.LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIs(cache.get("b"), db.LRUCache.missing)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get_stats()["size"], 2)
+
+    def test_values_read_before_an_invalidation_are_not_cached(self):
+        cache = db.LRUCache(2)
+        generation = cache.generation
+        cache.invalidate(["a"])
+        cache.put("a", "old value", generation)
+        self.assertIs(cache.get("a"), db.LRUCache.missing)
+
+    @mock.patch.object(db, "CHANGE_CHECK_INTERVAL", 0)
+    def test_writes_of_other_connections_clear_the_cache(self):
+        self.assertIsNone(self.orm.get_food("apple"))
+        self.assertEqual(self.orm.get_food_calories("coffee", "black"), 30)
+
+        with db.CalorieCounterORM(self.db_path) as other_orm:
+            other_orm.add_row_to_table(
+                "foods", db.QueryData(food_name="apple", calories=80)
+            )
+            other_orm.update_row_in_table(
+                "foods", db.QueryData(calories=40), db.QueryData(food_name="coffee")
+            )
+
+        self.assertEqual(self.orm.get_food_calories("apple"), 80)
+        self.assertEqual(
+            self.orm.get_rows_from_table(
+                "foods", db.QueryData(food_name="apple", portion_type="")
+            ),
+            [db.FoodRow("apple", "", 80, 80)],
+        )
+        self.assertEqual(self.orm.get_food_calories("coffee", "black"), 40)
+
+    def test_values_cached_during_delete_table_are_invalidated(self):
+        def get_calories():
+            calories.append(self.orm.get_food_calories("coffee", "black"))
+
+        calories = []
+        with self.orm.transaction():
+            self.orm.delete_table("foods")
+            # sees the foods as they were before the delete, and caches them
+            thread = threading.Thread(target=get_calories)
+            thread.start()
+            thread.join()
+        get_calories()
+
+        self.assertEqual(calories, [30, None])
+
+    @mock.patch.object(db, "CHANGE_CHECK_INTERVAL", 0)
+    def test_cache_hits_do_not_wait_for_the_writer(self):
+        self.orm.get_food("coffee", "black")
+        writing = threading.Event()
+        done = threading.Event()
+
+        def hold_writer():
+            with self.orm.pool.writer():
+                writing.set()
+                done.wait(5)
+
+        thread = threading.Thread(target=hold_writer)
+        thread.start()
+        writing.wait(5)
+        try:
+            for _ in range(3):
+                self.assertEqual(self.orm.get_food_calories("coffee", "black"), 30)
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(self.orm.food_cache.hits, 3)
+        self.assertEqual(self.orm.food_cache.misses, 1)
+
+
+class TestConnectionHandling(DatabaseFileTestCase):
+    """
+    Test the long-lived connections and transaction handling of the ORM
+    """
+
+    def test_connection_is_reused_between_writes(self):
+        connections = []
+        for day in range(1, 4):
+            self.orm.add_row_to_table(
+                "record", db.QueryData(food_name="broccoli", date=date(2020, 5, day))
+            )
+            connections.append(list(self.orm.pool._connections))  # pylint: disable=protected-access
+        self.assertEqual(connections[0], connections[-1])
+
+    def test_readers_closed_while_in_use_are_not_reused(self):
+        orm = db.CalorieCounterORM(self.db_path, persistent=False)
+        for food_name in ("bread", "broccoli"):
+            orm.add_row_to_table("foods", db.QueryData(food_name=food_name))
+
+        rows = orm.iter_rows("foods", batch_size=1)
+        next(rows)
+        # closes the pool, along with the reader the generator holds on to
+        orm.add_row_to_table("foods", db.QueryData(food_name="tea"))
+        rows.close()
+
+        self.assertEqual(len(orm.get_rows_from_table("foods")), 3)
+        orm.close()
+
+    def test_transaction_commits_once_at_the_end(self):
+        with self.orm.transaction():
+            self.orm.add_row_to_table(
+                "record", db.QueryData(food_name="broccoli", date=date(2020, 5, 15))
+            )
+            self.orm.add_row_to_table(
+                "record", db.QueryData(food_name="broccoli", date=date(2020, 5, 15))
+            )
+            cursor = self.db_connection.cursor()
+            cursor.execute("SELECT date, food_name, portion_type, servings FROM record")
+            self.assertEqual(cursor.fetchall(), [])
+
+        cursor.execute("SELECT date, food_name, portion_type, servings FROM record")
+        self.assertEqual(cursor.fetchall(), [("2020-05-15", "broccoli", "", 2)])
+
+    def test_transaction_rolls_back_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with self.orm.transaction():
+                self.orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+                raise RuntimeError
+        self.assertEqual(self.orm.get_rows_from_table("foods"), [])
+
+    def test_readers_use_separate_connections(self):
+        with self.orm.pool.reader() as first, self.orm.pool.reader() as second:
+            self.assertIsNot(first, second)
+
+    def test_concurrent_writes_are_serialized(self):
+        def add_entries():
+            for _ in range(20):
+                self.orm.add_row_to_table(
+                    "record",
+                    db.QueryData(food_name="broccoli", date=date(2020, 5, 15)),
+                )
+
+        threads = [threading.Thread(target=add_entries) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        rows = self.orm.get_rows_from_table("record")
+        self.assertEqual(rows[0].servings, 80)
+
+    def test_journal_mode_is_wal(self):
+        with self.orm.read_cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+
+    def test_locked_database_is_retried(self):
+        orm = db.CalorieCounterORM(self.db_path, pragmas={"busy_timeout": 10})
+        locking_connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        locking_connection.execute("BEGIN IMMEDIATE")
+        timer = threading.Timer(0.1, locking_connection.commit)
+        timer.start()
+        orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+        timer.join()
+        locking_connection.close()
+        orm.close()
+        self.assertEqual(len(self.orm.get_rows_from_table("foods")), 1)
+
+    def test_concurrent_writers_and_readers(self):
+        writer_count, reader_count, writes = 4, 4, 25
+        errors = []
+        writers_done = threading.Event()
+
+        def write():
+            # every writer has its own connections, like a separate process would
+            with db.CalorieCounterORM(self.db_path) as orm:
+                for i in range(writes):
+                    try:
+                        orm.add_row_to_table(
+                            "record",
+                            db.QueryData(
+                                food_name="broccoli", date=date(2020, 5, i % 5 + 1)
+                            ),
+                        )
+                    except sqlite3.Error as e:
+                        errors.append(e)
+
+        def read():
+            with db.CalorieCounterORM(self.db_path) as orm:
+                while not writers_done.is_set():
+                    try:
+                        orm.get_rows_from_table("record")
+                        list(orm.daily_totals(date(2020, 5, 1), date(2020, 5, 31)))
+                    except sqlite3.Error as e:
+                        errors.append(e)
+
+        writers = [threading.Thread(target=write) for _ in range(writer_count)]
+        readers = [threading.Thread(target=read) for _ in range(reader_count)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writers_done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        rows = self.orm.get_rows_from_table("record")
+        self.assertEqual(sum(row.servings for row in rows), writer_count * writes)
+
+    def test_non_persistent_mode_closes_connections(self):
+        orm = db.CalorieCounterORM(self.db_path, persistent=False)
+        orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+        self.assertEqual(orm.pool._connections, [])  # pylint: disable=protected-access
+
+
+class TestGroupCommit(DatabaseFileTestCase):
+    """
+    Test the opt-in group commit mode of the ORM
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.orm.close()
+        self.orm = db.CalorieCounterORM(
+            self.db_path, group_commit=True, group_commit_size=100,
+            group_commit_interval=60,
+        )
+
+    def test_writes_are_committed_in_groups(self):
+        for day in range(1, 251):
+            self.orm.add_row_to_table(
+                "record",
+                db.QueryData(date=date(2020, 5, 15), food_name=f"food {day}"),
+            )
+        self.orm.flush()
+
+        self.assertEqual(self.orm.batch_writer.batch_count, 3)
+        self.assertEqual(len(self.orm.get_rows_from_table("record")), 250)
+
+    def test_flush_makes_writes_durable(self):
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+        self.orm.flush()
+
+        cursor = self.db_connection.cursor()
+        cursor.execute("SELECT food_name FROM foods")
+        self.assertEqual(cursor.fetchall(), [("broccoli",)])
+
+    def test_close_writes_queued_writes(self):
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+        self.orm.close()
+
+        with db.CalorieCounterORM(self.db_path) as orm:
+            self.assertEqual(len(orm.get_rows_from_table("foods")), 1)
+
+    def test_writes_in_transaction_are_not_queued(self):
+        with self.orm.transaction():
+            self.orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+            self.assertEqual(len(self.orm.get_rows_from_table("foods")), 1)
+
+    def test_failed_write_is_logged(self):
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="bread"))
+        self.orm.set_food_ingredients("bread", "", [("bread", "", 1)])
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+        with self.assertLogs(level="ERROR") as logs:
+            self.orm.flush()
+
+        self.assertIn("set_food_ingredients", logs.output[0])
+        self.assertEqual(len(self.orm.get_rows_from_table("foods")), 2)
+
+    def test_futures_fail_if_the_database_stays_locked(self):
+        orm = db.CalorieCounterORM(
+            self.db_path, pragmas={"busy_timeout": 10}, write_retries=0
+        )
+        writer = db.BatchWriter(orm)
+        locking_connection = sqlite3.connect(self.db_path)
+        locking_connection.execute("BEGIN IMMEDIATE")
+        try:
+            with self.assertLogs(level="ERROR"):
+                futures = [
+                    writer.submit(
+                        orm.add_row_to_table, "foods", db.QueryData(food_name=name)
+                    )
+                    for name in ("broccoli", "bread")
+                ]
+                for future in futures:
+                    with self.assertRaises(sqlite3.OperationalError):
+                        future.result(timeout=5)
+        finally:
+            locking_connection.rollback()
+            locking_connection.close()
+            writer.close()
+            orm.close()
+
+    def test_delete_table_runs_after_queued_writes(self):
+        self.orm.add_row_to_table(
+            "record", db.QueryData(date=date(2020, 5, 15), food_name="broccoli")
+        )
+        self.orm.delete_table("record")
+        self.orm.add_row_to_table(
+            "record", db.QueryData(date=date(2020, 5, 16), food_name="bread")
+        )
+        self.orm.flush()
+
+        self.assertEqual(
+            [row.food_name for row in self.orm.get_rows_from_table("record")],
+            ["bread"],
+        )
+
+    def test_rebuild_summaries_sees_queued_writes(self):
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="tea", calories=5))
+        self.orm.add_row_to_table(
+            "record", db.QueryData(date=date(2020, 5, 15), food_name="tea")
+        )
+
+        self.assertEqual(self.orm.rebuild_summaries(), [])
+        self.assertEqual(
+            list(self.orm.daily_totals(date(2020, 5, 15), date(2020, 5, 15))),
+            [(date(2020, 5, 15), 5)],
+        )
+        with self.orm.transaction():
+            self.assertEqual(self.orm.rebuild_summaries(), [])
+
+
+class TestFoodSearch(DatabaseFileTestCase):
+    """
+    Test the food search index kept by the ORM
+    """
+
+    def populate(self, cursor):
+        cursor.executemany(
+            "INSERT INTO foods VALUES (?, ?, ?)",
+            [("broccoli", "head", 30), ("bread", "slice", 80), ("brownie", "", 400)],
+        )
+        cursor.executemany(
+            "INSERT INTO record VALUES (?, ?, ?, ?)",
+            [
+                ("15-05-2020", "brownie", "", 1),
+                ("16-05-2020", "brownie", "", 1),
+                ("16-05-2020", "bread", "slice", 2),
+                ("16-05-2020", "unknown food", "", 1),
+            ],
+        )
+
+    def test_index_ranks_by_record_entries(self):
+        index = self.orm.get_food_index()
+        self.assertIs(self.orm.get_food_index(), index)
+        self.assertEqual(
+            index.complete("br"),
+            [("brownie", ""), ("bread", "slice"), ("broccoli", "head")],
+        )
+        self.assertEqual(index.search("brocoli"), [("broccoli", "head")])
+        self.assertNotIn(("unknown food", ""), index)
+
+    def test_index_follows_writes(self):
+        index = self.orm.get_food_index()
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="broth", calories=10))
+        self.orm.add_rows_to_table(
+            "record",
+            [
+                db.QueryData(date=date(2020, 5, day), food_name="broccoli",
+                             portion_type="head")
+                for day in range(1, 4)
+            ],
+        )
+        self.orm.update_row_in_table(
+            "foods", db.QueryData(food_name="brown bread"), db.QueryData(food_name="bread")
+        )
+        self.orm.delete_rows_in_table("foods", db.QueryData(food_name="brownie"))
+
+        self.assertIs(self.orm.get_food_index(), index)
+        self.assertEqual(
+            index.complete("br"),
+            [("broccoli", "head"), ("broth", ""), ("brown bread", "slice")],
+        )
+        self.assertEqual(index.get_frequency("broccoli", "head"), 3)
+
+    def test_rolled_back_writes_are_not_indexed(self):
+        with self.assertRaises(RuntimeError):
+            with self.orm.transaction():
+                self.orm.add_row_to_table("foods", db.QueryData(food_name="broth"))
+                self.assertIn(("broth", ""), self.orm.get_food_index())
+                raise RuntimeError()
+
+        self.assertNotIn(("broth", ""), self.orm.get_food_index())
+
+    def test_index_is_rebuilt_after_record_deletes(self):
+        index = self.orm.get_food_index()
+        self.orm.delete_rows_in_table("record", db.QueryData(date=date(2020, 5, 16)))
+
+        self.assertIsNot(self.orm.get_food_index(), index)
+        self.assertEqual(self.orm.get_food_index().get_frequency("brownie"), 1)
+        self.assertEqual(self.orm.get_food_index().get_frequency("bread", "slice"), 0)
+
+
+
+class TestMetrics(DatabaseFileTestCase):
+    """
+    Test the metrics collected by the ORM
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.orm.close()
+        self.orm = db.CalorieCounterORM(self.db_path, collect_metrics=True)
+
+    def test_disabled_by_default(self):
+        with db.CalorieCounterORM(self.db_path) as orm:
+            orm.get_rows_from_table("foods")
+            self.assertIsNone(orm.get_metrics())
+
+    def test_operations_are_counted(self):
+        self.orm.add_rows_to_table("foods", [
+            db.QueryData(food_name="broccoli", calories=30),
+            db.QueryData(food_name="bread", portion_type="slice", calories=80),
+        ])
+        self.orm.add_row_to_table(
+            "record", db.QueryData(date="15-05-2020", food_name="broccoli")
+        )
+        self.orm.update_row_in_table(
+            "foods", db.QueryData(calories=35), db.QueryData(food_name="broccoli")
+        )
+        self.assertEqual(len(self.orm.get_rows_from_table("foods")), 2)
+        self.assertEqual(len(list(self.orm.daily_totals("15-05-2020", "15-05-2020"))), 1)
+
+        operations = self.orm.get_metrics().to_dict()["operations"]
+        self.assertEqual(operations["add_rows_to_table"]["calls"], 1)
+        self.assertEqual(operations["add_rows_to_table"]["rows_written"], 2)
+        self.assertIn("INSERT", operations["add_rows_to_table"]["statements"])
+        self.assertEqual(operations["add_row_to_table"]["statements"]["COMMIT"], 1)
+        self.assertEqual(operations["update_row_in_table"]["rows_written"], 1)
+        self.assertEqual(operations["get_rows_from_table"]["rows_read"], 2)
+        self.assertEqual(operations["get_rows_from_table"]["statements"]["SELECT"], 1)
+        self.assertEqual(operations["daily_totals"]["calls"], 1)
+        self.assertEqual(operations["daily_totals"]["rows_read"], 1)
+
+    def test_failures_are_counted(self):
+        with self.assertRaises(ValueError):
+            self.orm.delete_table("daily_summary")
+
+        operations = self.orm.get_metrics().to_dict()["operations"]
+        self.assertEqual(operations["delete_table"]["errors"], 1)
+
+    def test_food_cache_hit_rate(self):
+        self.orm.add_row_to_table("foods", db.QueryData(food_name="broccoli"))
+        for _ in range(4):
+            self.orm.get_food("broccoli")
+
+        cache_stats = self.orm.get_metrics().to_dict()["caches"]["food"]
+        self.assertEqual((cache_stats["hits"], cache_stats["misses"]), (3, 1))
+        self.assertEqual(cache_stats["hit_rate"], 0.75)
+
+    def test_closing_an_iterator_releases_its_connection(self):
+        self.orm.add_rows_to_table("foods", [
+            db.QueryData(food_name=f"food {i}") for i in range(10)
+        ])
+        rows = self.orm.iter_rows("foods", batch_size=2)
+        next(rows)
+        rows.close()
+
+        operations = self.orm.get_metrics().to_dict()["operations"]
+        self.assertEqual(operations["iter_rows"]["rows_read"], 1)
+        self.assertEqual(self.orm.pool._idle_readers.qsize(), 1)
+
+
+class TestUserProfiles(DatabaseFileTestCase):
+    """
+    Test that every user only sees and changes their own rows
+    """
+
+    def populate(self, cursor):
+        cursor.execute("INSERT INTO record VALUES ('15-05-2020', 'broccoli', 'head', 2)")
+        cursor.execute("INSERT INTO foods VALUES ('broccoli', 'head', 30)")
+
+    def setUp(self):
+        super().setUp()
+        self.other_orm = db.CalorieCounterORM(self.db_path, user_id="alice")
+        self.other_orm.add_row_to_table("foods", db.QueryData(
+            food_name="broccoli", portion_type="head", calories=50
+        ))
+        self.other_orm.add_row_to_table("record", db.QueryData(
+            date=date(2020, 5, 15), food_name="broccoli", portion_type="head"
+        ))
+
+    def tearDown(self):
+        self.other_orm.close()
+        super().tearDown()
+
+    def test_migrated_rows_belong_to_the_default_user(self):
+        cursor = self.db_connection.cursor()
+        cursor.execute("SELECT user_id, calories FROM foods ORDER BY user_id")
+        self.assertEqual(
+            cursor.fetchall(), [("alice", 50), ("default", 30)]
+        )
+        self.assertEqual(self.orm.user_id, db.DEFAULT_USER)
+
+    def test_rows_are_scoped_to_the_user(self):
+        self.assertEqual(
+            self.orm.get_rows_from_table("record"),
+            [db.RecordRow("2020-05-15", "broccoli", "head", 2)],
+        )
+        self.assertEqual(
+            self.other_orm.get_rows_from_table(
+                "record", db.QueryData(food_name="bro"), match_mode="prefix"
+            ),
+            [db.RecordRow("2020-05-15", "broccoli", "head", 1)],
+        )
+        self.assertEqual(self.orm.get_food_calories("broccoli", "head"), 30)
+        self.assertEqual(self.other_orm.get_food_calories("broccoli", "head"), 50)
+        self.assertEqual(
+            self.other_orm.get_food_index().complete("bro"), [("broccoli", "head")]
+        )
+
+    def test_summaries_are_kept_per_user(self):
+        self.other_orm.update_row_in_table(
+            "foods", db.QueryData(calories=100), db.QueryData(food_name="broccoli")
+        )
+        day = date(2020, 5, 15)
+        self.assertEqual(list(self.orm.daily_totals(day, day)), [(day, 60)])
+        self.assertEqual(list(self.other_orm.daily_totals(day, day)), [(day, 100)])
+        self.assertEqual(self.orm.rebuild_summaries(), [])
+        self.assertEqual(self.other_orm.rebuild_summaries(), [])
+
+    def test_deletes_keep_the_rows_of_other_users(self):
+        self.other_orm.delete_rows_in_table("record", db.QueryData())
+        self.other_orm.delete_table("foods")
+        self.assertEqual(self.other_orm.get_rows_from_table("foods"), [])
+        self.assertEqual(len(self.orm.get_rows_from_table("record")), 1)
+        self.assertEqual(len(self.orm.get_rows_from_table("foods")), 1)
+
+    def test_user_id_is_required(self):
+        with self.assertRaises(ValueError):
+            db.CalorieCounterORM(self.db_path, user_id="")
+
+    def test_lookups_of_a_user_use_indexes(self):
+        cursor = self.db_connection.cursor()
+        for where_clause in ["food_name = 'broccoli'", "date = '2020-05-15'"]:
+            cursor.execute(
+                f"""
+                EXPLAIN QUERY PLAN
+                SELECT * FROM record WHERE user_id = 'alice' AND {where_clause}
+                """
+            )
+            self.assertIn("INDEX", cursor.fetchall()[0][3])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+"""
+Unit tests for metrics.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest.case import TestCase
+
+import metrics
+
+
+class TestHistogram(TestCase):
+    """
+    Test the latency histogram
+    """
+
+    def test_percentiles(self):
+        histogram = metrics.Histogram()
+        self.assertIsNone(histogram.get_percentile(50))
+
+        for duration in [0.3] * 90 + [3] * 9 + [30]:
+            histogram.add(duration)
+
+        self.assertEqual(len(histogram), 100)
+        self.assertEqual(histogram.get_percentile(50), 0.5)
+        self.assertEqual(histogram.get_percentile(95), 5)
+        self.assertEqual(histogram.get_percentile(100), 30)
+        self.assertEqual((histogram.min, histogram.max), (0.3, 30))
+
+    def test_merge(self):
+        histogram = metrics.Histogram()
+        histogram.add(1)
+        other = metrics.Histogram()
+        other.add(100)
+        other.add(10000)
+        histogram.merge(other)
+
+        self.assertEqual(len(histogram), 3)
+        self.assertEqual((histogram.min, histogram.max), (1, 10000))
+        self.assertEqual(histogram.counts[-1], 1)
+
+
+class TestMetrics(TestCase):
+    """
+    Test collecting, merging and saving metrics
+    """
+
+    def test_statements_count_for_innermost_operation(self):
+        collected = metrics.Metrics()
+        outer_start = collected.start("outer")
+        collected.trace_statement("SELECT 1")
+        inner_start = collected.start("inner")
+        collected.trace_statement("  insert into foods values (1)")
+        collected.count_rows_written(1)
+        collected.finish("inner", inner_start)
+        collected.finish("outer", outer_start, rows_read=3)
+        collected.trace_statement("COMMIT")
+
+        operations = collected.to_dict()["operations"]
+        self.assertEqual(operations["outer"]["statements"], {"SELECT": 1})
+        self.assertEqual(operations["outer"]["rows_read"], 3)
+        self.assertEqual(operations["inner"]["statements"], {"INSERT": 1})
+        self.assertEqual(operations["inner"]["rows_written"], 1)
+        self.assertEqual(operations["other"]["statements"], {"COMMIT": 1})
+
+    def test_operations_of_threads_are_separate(self):
+        collected = metrics.Metrics()
+        start_time = collected.start("outer")
+        thread = threading.Thread(target=collected.trace_statement, args=("SELECT 1",))
+        thread.start()
+        thread.join()
+        collected.finish("outer", start_time)
+
+        operations = collected.to_dict()["operations"]
+        self.assertEqual(operations["outer"]["statements"], {})
+        self.assertEqual(operations["other"]["statements"], {"SELECT": 1})
+
+    def test_time_iterator(self):
+        collected = metrics.Metrics()
+        self.assertEqual(list(collected.time_iterator("rows", iter("abc"))), list("abc"))
+
+        operations = collected.to_dict()["operations"]
+        self.assertEqual(operations["rows"]["calls"], 1)
+        self.assertEqual(operations["rows"]["rows_read"], 3)
+
+    def test_save_adds_up_runs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "metrics.json")
+            for _ in range(2):
+                collected = metrics.Metrics()
+                collected.finish("get_food", collected.start("get_food"), rows_read=1)
+                collected.set_cache_stats("food", {"hits": 3, "misses": 1, "size": 1})
+                metrics.save(path, collected)
+
+            data = metrics.load(path).to_dict()
+            self.assertEqual(
+                sorted(os.listdir(tmp_dir)), ["metrics.json", "metrics.json.lock"]
+            )
+
+        self.assertEqual(data["operations"]["get_food"]["calls"], 2)
+        self.assertEqual(data["operations"]["get_food"]["rows_read"], 2)
+        self.assertEqual(data["caches"]["food"]["hits"], 6)
+        self.assertEqual(data["caches"]["food"]["hit_rate"], 0.75)
+
+    def test_reset(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "metrics.json")
+            metrics.reset(path)
+            collected = metrics.Metrics()
+            collected.finish("get_food", collected.start("get_food"))
+            metrics.save(path, collected)
+            metrics.reset(path)
+
+            self.assertEqual(metrics.load(path).to_dict()["operations"], {})
+
+    @unittest.skipIf(metrics.fcntl is None, "fcntl is not available")
+    def test_concurrent_saves_add_up(self):
+        def save_runs(path):
+            for _ in range(20):
+                collected = metrics.Metrics()
+                collected.finish("get_food", collected.start("get_food"))
+                metrics.save(path, collected)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "metrics.json")
+            threads = [
+                threading.Thread(target=save_runs, args=(path,)) for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            data = metrics.load(path).to_dict()
+
+        self.assertEqual(data["operations"]["get_food"]["calls"], 80)
+
+    def test_format_table(self):
+        collected = metrics.Metrics()
+        collected.finish("get_food", collected.start("get_food"))
+
+        table = collected.format_table()
+        self.assertIn("get_food", table)
+        self.assertEqual(len(table.splitlines()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
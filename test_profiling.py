@@ -0,0 +1,96 @@
+"""
+Unit tests for profiling.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import io
+import os
+import pstats
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest.case import TestCase
+
+import db
+import profiling
+
+
+class TestSQLProfiler(TestCase):
+    """
+    Test timing the SQL statements of the ORM
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.profiler = profiling.SQLProfiler()
+        self.orm = db.CalorieCounterORM(
+            os.path.join(self.tmp_dir.name, "test.db"), sql_profiler=self.profiler
+        )
+
+    def tearDown(self):
+        self.orm.close()
+        self.tmp_dir.cleanup()
+
+    def get_statement(self, prefix):
+        matches = [
+            (sql, numbers) for sql, numbers in self.profiler.statements.items()
+            if sql.startswith(prefix)
+        ]
+        self.assertEqual(len(matches), 1, matches)
+        return matches[0][1]
+
+    def test_statements_are_counted(self):
+        commits = self.profiler.statements["COMMIT"][0]
+        self.orm.add_rows_to_table("record", [
+            db.QueryData(date="15-05-2020", food_name=f"food {i}") for i in range(3)
+        ])
+
+        calls, traced, duration = self.get_statement("INSERT INTO record (")
+        self.assertEqual(calls, 1)
+        # one statement for every row and every summary trigger of a row
+        self.assertGreaterEqual(traced, 3)
+        self.assertGreater(duration, 0)
+        self.assertEqual(self.get_statement("COMMIT")[0], commits + 1)
+
+    def test_fetching_counts_for_the_statement(self):
+        self.orm.add_rows_to_table("foods", [
+            db.QueryData(food_name=f"food {i}") for i in range(10)
+        ])
+        self.assertEqual(len(list(self.orm.iter_rows("foods", batch_size=3))), 10)
+
+        calls, _, _ = self.get_statement("SELECT food_name, portion_type, calories")
+        self.assertEqual(calls, 1)
+        entries = [entry for entry in self.profiler.log if entry[2].startswith("SELECT")]
+        self.assertTrue(all(duration > 0 for _, duration, _ in entries))
+
+    def test_works_together_with_metrics(self):
+        with db.CalorieCounterORM(
+            os.path.join(self.tmp_dir.name, "test.db"),
+            collect_metrics=True, sql_profiler=self.profiler,
+        ) as orm:
+            orm.get_rows_from_table("record")
+            operations = orm.get_metrics().to_dict()["operations"]
+
+        self.assertEqual(operations["get_rows_from_table"]["statements"]["SELECT"], 1)
+        self.assertEqual(self.get_statement("SELECT date, food_name")[0], 1)
+
+    def test_run_writes_profile(self):
+        output_path = os.path.join(self.tmp_dir.name, "profile.pstats")
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            profiling.run(
+                lambda _: self.orm.get_rows_from_table("foods"), None, output_path,
+                limit=5, sql_profiler=self.profiler,
+            )
+
+        self.assertGreater(pstats.Stats(output_path).total_calls, 0)
+        with open(f"{output_path}.sql", encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        self.assertEqual(len(lines), len(self.profiler.log) + 1)
+        self.assertIn("total ms", stderr.getvalue())
+        self.assertIn("Ordered by: internal time", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Unit tests for search.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import unittest
+from unittest.case import TestCase
+
+import search
+
+
+class TestFoodSearchIndex(TestCase):
+    """
+    Test prefix and fuzzy lookups in the food search index
+    """
+
+    def setUp(self):
+        self.index = search.FoodSearchIndex([
+            ("broccoli", "head", 3),
+            ("Broccoli soup", "bowl", 0),
+            ("brown bread", "slice", 10),
+            ("brownie", "", 0),
+            ("bread", "slice", 0),
+            ("steamed broccoli", "", 1),
+            ("rice", "cup", 0),
+        ])
+
+    def test_complete_ranks_by_frequency(self):
+        self.assertEqual(
+            self.index.complete("bro"),
+            [
+                ("brown bread", "slice"),
+                ("broccoli", "head"),
+                ("Broccoli soup", "bowl"),
+                ("brownie", ""),
+            ],
+        )
+        self.assertEqual(self.index.complete("BRO", limit=2), [
+            ("brown bread", "slice"), ("broccoli", "head"),
+        ])
+        self.assertEqual(self.index.complete("x"), [])
+        self.assertEqual(len(self.index.complete("")), 7)
+
+    def test_fuzzy_search(self):
+        self.assertEqual(
+            self.index.search("brocoli"),
+            [("broccoli", "head"), ("steamed broccoli", ""), ("Broccoli soup", "bowl")],
+        )
+        self.assertEqual(
+            self.index.search("steamed brocoli"), [("steamed broccoli", "")]
+        )
+        self.assertEqual(self.index.search("brocoli soupe"), [("Broccoli soup", "bowl")])
+        self.assertEqual(self.index.search("xyz"), [])
+        self.assertEqual(self.index.search(""), [])
+
+    def test_search_ranks_by_similarity_first(self):
+        self.assertEqual(self.index.search("bread", limit=2), [
+            ("brown bread", "slice"), ("bread", "slice"),
+        ])
+        self.assertEqual(self.index.search("brow"), [
+            ("brown bread", "slice"), ("brownie", ""),
+        ])
+
+    def test_incremental_updates(self):
+        self.index.add("brocolini", "bunch", 20)
+        self.assertEqual(self.index.complete("broc")[0], ("brocolini", "bunch"))
+        self.assertIn(("brocolini", "bunch"), self.index.search("brocoli"))
+
+        self.index.add("brownie", "", 5)
+        self.assertEqual(self.index.get_frequency("brownie"), 5)
+        self.assertEqual(self.index.complete("brown")[0], ("brown bread", "slice"))
+        self.index.add("brown bread", "slice", 0)
+        self.assertEqual(self.index.complete("brown"), [
+            ("brownie", ""), ("brown bread", "slice"),
+        ])
+
+        self.index.remove("brocolini", "bunch")
+        self.index.remove("brocolini", "bunch")
+        self.index.remove("rice", "cup")
+        self.assertNotIn(("brocolini", "bunch"), self.index)
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.search("rice"), [])
+        self.assertEqual(self.index.complete("broc"), [
+            ("broccoli", "head"), ("Broccoli soup", "bowl"),
+        ])
+
+    def test_matches_full_rebuild(self):
+        foods = [
+            (f"{adjective} {food}", "", (i * 7) % 5)
+            for i, (adjective, food) in enumerate(
+                (adjective, food)
+                for adjective in ("baked", "fried", "raw", "grilled")
+                for food in ("potato", "chicken", "cheese", "pepper", "peach")
+            )
+        ]
+        index = search.FoodSearchIndex()
+        for food_name, portion_type, frequency in reversed(foods):
+            index.add(food_name, portion_type, frequency)
+        index.add("raw egg", "", 3)
+        index.remove("raw egg", "")
+        rebuilt_index = search.FoodSearchIndex(foods)
+
+        for text in ("f", "raw", "peper", "grilled chiken", "ches"):
+            self.assertEqual(index.complete(text), rebuilt_index.complete(text))
+            self.assertEqual(index.search(text), rebuilt_index.search(text))
+
+
+if __name__ == "__main__":
+    unittest.main()
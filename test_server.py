@@ -0,0 +1,156 @@
+"""
+Unit tests for server.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from unittest.case import TestCase
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import db
+import metrics
+import server
+
+
+class TestTrackerServer(TestCase):
+    """
+    Test the HTTP/JSON endpoints
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.orm = db.CalorieCounterORM(os.path.join(self.tmp_dir.name, "test.db"))
+        self.server = server.TrackerServer(("127.0.0.1", 0), self.orm)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.orm.close()
+        self.tmp_dir.cleanup()
+
+    def request(self, path, data=None):
+        body = None if data is None else json.dumps(data).encode()
+        with urlopen(Request(self.url + path, data=body)) as response:
+            return response.status, json.loads(response.read())
+
+    def test_stats(self):
+        with self.assertRaises(HTTPError) as context:
+            self.request("/stats")
+        self.assertEqual(context.exception.code, 404)
+
+        self.orm.metrics = metrics.Metrics()
+        self.request("/foods?food_name=broccoli")
+        status, data = self.request("/stats")
+        self.assertEqual(status, 200)
+        self.assertEqual(data["operations"]["get_rows_from_table"]["calls"], 1)
+
+    def test_foods_and_entries(self):
+        self.assertEqual(
+            self.request("/foods", {"food_name": "broccoli", "calories": 30}),
+            (201, {"food_name": "broccoli", "portion_type": "", "calories": 30}),
+        )
+        self.request("/foods", {"food_name": "bread", "portion_type": "slice"})
+        status, foods = self.request("/foods?food_name=br&match=prefix")
+        self.assertEqual(status, 200)
+        self.assertEqual(len(foods), 2)
+
+        self.request(
+            "/entries",
+            [
+                {"food_name": "broccoli", "date": "2020-05-15", "servings": 2},
+                {"food_name": "broccoli", "date": "2020-05-16"},
+            ],
+        )
+        self.request("/entries", {"food_name": "broccoli", "date": "2020-05-16"})
+        self.assertEqual(
+            self.request("/entries?start=2020-05-01&end=2020-05-31")[1],
+            [
+                {"date": "2020-05-15", "food_name": "broccoli", "portion_type": "",
+                 "servings": 2},
+                {"date": "2020-05-16", "food_name": "broccoli", "portion_type": "",
+                 "servings": 2},
+            ],
+        )
+        self.assertEqual(
+            self.request("/summary?start=2020-05-01&end=2020-05-31")[1],
+            [
+                {"date": "2020-05-15", "calories": 60},
+                {"date": "2020-05-16", "calories": 60},
+            ],
+        )
+
+    def test_concurrent_entries(self):
+        def post_entries():
+            for _ in range(10):
+                self.request("/entries", {"food_name": "tea", "date": "2020-05-15"})
+
+        threads = [threading.Thread(target=post_entries) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        entries = self.request("/entries?start=2020-05-15&end=2020-05-15")[1]
+        self.assertEqual(entries[0]["servings"], 40)
+
+    def test_errors(self):
+        with self.assertRaises(HTTPError) as context:
+            self.request("/unknown")
+        self.assertEqual(context.exception.code, 404)
+        with self.assertRaises(HTTPError) as context:
+            self.request("/entries", {"date": "2020-05-15"})
+        self.assertEqual(context.exception.code, 400)
+        with self.assertRaises(HTTPError) as context:
+            self.request("/summary?start=not-a-date")
+        self.assertEqual(context.exception.code, 400)
+
+    def test_invalid_bodies_are_rejected(self):
+        for path, data in [
+            ("/foods", {"food_name": "broccoli", "calories": "lots"}),
+            ("/foods", {"food_name": "toast", "ingredients": [["bread", "", 0]]}),
+            ("/foods", ["broccoli"]),
+            ("/entries", {"food_name": "broccoli", "servings": -5}),
+            ("/entries", {"food_name": "broccoli", "date": "yesterweek"}),
+            ("/entries", [{"food_name": "broccoli"}, "tea"]),
+        ]:
+            with self.subTest(path=path, data=data):
+                with self.assertRaises(HTTPError) as context:
+                    self.request(path, data)
+                self.assertEqual(context.exception.code, 400)
+
+        self.assertEqual(self.request("/foods")[1], [])
+        self.assertEqual(self.request("/entries")[1], [])
+
+    def test_existing_food_is_a_conflict(self):
+        self.request("/foods", {"food_name": "broccoli", "calories": 30})
+        with self.assertRaises(HTTPError) as context:
+            self.request("/foods", {"food_name": "broccoli", "calories": 50})
+        self.assertEqual(context.exception.code, 409)
+        self.assertEqual(self.request("/foods")[1][0]["calories"], 30)
+
+    def test_server_errors(self):
+        error = sqlite3.OperationalError("database is locked")
+        with mock.patch.object(self.orm, "daily_totals", side_effect=error):
+            with self.assertLogs(level="ERROR"):
+                with self.assertRaises(HTTPError) as context:
+                    self.request("/summary")
+        self.assertEqual(context.exception.code, 500)
+        self.assertEqual(
+            json.loads(context.exception.read()), {"error": "Internal server error"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Unit tests for shell.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.case import TestCase
+
+import db
+import main
+import shell
+
+
+class TestTrackerShell(TestCase):
+    """
+    Test the interactive shell
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.db_path = os.path.join(self.tmp_dir.name, "test.db")
+        self.orm = db.CalorieCounterORM(
+            self.db_path, group_commit=True, group_commit_interval=shell.COMMIT_INTERVAL
+        )
+        self.orm.add_row_to_table(
+            "foods", db.QueryData(food_name="bread", portion_type="slice", calories=80)
+        )
+        self.orm.flush()
+        self.output = io.StringIO()
+        self.shell = shell.TrackerShell(
+            self.orm,
+            {"food": main.add_food, "entry": main.add_entry, "summary": main.show_summary},
+            stdin=io.StringIO(),
+            stdout=self.output,
+        )
+
+    def tearDown(self):
+        self.orm.close()
+        self.tmp_dir.cleanup()
+
+    def run_commands(self, *lines):
+        with redirect_stdout(self.output), redirect_stderr(io.StringIO()):
+            for line in lines:
+                self.shell.onecmd(line)
+
+        return self.output.getvalue()
+
+    def test_session_writes_are_committed_together(self):
+        batch_count = self.orm.batch_writer.batch_count
+        self.run_commands(
+            "food broccoli 30 --type head",
+            *(f"entry bread --type slice --date 0{day}052020" for day in range(1, 10)),
+            *(f"entry broccoli --type head --date 1{day}052020" for day in range(10)),
+        )
+        self.assertEqual(self.orm.batch_writer.batch_count, batch_count)
+
+        self.run_commands("commit")
+        self.assertEqual(self.orm.batch_writer.batch_count, batch_count + 1)
+        with db.CalorieCounterORM(self.db_path) as orm:
+            self.assertEqual(len(orm.get_rows_from_table("record")), 19)
+
+    def test_summary_sees_session_writes(self):
+        output = self.run_commands(
+            "entry bread --type slice --servings 2 --date 01052020",
+            "summary --start 01052020 --end 01052020",
+        )
+        self.assertIn("2020-05-01: 160 calories", output)
+
+    def test_invalid_commands_keep_the_shell_running(self):
+        output = self.run_commands("entry", 'entry "bread', "serve", "nonsense")
+        self.assertIn("No closing quotation", output)
+        self.assertIn("serve is not available in the shell", output)
+        self.assertFalse(self.shell.onecmd("summary"))
+        self.assertTrue(self.shell.onecmd("quit"))
+
+    def test_global_options_are_rejected(self):
+        output = self.run_commands(
+            "--user bob entry bread --type slice --date 01052020",
+            "--profile summary",
+        )
+        self.assertIn("--user can only be given when starting the shell", output)
+        self.assertIn("--profile can only be given when starting the shell", output)
+
+        self.orm.flush()
+        self.assertEqual(self.orm.get_rows_from_table("record"), [])
+
+    def test_ingredients(self):
+        self.run_commands("food toast 0 --ingredient bread slice two")
+        self.orm.flush()
+        self.assertIsNone(self.orm.get_food("toast"))
+
+        self.run_commands(
+            "food toast 0 --ingredient bread slice 2", "food tea 0", "food water 0"
+        )
+        self.orm.flush()
+        self.assertEqual(self.orm.get_food_calories("toast"), 160)
+        self.assertEqual(self.orm.get_food_ingredients("tea"), [])
+
+    def test_completion(self):
+        self.run_commands("food broccoli 30 --type head", "food brownie 400")
+        self.assertEqual(
+            self.shell.completedefault("br", "entry br", 6, 8),
+            ["bread", "broccoli", "brownie"],
+        )
+        self.assertEqual(
+            self.shell.completedefault("bro", "entry bro", 6, 9), ["broccoli", "brownie"]
+        )
+        self.assertEqual(
+            self.shell.completedefault("", "entry bread --type ", 19, 19), []
+        )
+        self.assertEqual(self.shell.completenames("e"), ["entry"])
+
+
+if __name__ == "__main__":
+    unittest.main()
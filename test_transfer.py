@@ -0,0 +1,150 @@
+"""
+Unit tests for transfer.py
+"""
+
+# pylint: disable=missing-function-docstring
+
+import io
+import os
+import tempfile
+import unittest
+from unittest.case import TestCase
+
+import db
+import transfer
+
+
+class TestTransfer(TestCase):
+    """
+    Test importing and exporting tables
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.orm = db.CalorieCounterORM(os.path.join(self.tmp_dir.name, "test.db"))
+
+    def tearDown(self):
+        self.orm.close()
+        self.tmp_dir.cleanup()
+
+    def test_get_file_format(self):
+        self.assertEqual(transfer.get_file_format("foods.CSV"), "csv")
+        self.assertEqual(transfer.get_file_format("record.ndjson"), "jsonl")
+        self.assertEqual(transfer.get_file_format("foods.txt", "csv"), "csv")
+        with self.assertRaises(ValueError):
+            transfer.get_file_format("foods.txt")
+
+    def test_import_csv(self):
+        file = io.StringIO(
+            "food_name,portion_type,calories\n"
+            "bread,slice,80\n"
+            "apple,,95\n"
+            ",cup,10\n"
+            "soup,bowl,a lot\n"
+        )
+        with self.assertLogs(level="WARNING"):
+            imported, skipped = transfer.import_rows(self.orm, "foods", file, "csv")
+
+        self.assertEqual((imported, skipped), (2, 2))
+        self.assertEqual(
+            sorted(
+                (row.food_name, row.portion_type, row.calories)
+                for row in self.orm.iter_rows("foods")
+            ),
+            [("apple", "", 95), ("bread", "slice", 80)],
+        )
+
+    def test_import_jsonl(self):
+        self.orm.add_row_to_table(
+            "foods", db.QueryData(food_name="bread", portion_type="slice", calories=80)
+        )
+        file = io.StringIO(
+            '{"date": "2020-05-15", "food_name": "bread", "portion_type": "slice", '
+            '"servings": 2}\n'
+            "\n"
+            "not json\n"
+            '{"date": "2020-05-16", "food_name": "bread", "portion_type": "slice"}\n'
+            '{"date": "2020-05-17", "food_name": "bread", "servings": 0}\n'
+        )
+        with self.assertLogs(level="WARNING"):
+            imported, skipped = transfer.import_rows(self.orm, "record", file, "jsonl")
+
+        self.assertEqual((imported, skipped), (2, 2))
+        self.assertEqual(
+            [(row.date.isoformat(), row.servings) for row in self.orm.iter_rows("record")],
+            [("2020-05-15", 2), ("2020-05-16", 1)],
+        )
+
+    def test_import_chunks(self):
+        file = io.StringIO(
+            "food_name,calories\n" + "".join(f"food {i},{i}\n" for i in range(25))
+        )
+        progress = []
+        imported, skipped = transfer.import_rows(
+            self.orm, "foods", file, "csv", chunk_size=10, progress=progress.append
+        )
+
+        self.assertEqual((imported, skipped), (25, 0))
+        self.assertEqual(progress, [10, 20, 25])
+        self.assertEqual(len(list(self.orm.iter_rows("foods"))), 25)
+
+    def test_round_trip(self):
+        self.orm.add_rows_to_table(
+            "foods",
+            [
+                db.QueryData(food_name="bread", portion_type="slice", calories=80),
+                db.QueryData(food_name='oat "milk", sweet', calories=50),
+            ],
+        )
+        self.orm.add_rows_to_table(
+            "record",
+            [
+                db.QueryData(
+                    date="2020-05-15", food_name="bread", portion_type="slice", servings=2
+                ),
+                db.QueryData(date="2020-05-16", food_name='oat "milk", sweet'),
+            ],
+        )
+
+        for file_format in ("csv", "jsonl"):
+            with self.subTest(file_format=file_format):
+                exported = {}
+                for table_name in ("foods", "record"):
+                    file = io.StringIO()
+                    count = transfer.export_rows(self.orm, table_name, file, file_format)
+                    self.assertEqual(count, 2)
+                    exported[table_name] = file.getvalue()
+
+                with db.CalorieCounterORM(
+                    os.path.join(self.tmp_dir.name, f"{file_format}.db")
+                ) as orm:
+                    for table_name in ("foods", "record"):
+                        file = io.StringIO(exported[table_name])
+                        self.assertEqual(
+                            transfer.import_rows(orm, table_name, file, file_format),
+                            (2, 0),
+                        )
+                        self.assertEqual(
+                            get_values(orm, table_name),
+                            get_values(self.orm, table_name),
+                        )
+
+    def test_invalid_table(self):
+        with self.assertRaises(ValueError):
+            transfer.import_rows(self.orm, "daily_summary", io.StringIO(), "csv")
+        with self.assertRaises(ValueError):
+            transfer.export_rows(self.orm, "daily_summary", io.StringIO(), "csv")
+
+
+def get_values(orm, table_name):
+    """
+    Returns the sorted exported column values of all rows of a table.
+    """
+    return sorted(
+        tuple(getattr(row, column) for column in transfer.COLUMNS[table_name])
+        for row in orm.iter_rows(table_name)
+    )
+
+
+if __name__ == "__main__":
+    unittest.main()
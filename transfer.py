@@ -0,0 +1,247 @@
+"""
+Streaming import and export of the foods and record tables as CSV or JSON Lines.
+"""
+
+import csv
+import json
+import logging
+import os
+
+import dates
+import db
+
+# rows parsed and written per transaction while importing
+IMPORT_CHUNK_SIZE = 10000
+
+# columns of each table in the order they are exported
+COLUMNS = {
+    "foods": ("food_name", "portion_type", "calories"),
+    "record": ("date", "food_name", "portion_type", "servings"),
+}
+
+FILE_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+}
+
+
+def get_file_format(path, file_format=None):
+    """
+    Returns file_format if given, otherwise the format matching the extension of
+    path.
+    """
+    if file_format:
+        return file_format
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FILE_FORMATS:
+        raise ValueError(f"Cannot tell the format of {path}, please give one")
+
+    return FILE_FORMATS[extension]
+
+
+def read_rows(file, file_format):
+    """
+    Yields (line_number, row) tuples for every row of file. Rows of CSV files are
+    dictionaries of column names to values, so CSV files need a header naming their
+    columns. Rows of JSON Lines files are the lines themselves, decoded by
+    parse_row() so that a broken line only skips that row.
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+
+    elif file_format == "jsonl":
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                yield line_number, line
+
+    else:
+        raise ValueError(f"Invalid file format {file_format}")
+
+
+def parse_integer(value, name):
+    """
+    Returns value, a string or number, as an integer or None if it is empty.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{name} must be a whole number, not {value}")
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a whole number, not {value!r}") from None
+
+
+def decode_row(row):
+    """
+    Returns a row read by read_rows() as a dictionary of column names to values.
+    Raises ValueError if it is not one.
+    """
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError("row is not an object")
+
+    return row
+
+
+def parse_row(table_name, row):
+    """
+    Validates a row decoded by decode_row() and returns it as a QueryData instance.
+    Raises ValueError if the row is invalid.
+    """
+    food_name = row.get("food_name")
+    if not food_name or not isinstance(food_name, str):
+        raise ValueError("food_name is missing")
+    portion_type = row.get("portion_type") or ""
+    if not isinstance(portion_type, str):
+        raise ValueError("portion_type must be a string")
+
+    if table_name == "foods":
+        return db.QueryData(
+            food_name=food_name,
+            portion_type=portion_type,
+            calories=parse_integer(row.get("calories"), "calories"),
+        )
+
+    servings = parse_integer(row.get("servings"), "servings")
+    if servings is not None and servings < 1:
+        raise ValueError(f"servings must be positive, not {servings}")
+    if not row.get("date"):
+        raise ValueError("date is missing")
+    try:
+        return db.QueryData(
+            date=row["date"],
+            food_name=food_name,
+            portion_type=portion_type,
+            servings=servings,
+        )
+    except Exception as e:  # pylint: disable=broad-except
+        raise ValueError(f"invalid date {row['date']!r}: {e}") from None
+
+
+def import_rows(
+    orm, table_name, file, file_format, chunk_size=IMPORT_CHUNK_SIZE, progress=None
+):
+    """
+    Adds the rows of file, in CSV or JSON Lines file_format, to the given table in
+    the same way as CalorieCounterORM.add_rows_to_table().
+
+    Rows are read, validated and written chunk_size rows at a time, each chunk in
+    its own transaction with a single executemany(), so memory use does not depend
+    on the size of the file. Invalid rows are logged and skipped. progress, if
+    given, is called with the number of rows imported so far after every chunk.
+
+    Returns a tuple of the number of imported and skipped rows.
+    """
+    if table_name not in COLUMNS:
+        raise ValueError(f"Invalid table name {table_name}")
+
+    logging.info("Importing %s rows into %s table", file_format, table_name)
+    imported = skipped = 0
+    lines = []
+    for line in read_rows(file, file_format):
+        lines.append(line)
+        if len(lines) < chunk_size:
+            continue
+
+        chunk, chunk_skipped = parse_rows(table_name, lines)
+        lines = []
+        skipped += chunk_skipped
+        if chunk:
+            orm.add_rows_to_table(table_name, chunk)
+            imported += len(chunk)
+            if progress:
+                progress(imported)
+
+    chunk, chunk_skipped = parse_rows(table_name, lines)
+    skipped += chunk_skipped
+    if chunk:
+        orm.add_rows_to_table(table_name, chunk)
+        imported += len(chunk)
+        if progress:
+            progress(imported)
+
+    return imported, skipped
+
+
+def parse_rows(table_name, lines):
+    """
+    Validates a chunk of (line_number, row) tuples read by read_rows(). Returns a
+    list of QueryData instances of the valid rows and the number of invalid rows,
+    which are logged and skipped. The dates of the whole chunk are converted at once
+    by dates.parse_dates(), so repeated dates are only parsed once.
+    """
+    skipped = 0
+    rows = []
+    for line_number, row in lines:
+        try:
+            rows.append((line_number, decode_row(row)))
+        except ValueError as e:
+            logging.warning("Skipping line %s: %s", line_number, e)
+            skipped += 1
+
+    if table_name == "record":
+        column = dates.parse_dates([row.get("date") for _, row in rows])
+        for (_, row), date in zip(rows, column):
+            # invalid dates are left to parse_row() to report
+            if date is not None:
+                row["date"] = date
+
+    parsed_rows = []
+    for line_number, row in rows:
+        try:
+            parsed_rows.append(parse_row(table_name, row))
+        except ValueError as e:
+            logging.warning("Skipping line %s: %s", line_number, e)
+            skipped += 1
+
+    return parsed_rows, skipped
+
+
+def export_rows(orm, table_name, file, file_format, progress=None):
+    """
+    Writes all rows of the given table to file in CSV or JSON Lines file_format.
+
+    Rows are streamed from the database with CalorieCounterORM.iter_rows(), so
+    memory use does not depend on the size of the table. progress, if given, is
+    called with the number of rows exported so far after every ITER_BATCH_SIZE
+    rows and at the end.
+
+    Returns the number of exported rows.
+    """
+    if table_name not in COLUMNS:
+        raise ValueError(f"Invalid table name {table_name}")
+    if file_format not in ("csv", "jsonl"):
+        raise ValueError(f"Invalid file format {file_format}")
+
+    logging.info("Exporting %s table as %s", table_name, file_format)
+    columns = COLUMNS[table_name]
+    if file_format == "csv":
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(columns)
+
+    exported = 0
+    for row in orm.iter_rows(table_name):
+        values = [getattr(row, column) for column in columns]
+        if table_name == "record":
+            values[0] = values[0].isoformat()
+
+        if file_format == "csv":
+            writer.writerow(values)
+        else:
+            file.write(json.dumps(dict(zip(columns, values))) + "\n")
+
+        exported += 1
+        if progress and exported % db.ITER_BATCH_SIZE == 0:
+            progress(exported)
+
+    if progress:
+        progress(exported)
+
+    return exported